@@ -0,0 +1,75 @@
+"""Поля ресурсов API.
+
+У каждого ресурса словарь «имя поля в ответе -> путь для values()».
+Параметр fields= выбирает подмножество полей, и в SELECT попадают только
+их столбцы; связанные объекты (автор, группа) присоединяются JOIN тем же
+запросом и только тогда, когда их поле запрошено.
+"""
+from django.core.files.storage import default_storage
+
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comment_count': 'comment_count',
+}
+GROUP_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+PROFILE_FIELDS = {
+    'username': 'username',
+    'full_name': 'full_name',
+    'posts_count': 'posts_count',
+    'followers_count': 'followers_count',
+    'following_count': 'following_count',
+    'comments_count': 'comments_count',
+}
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+# Значения, которые отдаются не так, как хранятся
+CONVERTERS = {
+    'image': _media_url,
+}
+
+
+class FieldError(Exception):
+    pass
+
+
+def parse_fields(value, resource):
+    """Имена полей из параметра fields=; без него — все поля."""
+    if not value:
+        return list(resource)
+    names = list(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in resource]
+    if unknown:
+        raise FieldError('Неизвестные поля: {}'.format(', '.join(unknown)))
+    return names
+
+
+def serialize(row, names, resource):
+    """Словарь из values() в ответ API с полями names."""
+    result = {}
+    for name in names:
+        value = row[resource[name]]
+        convert = CONVERTERS.get(name)
+        result[name] = convert(value) if convert else value
+    return result
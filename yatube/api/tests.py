@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='auth', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test-slug', description='Описание')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.user, group=cls.group)
+            for i in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get(self, name, kwargs=None, **params):
+        response = self.client.get(reverse(name, kwargs=kwargs), params)
+        return response, response.json()
+
+    def test_posts_newest_first(self):
+        response, data = self.get('api:post_list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [post.pk for post in reversed(self.posts)])
+        self.assertEqual(data['results'][0]['author'], 'auth')
+        self.assertEqual(data['results'][0]['group'], 'test-slug')
+
+    def test_sparse_fields_select_only_their_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, data = self.get('api:post_list', fields='id,text')
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        select = [query['sql'] for query in queries.captured_queries
+                  if 'FROM "posts_post"' in query['sql']][-1]
+        self.assertNotIn('"image"', select)
+        # Автор не запрошен — нет и JOIN с пользователями
+        self.assertNotIn('auth_user', select)
+
+    def test_unknown_field_is_rejected(self):
+        response, data = self.get('api:post_list', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', data['error'])
+
+    def test_cursor_pagination(self):
+        _, first = self.get('api:post_list', limit=2, fields='id')
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [post['id'] for post in second['results']],
+            [self.posts[2].pk, self.posts[1].pk])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_detail_endpoints(self):
+        _, post = self.get(
+            'api:post_detail', {'post_id': self.posts[0].pk},
+            fields='text,comment_count')
+        self.assertEqual(post, {'text': 'Пост 0', 'comment_count': 1})
+        _, profile = self.get('api:profile', {'username': 'auth'})
+        self.assertEqual(profile['full_name'], 'Лев Толстой')
+        self.assertEqual(profile['posts_count'], 5)
+        self.assertEqual(profile['followers_count'], 1)
+        _, groups = self.get('api:group_list')
+        self.assertEqual(groups['results'][0]['slug'], 'test-slug')
+
+    def test_nested_lists(self):
+        _, comments = self.get(
+            'api:comment_list', {'post_id': self.posts[0].pk})
+        self.assertEqual(comments['results'][0]['author'], 'reader')
+        _, group_posts = self.get('api:group_posts', {'slug': 'test-slug'})
+        self.assertEqual(len(group_posts['results']), 5)
+        _, profile_posts = self.get(
+            'api:profile_posts', {'username': 'reader'})
+        self.assertEqual(profile_posts['results'], [])
+
+    def test_missing_objects_are_json_404(self):
+        for name, kwargs in (
+            ('api:post_detail', {'post_id': 0}),
+            ('api:comment_list', {'post_id': 0}),
+            ('api:group_posts', {'slug': 'missing'}),
+            ('api:profile', {'username': 'missing'}),
+        ):
+            with self.subTest(name=name):
+                response, data = self.get(name, kwargs)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', data)
+
+    def test_feed(self):
+        response, _ = self.get('api:feed')
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(self.reader)
+        _, data = self.get('api:feed', limit=3, fields='id')
+        self.assertEqual(
+            data['results'],
+            [{'id': post.pk} for post in self.posts[:1:-1]])
+        rest = self.client.get(data['next']).json()
+        self.assertEqual(len(rest['results']), 2)
+
+    def test_responses_are_cached_until_data_changes(self):
+        self.get('api:post_list')
+        with self.assertNumQueries(0):
+            self.get('api:post_list')
+        Post.objects.create(text='Новый', author=self.user)
+        _, data = self.get('api:post_list', fields='text')
+        self.assertEqual(data['results'][0]['text'], 'Новый')
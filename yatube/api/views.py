@@ -0,0 +1,188 @@
+"""JSON API только для чтения.
+
+Ответы строятся из values(), без создания моделей и шаблонов, листаются
+курсором (CursorPaginator) и кэшируются cache_versioned с теми же
+областями, что и HTML-страницы: ключ кэша включает весь адрес с
+параметрами fields=, limit= и cursor=.
+"""
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+
+from api.resources import (
+    COMMENT_FIELDS, GROUP_FIELDS, POST_FIELDS, PROFILE_FIELDS, FieldError,
+    parse_fields, serialize,
+)
+from core.caching import cache_versioned
+from core.paginator import CursorPaginator
+from core.routers import same_database
+from posts.caching import (
+    cached_group, comments_scopes, detail_scopes, group_scopes,
+    groups_scopes, index_scopes, profile_scopes,
+)
+from posts.feed import FEED_ORDERING, feed_posts
+from posts.models import Comment, Group, Post, User
+from posts.stats import stats_for
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+POST_ORDERING = ('-pub_date', '-id')
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder,
+        json_dumps_params={'ensure_ascii': False})
+
+
+def _error(message, status):
+    return _json({'error': message}, status=status)
+
+
+def api_view(view):
+    """Ошибки представления — ответом JSON, а не HTML-страницей."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except FieldError as error:
+            return _error(str(error), 400)
+        except Http404:
+            return _error('Не найдено', 404)
+    return wrapper
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return DEFAULT_LIMIT
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri('?' + query.urlencode())
+
+
+def _list(request, queryset, resource, ordering=POST_ORDERING,
+          prepare=None):
+    """Страница списка: запрошенные поля плюс ключ курсора.
+
+    prepare(rows) может дополнить строки страницы перед выдачей.
+    """
+    names = parse_fields(request.GET.get('fields'), resource)
+    keys = [name.lstrip('-') for name in ordering]
+    paths = dict.fromkeys([resource[name] for name in names] + keys)
+    paginator = CursorPaginator(
+        queryset.values(*paths), _limit(request), ordering=ordering)
+    page = paginator.get_cursor_page(request.GET.get('cursor'))
+    rows = list(page)
+    if prepare is not None:
+        prepare(rows)
+    return _json({
+        'results': [serialize(row, names, resource) for row in rows],
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+    })
+
+
+def _object(request, queryset, resource):
+    names = parse_fields(request.GET.get('fields'), resource)
+    row = queryset.values(*[resource[name] for name in names]).first()
+    if row is None:
+        raise Http404
+    return _json(serialize(row, names, resource))
+
+
+@api_view
+@cache_versioned(index_scopes)
+def post_list(request):
+    return _list(request, Post.objects.all(), POST_FIELDS)
+
+
+@api_view
+@cache_versioned(detail_scopes)
+def post_detail(request, post_id):
+    return _object(request, Post.objects.filter(pk=post_id), POST_FIELDS)
+
+
+@api_view
+@cache_versioned(comments_scopes)
+def comment_list(request, post_id):
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = Comment.objects.filter(post_id=post_id)
+    ordering = ('created', 'id')
+    if same_database(Comment, User):
+        return _list(request, comments, COMMENT_FIELDS, ordering=ordering)
+    # Пользователи в другой базе: JOIN нет, имена авторов страницы
+    # читаются одним запросом
+    return _list(
+        request, comments, dict(COMMENT_FIELDS, author='author_id'),
+        ordering=ordering, prepare=_usernames)
+
+
+def _usernames(rows):
+    if not rows or 'author_id' not in rows[0]:
+        return
+    names = dict(
+        User.objects.filter(pk__in={row['author_id'] for row in rows})
+        .values_list('pk', 'username'))
+    for row in rows:
+        row['author_id'] = names.get(row['author_id'])
+
+
+@api_view
+@cache_versioned(groups_scopes)
+def group_list(request):
+    return _list(
+        request, Group.objects.all(), GROUP_FIELDS, ordering=('id',))
+
+
+@api_view
+@cache_versioned(group_scopes)
+def group_posts(request, slug):
+    group = cached_group(slug)
+    return _list(request, Post.objects.filter(group=group), POST_FIELDS)
+
+
+@api_view
+@cache_versioned(profile_scopes)
+def profile(request, username):
+    names = parse_fields(request.GET.get('fields'), PROFILE_FIELDS)
+    user = get_object_or_404(
+        User.objects.only('username', 'first_name', 'last_name'),
+        username=username)
+    stats = stats_for(user)
+    row = {
+        'username': user.username,
+        'full_name': user.get_full_name(),
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+        'comments_count': stats.comments_count,
+    }
+    return _json(serialize(row, names, PROFILE_FIELDS))
+
+
+@api_view
+@cache_versioned(profile_scopes)
+def profile_posts(request, username):
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    return _list(request, Post.objects.filter(author=author), POST_FIELDS)
+
+
+@api_view
+def feed(request):
+    # Лента своя у каждого и собирается из чужих постов, поэтому одной
+    # области для сброса у неё нет и она не кэшируется
+    if not request.user.is_authenticated:
+        return _error('Нужна авторизация', 401)
+    return _list(
+        request, feed_posts(request.user), POST_FIELDS,
+        ordering=FEED_ORDERING)
@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from core.instrumentation import install_db_timing
+        from core.metrics import install_query_counter
+        from core.querystats import install_query_stats
+        from core.sqlite import configure_connection
+        # WAL и остальные настройки SQLite до любых запросов соединения
+        connection_created.connect(configure_connection)
+        # Замеры для Server-Timing: SQL каждого соединения (кэш замеряет
+        # посредник в CACHES)
+        connection_created.connect(install_db_timing)
+        # Статистика SQL по отпечаткам
+        connection_created.connect(install_query_stats)
+        # Метрики Prometheus: запросы на ответ
+        connection_created.connect(install_query_counter)
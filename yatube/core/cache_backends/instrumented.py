@@ -0,0 +1,101 @@
+"""Кэш-посредник с замерами: Server-Timing и метрики Prometheus.
+
+Оборачивает кэш, описанный в OPTIONS['CACHE'], и передаёт ему все
+вызовы. Время вызовов идёт в слой cache замеров core.instrumentation,
+чтения — в счётчик попаданий и промахов core.metrics с меткой
+LOCATION (псевдоним кэша). Сами классы кэшей не меняются, поэтому
+остальные пользователи того же класса замеров не получают.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.instrumented.InstrumentedCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'CACHE': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }},
+        },
+    }
+"""
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from core.instrumentation import timed
+from core.metrics import CACHE_REQUESTS
+
+MISSING = object()
+
+
+class InstrumentedCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        wrapped = dict(params['OPTIONS']['CACHE'])
+        backend = import_string(wrapped.pop('BACKEND'))
+        self._name = location
+        self._cache = backend(wrapped.pop('LOCATION', ''), wrapped)
+
+    def _count(self, result, amount=1):
+        if amount:
+            CACHE_REQUESTS.inc(amount, cache=self._name, result=result)
+
+    def get(self, key, default=None, version=None):
+        with timed('cache'):
+            value = self._cache.get(key, MISSING, version=version)
+        self._count('miss' if value is MISSING else 'hit')
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with timed('cache'):
+            found = self._cache.get_many(keys, version=version)
+        self._count('hit', len(found))
+        self._count('miss', len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.set_many(data, timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        with timed('cache'):
+            return self._cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        with timed('cache'):
+            return self._cache.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        with timed('cache'):
+            return self._cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        with timed('cache'):
+            return self._cache.decr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        with timed('cache'):
+            return self._cache.has_key(key, version=version)
+
+    def clear(self):
+        with timed('cache'):
+            return self._cache.clear()
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
+
+    def make_key(self, key, version=None):
+        return self._cache.make_key(key, version=version)
+
+    def validate_key(self, key):
+        return self._cache.validate_key(key)
@@ -0,0 +1,263 @@
+"""Двухуровневый кэш: маленький LRU в процессе перед общим хранилищем.
+
+L1 — словарь в памяти процесса, L2 — любой другой кэш из
+settings.CACHES (например, SharedMemoryCache). Django создаёт экземпляр
+бэкенда в каждом потоке, поэтому L1 хранится на уровне модуля (_layer)
+и общий для всех потоков процесса с тем же LOCATION. Значения лежат в
+L1 в виде pickle и при каждом чтении восстанавливаются заново: ответ,
+который middleware поменяет после выдачи, не меняет копию в кэше.
+
+Чтение сначала идёт в L1, промах — в L2. Каждая запись и удаление
+увеличивают общий счётчик поколений в L2 и кладут ключ с номером
+поколения в кольцевой журнал: это две дополнительные записи в L2 (incr
+и set; при пустом счётчике ещё add). Раз в SYNC_INTERVAL секунд процесс
+сверяет счётчик и выбрасывает из своего L1 ключи, изменённые другими
+процессами. Если за SYNC_INTERVAL записей было больше JOURNAL_SIZE,
+журнал успевает перезаписаться, и L1 очищается целиком; так же, если
+ячейка журнала ещё не записана. Сколько раз это случилось,
+показывает get_stats() (full_clear), число записей в журнал —
+published. Так чужое удаление доходит до всех процессов не позже чем
+через SYNC_INTERVAL.
+
+    CACHES = {
+        'shared': {...},
+        'default': {
+            'BACKEND': 'core.cache_backends.layered.LayeredCache',
+            'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 500},
+        },
+    }
+"""
+import pickle
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+GENERATION_KEY = 'layered:generation'
+JOURNAL_KEY = 'layered:journal:{}'
+MISSING = object()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event, number=1):
+    with _stats_lock:
+        _stats[event] += number
+
+
+def get_stats():
+    """Счётчики L1 этого процесса.
+
+    l1_hit/l2_hit — откуда взято значение, published — записи в журнал,
+    full_clear — сколько раз L1 очищался целиком (первая сверка,
+    очищенный L2, переполненный или потерянный журнал).
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+class _Layer:
+    """L1 и состояние сверки, общие для потоков процесса."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.synced_at = 0.0
+
+
+_layers = {}
+_layers_lock = threading.Lock()
+
+
+def _layer(name):
+    with _layers_lock:
+        return _layers.setdefault(name, _Layer())
+
+
+class LayeredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', location)
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 500))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 0.5))
+        self._journal_size = int(options.get('JOURNAL_SIZE', 1024))
+        self._layer = _layer((location, self._l2_alias))
+        self._l1 = self._layer.entries
+        self._lock = self._layer.lock
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # L1
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return MISSING
+            data, expires = entry
+            if expires <= time.monotonic():
+                del self._l1[key]
+                return MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(data)
+
+    def _l1_set(self, key, value, timeout):
+        # В L1 значение живёт не дольше своего срока и L1_TIMEOUT
+        ttl = self._l1_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout - time.time())
+        if ttl <= 0:
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[key] = (data, time.monotonic() + ttl)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    # Поколения
+
+    def _sync(self):
+        """Выбросить из L1 ключи, изменённые другими процессами."""
+        layer = self._layer
+        now = time.monotonic()
+        if now - layer.synced_at < self._sync_interval:
+            return
+        layer.synced_at = now
+        generation = self.l2.get(GENERATION_KEY, 0)
+        previous, layer.generation = layer.generation, generation
+        if generation == previous:
+            return
+        if previous is None or generation < previous or (
+                generation - previous > self._journal_size):
+            # Первая сверка, очищенный L2 или переполненный журнал
+            self._clear_l1()
+            return
+        slots = {
+            JOURNAL_KEY.format(number % self._journal_size): number
+            for number in range(previous + 1, generation + 1)
+        }
+        journal = self.l2.get_many(list(slots))
+        changed = []
+        for slot, number in slots.items():
+            entry = journal.get(slot)
+            if entry is None or entry[0] != number:
+                # Запись потеряна или ещё не сделана: другой процесс
+                # увеличил счётчик, но не успел записать ключ, и в ячейке
+                # лежит ключ старого круга. Надёжнее очистить всё
+                self._clear_l1()
+                return
+            changed.append(entry[1])
+        self._l1_discard(changed)
+
+    def _clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+        _count('full_clear')
+
+    def _publish(self, key):
+        """Сообщить остальным процессам об изменении ключа."""
+        l2 = self.l2
+        try:
+            generation = l2.incr(GENERATION_KEY)
+        except ValueError:
+            # Счётчик начинается со случайного числа: после очистки L2
+            # новая нумерация не совпадёт со старой и процессы очистят L1
+            # целиком
+            l2.add(GENERATION_KEY, random.randrange(1 << 48), None)
+            generation = l2.incr(GENERATION_KEY)
+        # Номер поколения в ячейке отличает её от записи прошлого круга
+        l2.set(JOURNAL_KEY.format(generation % self._journal_size),
+               (generation, key), None)
+        _count('published')
+        layer = self._layer
+        if layer.generation is not None and (
+                generation == layer.generation + 1):
+            # Своё изменение уже учтено в L1
+            layer.generation = generation
+
+    # Интерфейс кэша Django
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._sync()
+        value = self._l1_get(key)
+        if value is not MISSING:
+            _count('l1_hit')
+            return value
+        value = self.l2.get(key, MISSING, version=None)
+        if value is MISSING:
+            return default
+        _count('l2_hit')
+        # Срок жизни в L2 неизвестен, поэтому держим только L1_TIMEOUT
+        self._l1_set(key, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self.get_backend_timeout(timeout)
+        self.l2.set(key, value, self._relative(timeout))
+        self._publish(key)
+        self._l1_set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self.get_backend_timeout(timeout)
+        if not self.l2.add(key, value, self._relative(timeout)):
+            return False
+        self._publish(key)
+        self._l1_set(key, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        return self.l2.touch(key, self._relative(timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._l1_discard([key])
+        self.l2.delete(key)
+        self._publish(key)
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчики живут только в L2, где incr атомарен
+        key = self.make_key(key, version=version)
+        self._l1_discard([key])
+        value = self.l2.incr(key, delta)
+        self._publish(key)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
+        self._layer.generation = None
+
+    @staticmethod
+    def _relative(timeout):
+        """Абсолютный срок из get_backend_timeout обратно в секунды."""
+        if timeout is None:
+            return None
+        return max(timeout - time.time(), 0) or -1
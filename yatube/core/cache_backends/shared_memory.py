@@ -0,0 +1,342 @@
+"""Кэш в разделяемой памяти для всех процессов сервера на одной машине.
+
+Записи лежат в файле, отображённом в память (mmap), поэтому их видят
+все WSGI-процессы, а удаление в одном процессе сразу действует в
+остальных. Файл устроен как множественно-ассоциативный кэш: ключ по
+хэшу попадает в один из наборов по WAYS ячеек фиксированного размера,
+а при нехватке места вытесняется давно не читанная ячейка набора
+(LRU внутри набора). Каждый набор защищён своей блокировкой файла
+(fcntl), так что процессы, работающие с разными наборами, не мешают
+друг другу.
+
+Django создаёт экземпляр бэкенда в каждом потоке, а блокировки fcntl
+принадлежат процессу. Поэтому дескриптор, отображение и потоковые
+блокировки наборов одни на процесс и файл (_shared_file), их делят все
+экземпляры. Файл, размеченный с другими настройками, не переразмечается:
+его уже могут читать другие процессы.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.shared_memory.SharedMemoryCache',
+            'LOCATION': '/var/tmp/yatube-cache.mmap',
+            'OPTIONS': {'MAX_BYTES': 64 * 1024 * 1024},
+        }
+    }
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'YTCACHE1'
+# magic, число наборов, ячеек в наборе, размер данных ячейки
+HEADER = struct.Struct('<8sIII')
+HEADER_SIZE = 64
+# хэш ключа, срок жизни (0 — бессрочно), время чтения, длина, флаги
+SLOT = struct.Struct('<16sddIB3x')
+EMPTY_DIGEST = bytes(16)
+FLAG_COMPRESSED = 1
+# Значения длиннее этого сжимаем: отрендеренные страницы жмутся хорошо
+COMPRESS_MIN = 1024
+# Потоков одного процесса блокировка файла не разделяет, поэтому
+# наборы дополнительно защищены набором потоковых блокировок
+THREAD_LOCK_STRIPES = 64
+
+
+class _SharedFile:
+    """Отображение файла кэша и блокировки, общие для потоков процесса."""
+
+    def __init__(self, path, header, size):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                current = os.pread(fd, HEADER.size, 0)
+                if not current.strip(b'\0'):
+                    # Новый файл: размечаем
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, header, 0)
+                elif (current != header
+                        or os.fstat(fd).st_size != size):
+                    raise ImproperlyConfigured(
+                        f'Файл кэша {path} размечен с другими настройками: '
+                        f'укажите другой LOCATION или удалите файл, '
+                        f'когда его не использует ни один процесс')
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            self.map = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+        self.header = header
+        self.pid = os.getpid()
+        self.locks = [
+            threading.RLock() for _ in range(THREAD_LOCK_STRIPES)]
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def _shared_file(path, header, size):
+    path = os.path.realpath(path)
+    with _files_lock:
+        shared = _files.get(path)
+        if shared is not None and shared.pid != os.getpid():
+            # После fork: блокировки родителя могли остаться захваченными
+            # его потоками, а fcntl-блокировки у процесса свои
+            shared.close()
+            shared = None
+        if shared is None:
+            shared = _files[path] = _SharedFile(path, header, size)
+        elif shared.header != header:
+            raise ImproperlyConfigured(
+                f'Кэши с файлом {path} настроены по-разному')
+        return shared
+
+
+class SharedMemoryCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._slot_size = int(options.get('SLOT_SIZE', 64 * 1024))
+        self._ways = int(options.get('WAYS', 8))
+        max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self._slot_total = SLOT.size + self._slot_size
+        self._sets = max(1, max_bytes // (self._slot_total * self._ways))
+        self._set_size = self._slot_total * self._ways
+        self._file_size = HEADER_SIZE + self._sets * self._set_size
+        self._shared = None
+        self._fd = None
+        self._map = None
+        self._thread_locks = None
+
+    # Файл и блокировки
+
+    def _open(self):
+        shared = self._shared
+        if shared is not None and shared.pid == os.getpid():
+            return
+        shared = _shared_file(
+            self._path,
+            HEADER.pack(MAGIC, self._sets, self._ways, self._slot_size),
+            self._file_size)
+        self._fd, self._map = shared.fd, shared.map
+        self._thread_locks = shared.locks
+        self._shared = shared
+
+    def _set_offset(self, index):
+        return HEADER_SIZE + index * self._set_size
+
+    def _lock_set(self, index):
+        thread_lock = self._thread_locks[index % THREAD_LOCK_STRIPES]
+        thread_lock.acquire()
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._set_size,
+                    self._set_offset(index))
+        return thread_lock
+
+    def _unlock_set(self, index, thread_lock):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self._set_size,
+                    self._set_offset(index))
+        thread_lock.release()
+
+    def _locate(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        index = int.from_bytes(digest[:8], 'little') % self._sets
+        return digest, index
+
+    # Ячейки
+
+    def _slot_offset(self, index, way):
+        return self._set_offset(index) + way * self._slot_total
+
+    def _read_slot(self, offset):
+        return SLOT.unpack_from(self._map, offset)
+
+    def _find(self, index, digest, now):
+        """Номер живой ячейки с ключом; просроченную ячейку освобождает."""
+        for way in range(self._ways):
+            offset = self._slot_offset(index, way)
+            slot_digest, expires, _, _, _ = self._read_slot(offset)
+            if slot_digest != digest:
+                continue
+            if expires and expires <= now:
+                self._free(offset)
+                return None
+            return way
+        return None
+
+    def _victim(self, index, now):
+        """Свободная, просроченная или давно не читанная ячейка."""
+        oldest_way, oldest_atime = 0, None
+        for way in range(self._ways):
+            slot_digest, expires, atime, _, _ = self._read_slot(
+                self._slot_offset(index, way))
+            if slot_digest == EMPTY_DIGEST or (expires and expires <= now):
+                return way
+            if oldest_atime is None or atime < oldest_atime:
+                oldest_way, oldest_atime = way, atime
+        return oldest_way
+
+    def _free(self, offset):
+        SLOT.pack_into(self._map, offset, EMPTY_DIGEST, 0.0, 0.0, 0, 0)
+
+    def _load(self, offset):
+        _, _, _, length, flags = self._read_slot(offset)
+        start = offset + SLOT.size
+        data = self._map[start:start + length]
+        if flags & FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
+    def _encode(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        flags = 0
+        if len(data) > COMPRESS_MIN:
+            data, flags = zlib.compress(data, 1), FLAG_COMPRESSED
+        return data, flags
+
+    def _store(self, offset, digest, data, flags, expires, now):
+        start = offset + SLOT.size
+        self._map[start:start + len(data)] = data
+        SLOT.pack_into(self._map, offset, digest, expires or 0.0, now,
+                       len(data), flags)
+
+    def _write(self, key, value, timeout, version, only_new):
+        self._open()
+        data, flags = self._encode(value)
+        expires = self.get_backend_timeout(timeout)
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            now = time.time()
+            way = self._find(index, digest, now)
+            if way is not None and only_new:
+                return False
+            if len(data) > self._slot_size:
+                # Не помещается в ячейку: не храним и не оставляем старое
+                if way is not None:
+                    self._free(self._slot_offset(index, way))
+                return False
+            if way is None:
+                way = self._victim(index, now)
+            self._store(self._slot_offset(index, way), digest, data, flags,
+                        expires, now)
+            return True
+        finally:
+            self._unlock_set(index, lock)
+
+    # Интерфейс кэша Django
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(key, value, timeout, version, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(key, value, timeout, version, only_new=False)
+
+    def get(self, key, default=None, version=None):
+        self._open()
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            now = time.time()
+            way = self._find(index, digest, now)
+            if way is None:
+                return default
+            offset = self._slot_offset(index, way)
+            value = self._load(offset)
+            # Обновляем время чтения для вытеснения
+            slot = list(self._read_slot(offset))
+            slot[2] = now
+            SLOT.pack_into(self._map, offset, *slot)
+            return value
+        finally:
+            self._unlock_set(index, lock)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._open()
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            way = self._find(index, digest, time.time())
+            if way is None:
+                return False
+            offset = self._slot_offset(index, way)
+            slot = list(self._read_slot(offset))
+            slot[1] = self.get_backend_timeout(timeout) or 0.0
+            SLOT.pack_into(self._map, offset, *slot)
+            return True
+        finally:
+            self._unlock_set(index, lock)
+
+    def delete(self, key, version=None):
+        self._open()
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            way = self._find(index, digest, time.time())
+            if way is not None:
+                self._free(self._slot_offset(index, way))
+        finally:
+            self._unlock_set(index, lock)
+
+    def incr(self, key, delta=1, version=None):
+        self._open()
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            now = time.time()
+            way = self._find(index, digest, now)
+            if way is None:
+                raise ValueError("Key '%s' not found" % key)
+            offset = self._slot_offset(index, way)
+            value = self._load(offset) + delta
+            _, expires, _, _, _ = self._read_slot(offset)
+            data, flags = self._encode(value)
+            self._store(offset, digest, data, flags, expires, now)
+            return value
+        finally:
+            self._unlock_set(index, lock)
+
+    def has_key(self, key, version=None):
+        self._open()
+        digest, index = self._locate(key, version)
+        lock = self._lock_set(index)
+        try:
+            return self._find(index, digest, time.time()) is not None
+        finally:
+            self._unlock_set(index, lock)
+
+    def clear(self):
+        self._open()
+        for lock in self._thread_locks:
+            lock.acquire()
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            for index in range(self._sets):
+                for way in range(self._ways):
+                    self._free(self._slot_offset(index, way))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            for lock in self._thread_locks:
+                lock.release()
+
+    def close(self, **kwargs):
+        # Отображение общее для всех потоков и живёт, пока жив процесс
+        pass
@@ -0,0 +1,262 @@
+"""Кэширование страниц с версионными ключами.
+
+У каждой области данных («главная», «группа», «профиль», «пост») есть
+версия, которая хранится в кэше. Версии входят в ключ закэшированной
+страницы, поэтому изменение данных (bump) сразу делает старые страницы
+недостижимыми, и страницы можно хранить часами. Те же версии служат
+валидатором HTTP: ETag считается до рендеринга, и повторный запрос с
+If-None-Match получает 304 без запросов за постами. Last-Modified не
+отдаётся: у него точность в секунду, и изменение в ту же секунду
+осталось бы незамеченным для If-Modified-Since.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.cache import (
+    get_cache_key, get_conditional_response, has_vary_header,
+    learn_cache_key,
+)
+
+from core import replicas
+
+VERSION_KEY = 'version:{}'
+# Шаг опроса кэша процессами, которые ждут чужую перестройку страницы
+WAIT_STEP = 0.05
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def get_stats():
+    """Счётчики кэша страниц этого процесса.
+
+    not_modified — ответ 304 по валидаторам, hit — свежая копия, stale —
+    отдана устаревшая копия, пока другой процесс перестраивает страницу,
+    miss/regenerate — страница построена заново, coalesced — дождались
+    чужой перестройки, lock_timeout — не дождались и построили сами.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _cache():
+    return caches[settings.POSTS_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    # Слаги и имена бывают не-ASCII, а memcached принимает только ASCII
+    return VERSION_KEY.format(quote(scope, safe=':'))
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes, cache=None):
+    """Версии областей в том же порядке, что и scopes."""
+    cache = cache or _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Версию, потерянную кэшем, начинаем с текущего времени:
+            # она заведомо больше любой выданной раньше
+            cache.add(key, _now_ms(), None)
+            versions[key] = cache.get(key, _now_ms())
+    return [versions[key] for key in keys]
+
+
+def _bump_now(scopes):
+    cache = _cache()
+    keys = list(dict.fromkeys(_version_key(scope) for scope in scopes))
+    current = cache.get_many(keys)
+    now = _now_ms()
+    for key in keys:
+        if key not in current and cache.add(key, now, None):
+            continue
+        # incr атомарен: два сброса в одну миллисекунду дают разные
+        # версии. Гонка с чужим сбросом может увести версию вперёд
+        # текущего времени; тогда страницы области дольше читаются из
+        # основной базы (core.replicas), но версии не повторяются
+        try:
+            cache.incr(key, max(now - current.get(key, now), 1))
+        except ValueError:
+            # Версию вытеснили между чтением и incr
+            cache.add(key, now, None)
+
+
+def bump(*scopes, using=DEFAULT_DB_ALIAS):
+    """Отметить, что данные областей изменились.
+
+    Внутри транзакции базы using версии поднимаются сразу (страницы
+    этой же транзакции видят изменение) и ещё раз после фиксации:
+    страница, которую параллельный запрос построил по старым строкам
+    под промежуточной версией, становится недостижимой.
+    """
+    if transaction.get_connection(using).in_atomic_block:
+        _bump_now(scopes)
+    transaction.on_commit(lambda: _bump_now(scopes), using=using)
+
+
+def _viewer(request):
+    """Кто смотрит страницу: шапка и кнопки зависят от пользователя."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    return 'user{}'.format(user.pk)
+
+
+def _csrf(request):
+    """Метка CSRF-cookie запроса: формы страницы несут токен из неё.
+
+    После входа rotate_token выдаёт новую cookie, и страница с токеном
+    старой не должна отдаваться ни из кэша, ни ответом 304.
+    """
+    token = request.META.get('CSRF_COOKIE')
+    if not token:
+        return ''
+    return hashlib.md5(token.encode()).hexdigest()[:12]
+
+
+def _etag(key_prefix):
+    """Слабый ETag страницы: префикс ключа включает версии областей."""
+    digest = hashlib.md5(key_prefix.encode()).hexdigest()
+    return 'W/"{}"'.format(digest)
+
+
+def _set_etag(response, etag):
+    if response.status_code == 200:
+        response.setdefault('ETag', etag)
+    return response
+
+
+def _is_cacheable(request, response, csrf):
+    if response.streaming or response.status_code != 200:
+        return False
+    # Токен выдан для новой cookie, которую запрос ещё не прислал:
+    # такой страницы по ключу запроса быть не должно
+    if request.META.get('CSRF_COOKIE_USED') and (
+            not csrf or getattr(request, 'csrf_cookie_needs_reset', False)):
+        return False
+    if 'private' in response.get('Cache-Control', ()):
+        return False
+    # Как и CacheMiddleware, не кэшируем ответ, который выставляет
+    # cookie запросу без cookie: он зависел бы от этой cookie
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return True
+
+
+def _lock_key(request, key_prefix, cache_key):
+    # Пока список Vary-заголовков не выучен, ключа страницы ещё нет:
+    # тогда блокируем по адресу
+    source = cache_key or '{}:{}'.format(
+        key_prefix, request.build_absolute_uri())
+    return 'lock:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def _acquire(cache, lock_key):
+    return cache.add(lock_key, 1, settings.POSTS_CACHE_LOCK_TIMEOUT)
+
+
+def _release(cache, lock_key):
+    cache.delete(lock_key)
+
+
+def _wait_for_entry(request, key_prefix, cache):
+    """Подождать, пока страницу построит держатель блокировки."""
+    deadline = time.monotonic() + settings.POSTS_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+        entry = cache.get(cache_key) if cache_key else None
+        if entry is not None:
+            return entry
+    return None
+
+
+def _stale_or_wait(request, key_prefix, cache, entry):
+    """Копия страницы, пока её перестраивает другой процесс."""
+    if entry is not None:
+        _count('stale')
+        return entry
+    # Старой копии нет (новая версия или холодный кэш):
+    # ждём, пока страницу построит другой процесс
+    entry = _wait_for_entry(request, key_prefix, cache)
+    _count('coalesced' if entry is not None else 'lock_timeout')
+    return entry
+
+
+def cache_versioned(scopes, timeout=None):
+    """Замена cache_page, у которой ключ зависит от версий областей.
+
+    scopes(request, *args, **kwargs) возвращает список областей,
+    от которых зависит страница. Устаревшую страницу перестраивает
+    только один процесс, остальные тем временем отдают старую копию.
+    Копия хранится со своим ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cache = _cache()
+            page_timeout = (
+                settings.POSTS_CACHE_TIMEOUT if timeout is None else timeout)
+            versions = get_versions(scopes(request, *args, **kwargs), cache)
+            # Страницу новее данных реплики строит основная база
+            replicas.require_fresh(max(versions) / 1000)
+            # Пользователь и CSRF-cookie входят в ключ: Vary: Cookie
+            # middleware добавят уже после того, как ключ выучен
+            csrf = _csrf(request)
+            key_prefix = '{}.{}:{}:{}:{}'.format(
+                view.__module__, view.__name__, _viewer(request), csrf,
+                '.'.join(str(version) for version in versions))
+            etag = _etag(key_prefix)
+            conditional = get_conditional_response(request, etag=etag)
+            if conditional is not None:
+                # 304, а на несовпавший If-Match — 412
+                _count('not_modified')
+                conditional['ETag'] = etag
+                return conditional
+            cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+            entry = cache.get(cache_key) if cache_key else None
+            if entry is not None and entry[0] > time.time():
+                _count('hit')
+                return entry[1]
+            lock_key = _lock_key(request, key_prefix, cache_key)
+            if not _acquire(cache, lock_key):
+                entry = _stale_or_wait(request, key_prefix, cache, entry)
+                if entry is None:
+                    return _set_etag(
+                        view(request, *args, **kwargs), etag)
+                return entry[1]
+            _count('regenerate' if entry is not None else 'miss')
+            try:
+                response = _set_etag(
+                    view(request, *args, **kwargs), etag)
+                if _is_cacheable(request, response, csrf):
+                    keep = page_timeout + settings.POSTS_CACHE_STALE_TIMEOUT
+                    cache_key = learn_cache_key(
+                        request, response, keep, key_prefix, cache=cache)
+                    cache.set(
+                        cache_key, (time.time() + page_timeout, response),
+                        keep)
+            finally:
+                _release(cache, lock_key)
+            return response
+        return wrapper
+    return decorator
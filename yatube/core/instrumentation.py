@@ -0,0 +1,154 @@
+"""Замеры времени запроса по слоям: SQL, шаблоны, кэш и миниатюры.
+
+ServerTimingMiddleware для доли запросов SERVER_TIMING_SAMPLE_RATE
+включает сбор замеров в потоке запроса, а после ответа отдаёт итоги
+в заголовке Server-Timing и пишет их записью лога с полем timing.
+Замеры стоят в точках расширения:
+
+* SQL — обёртка execute, которую получает каждое новое соединение;
+* шаблоны — бэкенд DjangoTemplates из этого модуля;
+* миниатюры — бэкенд sorl-thumbnail из этого модуля и posts.images;
+* кэш — посредник core.cache_backends.instrumented в settings.CACHES.
+
+Вне выбранных запросов обёртки только проверяют, идёт ли сбор в
+потоке. Вложенные вызовы одного слоя (LayeredCache над другим кэшем)
+считаются один раз; время шаблона включает и запросы, которые
+выполнились при его рендеринге.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from sorl.thumbnail import base as thumbnail_base
+
+from core.metrics import THUMBNAIL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Timings:
+    """Время и число вызовов по слоям за один запрос."""
+
+    def __init__(self):
+        self.layers = {}
+        self.active = set()
+
+    def add(self, layer, seconds):
+        total, count = self.layers.get(layer, (0.0, 0))
+        self.layers[layer] = (total + seconds, count + 1)
+
+    def as_dict(self, total):
+        result = {
+            layer: {'ms': round(seconds * 1000, 3), 'count': count}
+            for layer, (seconds, count) in self.layers.items()
+        }
+        result['total'] = {'ms': round(total * 1000, 3), 'count': 1}
+        return result
+
+    def header(self, total):
+        parts = [
+            f'{layer};dur={seconds * 1000:.1f};desc="{count} calls"'
+            for layer, (seconds, count) in self.layers.items()
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current():
+    """Замеры текущего запроса или None, если он не попал в выборку."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def timed(layer):
+    timings = current()
+    if timings is None or layer in timings.active:
+        yield
+        return
+    timings.active.add(layer)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(layer)
+        timings.add(layer, time.perf_counter() - started)
+
+
+# SQL
+
+def _execute(execute, sql, params, many, context):
+    # Без контекстного менеджера: вне выборки это самый частый вызов
+    if getattr(_local, 'timings', None) is None:
+        return execute(sql, params, many, context)
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def install_db_timing(sender, connection, **kwargs):
+    """Обработчик connection_created: обернуть execute соединения."""
+    if _execute not in connection.execute_wrappers:
+        # В начало списка: connection.execute_wrapper() снимает свою
+        # обёртку с конца
+        connection.execute_wrappers.insert(0, _execute)
+
+
+# Шаблоны
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+# Миниатюры
+
+class ThumbnailBackend(thumbnail_base.ThumbnailBackend):
+    def get_thumbnail(self, file_, geometry_string, **options):
+        with timed('thumbnail'), THUMBNAIL_SECONDS.time(source='sorl'):
+            return super().get_thumbnail(file_, geometry_string, **options)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = _local.timings = Timings()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.timings = None
+        total = time.perf_counter() - started
+        response['Server-Timing'] = timings.header(total)
+        match = request.resolver_match
+        logger.info(
+            '%s %s %s %.1f ms', request.method, request.path,
+            response.status_code, total * 1000,
+            extra={
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'timing': timings.as_dict(total),
+            },
+        )
+        return response
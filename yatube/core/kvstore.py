@@ -0,0 +1,150 @@
+"""Хранилище ключей sorl-thumbnail: LRU процесса перед индексом на диске.
+
+Стандартное хранилище sorl на каждый тег {% thumbnail %} ходит в кэш,
+а при промахе — в базу. Здесь источник истины — маленький файл SQLite
+(таблица ключ-значение без rowid), а перед ним ограниченный LRU в
+памяти процесса. Отсутствие ключа LRU помнит только
+THUMBNAIL_KVSTORE_MISS_TTL секунд: миниатюру тем временем мог
+построить другой процесс. Списки постов заранее вызывают prefetch() с
+ключами всех своих миниатюр, и они читаются одним запросом; дальше
+теги обслуживаются из памяти. При переполнении LRU вытесняются давно
+не читанные ключи, на диске остаётся всё.
+
+    THUMBNAIL_KVSTORE = 'core.kvstore.KVStore'
+    THUMBNAIL_KVSTORE_PATH = '/var/tmp/yatube-thumbnails.sqlite3'
+    THUMBNAIL_KVSTORE_LRU_SIZE = 2000
+    THUMBNAIL_KVSTORE_MISS_TTL = 5
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+# Ограничение SQLite на число параметров в одном запросе
+BATCH_SIZE = 500
+MISSING = object()
+
+
+class _Absent:
+    """Запомненное отсутствие ключа со сроком."""
+
+    __slots__ = ('expires',)
+
+    def __init__(self, expires):
+        self.expires = expires
+
+
+class KVStore(KVStoreBase):
+    def __init__(self):
+        super().__init__()
+        self._path = settings.THUMBNAIL_KVSTORE_PATH
+        self._lru_size = settings.THUMBNAIL_KVSTORE_LRU_SIZE
+        self._miss_ttl = settings.THUMBNAIL_KVSTORE_MISS_TTL
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        self._pid = None
+        self._connection = None
+
+    # Индекс на диске
+
+    def _db(self):
+        # После fork у процесса своё соединение
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=10, check_same_thread=False,
+                isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS kvstore '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _load(self, keys):
+        """Значения ключей с диска пачками; отсутствующих нет в ответе."""
+        found = {}
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start:start + BATCH_SIZE]
+            rows = self._db().execute(
+                'SELECT key, value FROM kvstore WHERE key IN ({})'.format(
+                    ', '.join('?' * len(batch))),
+                batch,
+            )
+            found.update(rows)
+        return found
+
+    # LRU
+
+    def _remember(self, key, value):
+        if value is None:
+            value = _Absent(time.monotonic() + self._miss_ttl)
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def _recall(self, key):
+        value = self._lru.get(key, MISSING)
+        if value is MISSING:
+            return value
+        if isinstance(value, _Absent):
+            if value.expires <= time.monotonic():
+                del self._lru[key]
+                return MISSING
+            return None
+        self._lru.move_to_end(key)
+        return value
+
+    def prefetch(self, image_files):
+        """Загрузить в LRU одним запросом все ключи, которых там нет."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        with self._lock:
+            keys = [key for key in dict.fromkeys(keys)
+                    if self._recall(key) is MISSING]
+            if not keys:
+                return
+            found = self._load(keys)
+            for key in keys:
+                # None ненадолго запоминает, что миниатюры ещё нет
+                self._remember(key, found.get(key))
+
+    # Методы, которые требует sorl
+
+    def _get_raw(self, key):
+        with self._lock:
+            value = self._recall(key)
+            if value is MISSING:
+                value = self._load([key]).get(key)
+                self._remember(key, value)
+            return value
+
+    def _set_raw(self, key, value):
+        with self._lock:
+            self._db().execute(
+                'INSERT OR REPLACE INTO kvstore (key, value) VALUES (?, ?)',
+                (key, value))
+            self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        with self._lock:
+            for start in range(0, len(keys), BATCH_SIZE):
+                batch = keys[start:start + BATCH_SIZE]
+                self._db().execute(
+                    'DELETE FROM kvstore WHERE key IN ({})'.format(
+                        ', '.join('?' * len(batch))),
+                    batch,
+                )
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _find_keys_raw(self, prefix):
+        with self._lock:
+            rows = self._db().execute(
+                'SELECT key FROM kvstore WHERE substr(key, 1, ?) = ?',
+                (len(prefix), prefix))
+            return [key for key, in rows]
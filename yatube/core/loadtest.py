@@ -0,0 +1,206 @@
+"""Нагрузочный прогон страниц на большой синтетической базе.
+
+Базу заполняет posts.seeding. run() гоняет запросы к страницам из
+нескольких потоков через WSGI-клиент Django и считает задержки и число
+запросов к базе; report() собирает из этого JSON, который удобно
+сравнивать между коммитами.
+"""
+import queue
+import random
+import resource
+import subprocess
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from posts.urls import urlpatterns as posts_urlpatterns
+from users.urls import urlpatterns as users_urlpatterns
+
+# Страницы, которые меняют данные или сессию клиента
+SKIPPED = {
+    'posts:add_comment',
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+    'users:logout',
+}
+QUERY_STRINGS = {
+    'posts:search': {'q': 'жизнь'},
+}
+PERCENTILES = (50, 95, 99)
+
+
+def busiest_reader():
+    """Пользователь с наибольшим числом подписок: его лента полнее всех."""
+    user_id = (
+        UserStats.objects.order_by('-following_count')
+        .values_list('user_id', flat=True).first())
+    return User.objects.filter(pk=user_id).first()
+
+
+def dataset():
+    """Сколько строк в базе прогона."""
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'follows': Follow.objects.count(),
+        'comments': Comment.objects.count(),
+    }
+
+
+class Sampler:
+    """Случайные значения параметров адресов из существующих строк."""
+
+    def __init__(self, random_seed=0, size=1000):
+        self.rng = random.Random(random_seed)
+        self.values = {
+            'username': list(
+                User.objects.values_list('username', flat=True)[:size]),
+            'slug': list(Group.objects.values_list('slug', flat=True)[:size]),
+            'post_id': list(Post.objects.values_list('pk', flat=True)[:size]),
+        }
+
+    def kwargs(self, converters):
+        return {
+            name: self.rng.choice(self.values[name]) for name in converters
+        }
+
+
+def targets():
+    """(имя, шаблон адреса) всех страниц posts и users."""
+    for namespace, patterns in (('posts', posts_urlpatterns),
+                                ('users', users_urlpatterns)):
+        for pattern in patterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            name = f'{namespace}:{pattern.name}'
+            # Без имени — раздача медиа в режиме DEBUG
+            if pattern.name and name not in SKIPPED:
+                yield name, pattern
+
+
+def _get(client, url, params):
+    try:
+        response = client.get(url, params)
+        # Потоковый ответ тоже надо дочитать
+        response.getvalue()
+    except Exception:
+        # Клиент пробрасывает исключения представлений; для отчёта это
+        # такая же ошибка сервера
+        return 500
+    return response.status_code
+
+
+def _worker(jobs, results, user, sampler_lock, sampler):
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    try:
+        while True:
+            try:
+                name, pattern = jobs.get_nowait()
+            except queue.Empty:
+                return
+            with sampler_lock:
+                kwargs = sampler.kwargs(pattern.pattern.converters)
+            url = reverse(name, kwargs=kwargs)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                status = _get(client, url, QUERY_STRINGS.get(name, {}))
+                elapsed = time.perf_counter() - started
+            results.append((name, elapsed, len(queries), status))
+    finally:
+        # У каждого потока своё соединение с базой
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def run(requests_per_url, concurrency=1, user=None, random_seed=0):
+    """Прогнать запросы; возвращает список (имя, секунды, запросов, код).
+
+    user — от чьего имени ходить (нужен для ленты и выгрузки); при
+    concurrency=1 всё выполняется в текущем потоке.
+    """
+    jobs = queue.Queue()
+    pages = list(targets())
+    for _ in range(requests_per_url):
+        for page in pages:
+            jobs.put(page)
+    results = []
+    args = (jobs, results, user, threading.Lock(), Sampler(random_seed))
+    if concurrency <= 1:
+        _worker(*args)
+        return results
+    threads = [
+        threading.Thread(target=_worker, args=args)
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(timings, queries):
+    timings = sorted(timings)
+    summary = {'requests': len(timings)}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(percentile(timings, p) * 1000, 3)
+    summary['queries_mean'] = round(sum(queries) / len(queries), 2)
+    summary['queries_max'] = max(queries)
+    return summary
+
+
+def report(results, wall_time, dataset):
+    """Итоги прогона словарём для json.dumps."""
+    timings = defaultdict(list)
+    queries = defaultdict(list)
+    errors = defaultdict(int)
+    for name, elapsed, count, status in results:
+        timings[name].append(elapsed)
+        queries[name].append(count)
+        if status >= 500:
+            errors[name] += 1
+    urls = {}
+    for name in sorted(timings):
+        urls[name] = _summary(timings[name], queries[name])
+        urls[name]['errors'] = errors[name]
+    total = _summary(
+        [elapsed for _, elapsed, _, _ in results],
+        [count for _, _, count, _ in results]) if results else {}
+    # ru_maxrss в Linux — в килобайтах
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        'commit': _commit(),
+        'dataset': dataset,
+        'wall_time_s': round(wall_time, 3),
+        'throughput_rps': (
+            round(len(results) / wall_time, 2) if wall_time else None),
+        'peak_rss_bytes': peak_rss,
+        'total': total,
+        'urls': urls,
+    }
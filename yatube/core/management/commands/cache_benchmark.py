@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends.shared_memory import SharedMemoryCache
+
+
+def _backends(path):
+    return {
+        'locmem': lambda: LocMemCache(
+            'benchmark', {'OPTIONS': {'MAX_ENTRIES': 100000}}),
+        'shared_memory': lambda: SharedMemoryCache(
+            path, {'OPTIONS': {'MAX_BYTES': 256 * 1024 * 1024}}),
+    }
+
+
+def _ops_per_second(operation, count):
+    start = time.perf_counter()
+    for i in range(count):
+        operation(i)
+    return count / (time.perf_counter() - start)
+
+
+def _fill(factory, keys, value):
+    cache = factory()
+    for i in range(keys):
+        cache.set(f'shared:{os.getpid()}:{i}', value)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает кэш в разделяемой памяти с LocMemCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=20000,
+                            help='Операций каждого вида')
+        parser.add_argument('--value-size', type=int, default=20000,
+                            help='Размер значения в байтах (как страница)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Процессов в проверке общего доступа')
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        value = ('<article>пост</article>' * options['value_size'])[
+            :options['value_size']]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.mmap')
+            for name, factory in _backends(path).items():
+                cache = factory()
+                cache.clear()
+                cache.set('counter', 0)
+                keys = min(ops, 1000)
+                results = {
+                    'set': _ops_per_second(
+                        lambda i: cache.set(f'page:{i % keys}', value), ops),
+                    'get': _ops_per_second(
+                        lambda i: cache.get(f'page:{i % keys}'), ops),
+                    'incr': _ops_per_second(
+                        lambda i: cache.incr('counter'), ops),
+                }
+                hit_rate = self._cross_process_hit_rate(
+                    factory, keys, value, options['workers'])
+                self.stdout.write(
+                    f'{name:>14}: '
+                    + ', '.join(f'{op} {rate:,.0f}/с'
+                                for op, rate in results.items())
+                    + f', попаданий из других процессов {hit_rate:.0%}')
+
+    def _cross_process_hit_rate(self, factory, keys, value, workers):
+        """Доля ключей, записанных дочерними процессами, видимых здесь."""
+        context = multiprocessing.get_context('fork')
+        per_worker = keys // workers
+        processes = [
+            context.Process(target=_fill, args=(factory, per_worker, value))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        cache = factory()
+        hits = sum(
+            cache.get(f'shared:{process.pid}:{i}') is not None
+            for process in processes
+            for i in range(per_worker)
+        )
+        total = per_worker * workers
+        return hits / total if total else 0
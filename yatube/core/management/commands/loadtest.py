@@ -0,0 +1,73 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from core import loadtest
+from posts import seeding
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Заполняет отдельную базу синтетическими данными и меряет '
+            'задержки страниц posts и users; итог печатает в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов к каждому адресу')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Потоков с клиентами')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора данных и адресов')
+        parser.add_argument(
+            '--database',
+            default=os.path.join(settings.BASE_DIR, 'loadtest.sqlite3'),
+            help='Файл базы для прогона (основная база не трогается)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять базу и не заполнять её заново')
+        parser.add_argument('--output', help='Записать JSON в файл')
+
+    def handle(self, *args, **options):
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            result = self._measure(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as target:
+                target.write(output + '\n')
+        self.stdout.write(output)
+
+    def _measure(self, options):
+        if not Post.objects.exists():
+            started = time.monotonic()
+            seeding.seed(
+                users=options['users'], groups=options['groups'],
+                posts=options['posts'], follows=options['follows'],
+                comments=options['comments'], random_seed=options['seed'])
+            self.stderr.write(
+                f'База заполнена за {time.monotonic() - started:.1f} с')
+        reader = loadtest.busiest_reader()
+        started = time.perf_counter()
+        results = loadtest.run(
+            options['requests'], options['concurrency'], reader,
+            options['seed'])
+        wall_time = time.perf_counter() - started
+        return loadtest.report(results, wall_time, loadtest.dataset())
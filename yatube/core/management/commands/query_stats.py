@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import querystats
+
+
+class Command(BaseCommand):
+    help = ('Показывает статистику SQL по отпечаткам, собранную всеми '
+            'процессами сайта')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести строки в JSON')
+        parser.add_argument('--reset', action='store_true',
+                            help='Удалить накопленную статистику')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            querystats.clear_files()
+            self.stdout.write('Статистика удалена')
+            return
+        rows = querystats.collect()[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, ensure_ascii=False, indent=2))
+            return
+        for row in rows:
+            views = ', '.join(
+                f'{view}: {count}' for view, count in row['views'].items())
+            self.stdout.write(
+                f"{row['total_ms']:10.1f} мс  {row['count']:7} × "
+                f"{row['mean_ms']:.2f} мс (макс. {row['max_ms']:.1f})  "
+                f"{views}\n    {row['sql'][:500]}")
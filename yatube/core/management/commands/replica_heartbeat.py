@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = ('Записывает отметку отставания реплик (core.replicas) раз в '
+            'REPLICA_HEARTBEAT_INTERVAL секунд; нужна при внешней '
+            'репликации, sync_replica пишет отметку сама')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Записать одну отметку и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                replicas.beat()
+            except DatabaseError as error:
+                # База занята или недоступна: следующая отметка догонит
+                self.stderr.write(f'Отметка не записана: {error!r}')
+            if options['once']:
+                return
+            time.sleep(settings.REPLICA_HEARTBEAT_INTERVAL)
@@ -0,0 +1,100 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+def _copy_sql(model, connection):
+    ops = connection.ops
+    columns = [field.column for field in model._meta.concrete_fields]
+    return (
+        f"{ops.insert_statement(ignore_conflicts=True)} "
+        f"{ops.quote_name(model._meta.db_table)} "
+        f"({', '.join(ops.quote_name(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"{ops.ignore_conflicts_suffix_sql(True)}"
+    )
+
+
+def _select_sql(model, connection, where, limit=''):
+    ops = connection.ops
+    columns = [field.column for field in model._meta.concrete_fields]
+    pk = ops.quote_name(model._meta.pk.column)
+    return (
+        f"SELECT {', '.join(ops.quote_name(column) for column in columns)} "
+        f"FROM {ops.quote_name(model._meta.db_table)} "
+        f"WHERE {where.format(pk=pk)} ORDER BY {pk} {limit}"
+    )
+
+
+class Command(BaseCommand):
+    help = ('Переносит строки моделей из DATABASE_MODELS из default в их '
+            'базы (см. core.routers); повторный запуск ничего не дублирует')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_MODELS:
+            raise CommandError(
+                'Раскладка по базам выключена: '
+                'задайте YATUBE_SPLIT_DATABASES=1')
+        for alias in sorted(set(settings.DATABASE_MODELS.values())):
+            call_command('migrate', database=alias, verbosity=0)
+        source = connections[DEFAULT_DB_ALIAS]
+        tables = set(source.introspection.table_names())
+        for label, alias in sorted(settings.DATABASE_MODELS.items()):
+            model = apps.get_model(label)
+            if model._meta.db_table not in tables:
+                self.stdout.write(f'{label}: в default таблицы нет')
+                continue
+            copied, differing = self._copy(
+                model, source, connections[alias], options['batch_size'])
+            self.stdout.write(
+                f'{label} -> {alias}: скопировано {copied}, '
+                f'не совпало с новой базой {differing}')
+            if differing:
+                # Например, после включения раскладки новые строки в
+                # новой базе получили те же ключи, что и старые в default
+                raise CommandError(
+                    f'{label}: не все строки попали в {alias}, '
+                    f'таблица в default не очищена')
+            with source.cursor() as cursor:
+                # Таблица в default остаётся пустой для каскадного
+                # удаления. Без сигналов: строки не удаляются, а переезжают
+                cursor.execute(
+                    f'DELETE FROM '
+                    f'{source.ops.quote_name(model._meta.db_table)}')
+
+    def _copy(self, model, source, target, batch_size):
+        """Скопировать таблицу пачками по первичному ключу.
+
+        Возвращает (скопировано строк, строк, которых в новой базе нет
+        или которые там другие).
+        """
+        select_sql = _select_sql(model, source, '{pk} > %s', 'LIMIT %s')
+        compare_sql = _select_sql(model, target, '{pk} BETWEEN %s AND %s')
+        copy_sql = _copy_sql(model, target)
+        pk_index = [
+            field.column for field in model._meta.concrete_fields
+        ].index(model._meta.pk.column)
+        # Первичный ключ сессии — строка, остальных — число
+        last = '' if model._meta.pk.get_internal_type() == 'CharField' else 0
+        copied = differing = 0
+        while True:
+            with source.cursor() as cursor:
+                cursor.execute(select_sql, [last, batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                return copied, differing
+            first, last = rows[0][pk_index], rows[-1][pk_index]
+            with transaction.atomic(target.alias), target.cursor() as cursor:
+                cursor.executemany(copy_sql, rows)
+                # INSERT OR IGNORE пропускает строку с занятым ключом:
+                # перенесённой считается только строка, совпавшая целиком
+                cursor.execute(compare_sql, [first, last])
+                stored = {row[pk_index]: row for row in cursor.fetchall()}
+            copied += len(rows)
+            differing += sum(
+                stored.get(row[pk_index]) != row for row in rows)
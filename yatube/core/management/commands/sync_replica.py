@@ -0,0 +1,39 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файл реплики (core.replicas); '
+            'запускается периодически, например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica',
+                            help='Псевдоним реплики в DATABASES')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Страниц базы за шаг копирования')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections.databases or alias == DEFAULT_DB_ALIAS:
+            raise CommandError(f'Нет реплики {alias!r} в DATABASES')
+        source = connections[DEFAULT_DB_ALIAS]
+        target = connections[alias]
+        if {source.vendor, target.vendor} != {'sqlite'}:
+            raise CommandError('Копировать можно только SQLite в SQLite')
+        # Отметка входит в копию: по ней считается отставание реплики
+        replicas.beat()
+        source.ensure_connection()
+        # Соединения процесса к реплике закрываем: файл перезаписывается
+        target.close()
+        destination = sqlite3.connect(target.settings_dict['NAME'])
+        try:
+            # Онлайн-копия: писатели основной базы ждут только шаг копирования
+            source.connection.backup(destination, pages=options['pages'])
+        finally:
+            destination.close()
+        self.stdout.write(f'{alias}: скопировано в '
+                          f'{target.settings_dict["NAME"]}')
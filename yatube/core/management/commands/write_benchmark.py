@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+from django.urls import reverse
+
+from core import sqlite
+from core.loadtest import percentile
+from posts.models import Post, User
+
+# journal_mode меняется один раз перед прогоном: переключить его можно,
+# только пока базу никто не держит
+MODES = {
+    'rollback': {
+        'journal_mode': 'DELETE',
+        'pragmas': {'synchronous': 'FULL'},
+        'queue': False,
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'pragmas': {'synchronous': 'NORMAL', 'temp_store': 'MEMORY'},
+        'queue': False,
+    },
+    'wal+queue': {
+        'journal_mode': 'WAL',
+        'pragmas': {'synchronous': 'NORMAL', 'temp_store': 'MEMORY'},
+        'queue': True,
+    },
+}
+
+
+def _thread(client, post_id, author, writes, results):
+    comment_url = reverse('posts:add_comment', args=[post_id])
+    follow_urls = (
+        reverse('posts:profile_follow', args=[author]),
+        reverse('posts:profile_unfollow', args=[author]),
+    )
+    for i in range(writes):
+        # Комментарии и подписки вперемешку, как на живом сайте
+        if i % 2:
+            request = (client.get, follow_urls[i // 2 % 2], None)
+        else:
+            request = (client.post, comment_url, {'text': f'комментарий {i}'})
+        method, url, data = request
+        started = time.perf_counter()
+        try:
+            status = method(url, data).status_code
+            error = None if status < 400 else f'HTTP {status}'
+        except Exception as exc:
+            error = type(exc).__name__
+        results.append((time.perf_counter() - started, error))
+
+
+def _process(task):
+    """Потоки одного процесса-воркера; итог — задержки и ошибки."""
+    mode, user_ids, post_id, author, writes = task
+    chosen = MODES[mode]
+    with override_settings(SQLITE_PRAGMAS=chosen['pragmas'],
+                           WRITE_QUEUE_ENABLED=chosen['queue']):
+        results = []
+        threads = []
+        for user_id in user_ids:
+            client = Client()
+            client.force_login(User.objects.get(pk=user_id))
+            threads.append(threading.Thread(
+                target=_thread,
+                args=(client, post_id, author, writes, results)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+        connections.close_all()
+    return (results, wall_time, sqlite.write_queue.batches,
+            sqlite.write_queue.writes)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержки записей (комментарии, подписки) при '
+            'одновременной работе нескольких процессов и потоков: журнал '
+            'rollback, WAL и WAL с очередью писателя')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Потоков в каждом процессе')
+        parser.add_argument('--writes', type=int, default=100,
+                            help='Записей на поток')
+        parser.add_argument('--modes', nargs='+', choices=MODES,
+                            default=list(MODES))
+
+    def handle(self, *args, **options):
+        # Ожидание блокировки и есть предмет замера: не печатаем его
+        # как медленные запросы
+        logging.getLogger('core.querystats').setLevel(logging.ERROR)
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory, 'write_benchmark.sqlite3')
+            setup_test_environment(debug=False)
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True)
+            try:
+                for mode in options['modes']:
+                    self._measure(mode, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _measure(self, mode, options):
+        processes, threads = options['processes'], options['threads']
+        author = User.objects.create(username=f'author-{mode}')
+        post = Post.objects.create(author=author, text='пост')
+        users = User.objects.bulk_create(
+            User(username=f'writer-{mode}-{i}')
+            for i in range(processes * threads))
+        user_ids = list(
+            User.objects.filter(username__startswith=f'writer-{mode}-')
+            .order_by('pk').values_list('pk', flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"PRAGMA journal_mode = {MODES[mode]['journal_mode']}")
+        # Дочерние процессы открывают свои соединения
+        connections.close_all()
+        tasks = [
+            (mode, user_ids[i * threads:(i + 1) * threads], post.pk,
+             author.username, options['writes'])
+            for i in range(len(users) // threads)
+        ]
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool:
+            outcomes = pool.map(_process, tasks)
+        results = [result for outcome in outcomes for result in outcome[0]]
+        wall_time = max(outcome[1] for outcome in outcomes)
+        batches = sum(outcome[2] for outcome in outcomes)
+        queued = sum(outcome[3] for outcome in outcomes)
+        timings = sorted(seconds * 1000 for seconds, _ in results)
+        errors = Counter(error for _, error in results if error)
+        line = (
+            f'{mode:>10}: {len(results) / wall_time:,.0f} записей/с, '
+            + ', '.join(f'p{p} {percentile(timings, p):.1f} мс'
+                        for p in (50, 95, 99))
+            + f', ошибок {sum(errors.values())}'
+        )
+        if errors:
+            line += ' (' + ', '.join(
+                f'{name}: {count}' for name, count in errors.items()) + ')'
+        if batches:
+            line += f', в среднем {queued / batches:.1f} записей в пачке'
+        self.stdout.write(line)
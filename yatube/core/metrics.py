@@ -0,0 +1,461 @@
+"""Метрики в текстовом формате Prometheus для всех процессов сервера.
+
+Каждый процесс пишет свои значения в собственные файлы в METRICS_DIR,
+отображённые в память: запись — это struct.pack_into по известному
+смещению, без блокировок между процессами. Файл — заголовок с числом
+занятых байт и записи «длина ключа, ключ, double». Новая запись
+сначала дописывается, и только потом растёт заголовок, поэтому
+читатель всегда видит целые записи. /metrics складывает файлы всех
+процессов: счётчики и гистограммы — всех, когда-либо работавших,
+датчики — только живых. Счётчики завершившихся процессов при сборе
+переносятся в общий файл counter_merged.db, а их файлы удаляются, так
+что число файлов не растёт с каждым перезапуском воркеров.
+
+/metrics отвечает адресам из METRICS_ALLOWED_IPS и запросам с
+заголовком «Authorization: Bearer <METRICS_TOKEN>».
+
+    METRICS_DIR = '/var/tmp/yatube-metrics'
+"""
+import bisect
+import fcntl
+import glob
+import hmac
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+USED = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+FILE_NAME = re.compile(r'^(counter|gauge)_(\d+)\.db$')
+MERGED_NAME = 'counter_merged.db'
+MERGE_LOCK_NAME = 'merge.lock'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MmapValues:
+    """Значения одного процесса в файле, отображённом в память."""
+
+    def __init__(self, path):
+        self._path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self._fd).st_size
+        if size < INITIAL_SIZE:
+            os.ftruncate(self._fd, INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        self._positions = {}
+        used = USED.unpack_from(self._map)[0]
+        if used == 0:
+            used = USED.size
+            USED.pack_into(self._map, 0, used)
+        for key, _, position in _entries(self._map, used):
+            self._positions[key] = position
+        self._used = used
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode()
+        # Значение выравниваем по 8 байт
+        padding = -(KEY_LENGTH.size + len(encoded)) % 8
+        size = KEY_LENGTH.size + len(encoded) + padding + VALUE.size
+        if self._used + size > len(self._map):
+            self._grow(self._used + size)
+        offset = self._used
+        KEY_LENGTH.pack_into(self._map, offset, len(encoded))
+        start = offset + KEY_LENGTH.size
+        self._map[start:start + len(encoded)] = encoded
+        position = start + len(encoded) + padding
+        VALUE.pack_into(self._map, position, 0.0)
+        self._used += size
+        USED.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def add(self, key, amount):
+        position = self._position(key)
+        value = VALUE.unpack_from(self._map, position)[0]
+        VALUE.pack_into(self._map, position, value + amount)
+
+    def set(self, key, value):
+        VALUE.pack_into(self._map, self._position(key), value)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def _entries(data, used):
+    offset = USED.size
+    while offset < used:
+        length = KEY_LENGTH.unpack_from(data, offset)[0]
+        start = offset + KEY_LENGTH.size
+        key = bytes(data[start:start + length]).decode()
+        padding = -(KEY_LENGTH.size + length) % 8
+        position = start + length + padding
+        yield key, VALUE.unpack_from(data, position)[0], position
+        offset = position + VALUE.size
+
+
+def read_values(path):
+    """Значения из файла любого процесса: {ключ: число}."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    if len(data) < USED.size:
+        return {}
+    used = min(USED.unpack_from(data)[0], len(data))
+    return {key: value for key, value, _ in _entries(data, used)}
+
+
+class _Store:
+    """Файлы счётчиков и датчиков текущего процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owner = None
+        self._files = {}
+
+    def _file(self, kind):
+        # После fork у процесса свои файлы
+        owner = (os.getpid(), settings.METRICS_DIR)
+        if self._owner != owner:
+            pid, directory = owner
+            os.makedirs(directory, exist_ok=True)
+            gauge_path = os.path.join(directory, f'gauge_{pid}.db')
+            # Датчики прежнего процесса с тем же pid не нужны
+            if os.path.exists(gauge_path):
+                os.remove(gauge_path)
+            self._files = {
+                'counter': MmapValues(
+                    os.path.join(directory, f'counter_{pid}.db')),
+                'gauge': MmapValues(gauge_path),
+            }
+            self._owner = owner
+            # Пустые корзины гистограмм заново создаются в новых файлах
+            for metric in REGISTRY.values():
+                metric._keys.clear()
+        return self._files[kind]
+
+    def add(self, kind, key, amount):
+        with self._lock:
+            self._file(kind).add(key, amount)
+
+
+_store = _Store()
+REGISTRY = {}
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _pairs(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = 'counter'
+    type_name = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._keys = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        key = self._keys.get(labels)
+        if key is None:
+            key = self._keys[labels] = f'{self.name}{_labels(labels)}'
+        return key
+
+
+class Counter(Metric):
+    def inc(self, amount=1, **labels):
+        _store.add(self.kind, self._key(_pairs(labels)), amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    type_name = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        _store.add(self.kind, self._key(_pairs(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def _series(self, labels):
+        """Ключи корзин (без накопления), суммы и количества."""
+        series = self._keys.get(labels)
+        if series is None:
+            pairs = list(labels)
+            series = self._keys[labels] = (
+                [f'{self.name}_bucket'
+                 f'{_labels(pairs + [("le", _le(bound))])}'
+                 for bound in self.buckets + (float('inf'),)],
+                f'{self.name}_sum{_labels(pairs)}',
+                f'{self.name}_count{_labels(pairs)}',
+            )
+            # Prometheus ждёт все корзины, в том числе пустые
+            for key in series[0]:
+                _store.add('counter', key, 0)
+        return series
+
+    def observe(self, value, **labels):
+        buckets, sum_key, count_key = self._series(_pairs(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        _store.add('counter', buckets[index], 1)
+        _store.add('counter', sum_key, value)
+        _store.add('counter', count_key, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def _le(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа по имени адреса',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUEST_QUERIES = Histogram(
+    'yatube_request_queries', 'SQL-запросов на ответ по имени адреса',
+    (0, 1, 2, 5, 10, 20, 50, 100, 200))
+REQUESTS_IN_FLIGHT = Gauge(
+    'yatube_requests_in_flight', 'Запросов в обработке')
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total',
+    'Чтения ключей кэшей (core.cache_backends.instrumented)')
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds', 'Время получения миниатюр и вариантов',
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+
+# Сбор
+
+def process_alive(pid):
+    """Жив ли процесс; чужой процесс без прав на сигнал считается живым."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_files(directory):
+    """(путь, вид, pid) файлов процессов в каталоге."""
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        match = FILE_NAME.match(os.path.basename(path))
+        if match is not None:
+            yield path, match.group(1), int(match.group(2))
+
+
+def _merge_files(directory):
+    merged = None
+    try:
+        for path, kind, pid in _process_files(directory):
+            if process_alive(pid):
+                continue
+            if kind == 'counter':
+                try:
+                    values = read_values(path)
+                except (OSError, struct.error, UnicodeDecodeError):
+                    continue
+                if merged is None:
+                    merged = MmapValues(os.path.join(directory, MERGED_NAME))
+                for key, value in values.items():
+                    merged.add(key, value)
+            os.remove(path)
+    finally:
+        if merged is not None:
+            merged.close()
+
+
+def merge_dead(directory=None):
+    """Перенести счётчики завершившихся процессов в общий файл.
+
+    Файлы завершившихся процессов удаляются; датчики таких процессов
+    просто выбрасываются.
+    """
+    directory = directory or settings.METRICS_DIR
+    if not os.path.isdir(directory):
+        return
+    lock = os.open(os.path.join(directory, MERGE_LOCK_NAME),
+                   os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        # Сборы в разных процессах не должны сложить файл дважды
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _merge_files(directory)
+    finally:
+        os.close(lock)
+
+
+def collect():
+    """Сумма значений всех процессов: {ключ: число}."""
+    merge_dead()
+    totals = {}
+    paths = [
+        path for path, kind, pid in _process_files(settings.METRICS_DIR)
+        # Процесс мог завершиться уже после переноса
+        if kind == 'counter' or process_alive(pid)
+    ]
+    merged = os.path.join(settings.METRICS_DIR, MERGED_NAME)
+    if os.path.exists(merged):
+        paths.append(merged)
+    for path in paths:
+        try:
+            values = read_values(path)
+        except (OSError, struct.error, UnicodeDecodeError):
+            continue
+        for key, value in values.items():
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _family(key):
+    name = key.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and isinstance(
+                REGISTRY.get(base), Histogram):
+            return base
+    return name
+
+
+def _cumulative(samples):
+    """Корзины гистограммы хранятся раздельно; в выводе — накопленно."""
+    running = {}
+    result = []
+    for key, value in samples:
+        if '_bucket{' in key:
+            series = re.sub(r',?le="[^"]*"', '', key)
+            running[series] = running.get(series, 0.0) + value
+            value = running[series]
+        result.append((key, value))
+    return result
+
+
+def _bucket_order(key):
+    match = re.search(r'le="([^"]*)"', key)
+    if match is None:
+        return (key, 0.0)
+    return (re.sub(r',?le="[^"]*"', '', key), float(match.group(1)))
+
+
+def render(totals):
+    families = {}
+    for key, value in totals.items():
+        families.setdefault(_family(key), []).append((key, value))
+    lines = []
+    for name in sorted(families):
+        metric = REGISTRY.get(name)
+        if metric is not None:
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type_name}')
+        samples = sorted(families[name], key=lambda item: (
+            item[0].split('{')[0], _bucket_order(item[0])))
+        for key, value in _cumulative(samples):
+            lines.append(f'{key} {value:.17g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        # Заданный токен нужен всегда: за обратным прокси на той же
+        # машине у любого запроса адрес 127.0.0.1
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(
+            authorization.encode(), f'Bearer {token}'.encode())
+    # Без токена — только прямые запросы с разрешённых адресов; запрос
+    # с заголовком X-Forwarded-For пришёл через прокси
+    return ('HTTP_X_FORWARDED_FOR' not in request.META
+            and request.META.get('REMOTE_ADDR')
+            in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+# Запросы
+
+_local = threading.local()
+
+
+def _count_query(execute, sql, params, many, context):
+    if getattr(_local, 'queries', None) is not None:
+        _local.queries += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Обработчик connection_created: считать запросы ответа."""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        REQUESTS_IN_FLIGHT.inc()
+        _local.queries = 0
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            queries, _local.queries = _local.queries, None
+            REQUESTS_IN_FLIGHT.dec()
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view)
+        REQUEST_QUERIES.observe(queries, view=view)
+        return response
@@ -1,3 +1,14 @@
-# from django.db import models
+from django.db import models
 
-# Create your models here.
+
+class Heartbeat(models.Model):
+    """Отметка времени, которую пишет основная база (core.replicas).
+
+    Значение в реплике показывает, до какого момента в неё дошли
+    изменения основной базы.
+    """
+    beat_at = models.FloatField('Время отметки')
+
+    class Meta:
+        verbose_name = 'Отметка репликации'
+        verbose_name_plural = 'Отметки репликации'
@@ -0,0 +1,125 @@
+"""Постраничный вывод по курсору (keyset pagination).
+
+Вместо OFFSET и COUNT(*) следующая страница выбирается условием
+«строго после ключа последней записи», поэтому любая страница стоит
+столько же, сколько первая. Курсор — непрозрачная строка с направлением
+и значениями ключа крайней записи страницы.
+"""
+import base64
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPaginator(Paginator):
+    """Paginator, который умеет и номера страниц, и курсоры.
+
+    Нумерованные страницы (get_page) оставлены для старых ссылок
+    вида ?page=N; новые ссылки строятся через get_cursor_page.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id'),
+                 **kwargs):
+        self.ordering = tuple(ordering)
+        self.key_fields = tuple(name.lstrip('-') for name in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+        super().__init__(object_list.order_by(*self.ordering), per_page,
+                         **kwargs)
+
+    def encode_cursor(self, direction, item):
+        values = [self._item_value(item, name) for name in self.key_fields]
+        raw = json.dumps([direction] + values, default=str)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, *values = json.loads(
+                base64.urlsafe_b64decode(padded.encode()).decode())
+        except (TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        if direction not in (NEXT, PREVIOUS) or (
+                len(values) != len(self.key_fields)):
+            raise InvalidCursor(cursor)
+        try:
+            values = [
+                self._to_python(name, value)
+                for name, value in zip(self.key_fields, values)
+            ]
+        except Exception:
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _to_python(self, name, value):
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            # Ключ по аннотации: ранг поиска, дата из ленты и т. п.
+            return annotation.output_field.to_python(value)
+        return self.object_list.model._meta.get_field(name).to_python(value)
+
+    def get_cursor_page(self, cursor):
+        """Страница после (или перед) записью из курсора.
+
+        Некорректный или пустой курсор даёт первую страницу.
+        """
+        try:
+            direction, values = (
+                self.decode_cursor(cursor) if cursor else (None, None))
+        except InvalidCursor:
+            direction, values = None, None
+        queryset = self.object_list
+        if direction == PREVIOUS:
+            queryset = queryset.filter(self._seek(values, forward=False))
+            queryset = queryset.order_by(*self._reversed_ordering())
+        elif direction == NEXT:
+            queryset = queryset.filter(self._seek(values, forward=True))
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == PREVIOUS:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, direction == NEXT
+        page = Page(items, 1, self)
+        page.is_cursor = True
+        page.next_cursor = (
+            self.encode_cursor(NEXT, items[-1])
+            if has_next and items else None)
+        page.previous_cursor = (
+            self.encode_cursor(PREVIOUS, items[0])
+            if has_previous and items else None)
+        return page
+
+    def _seek(self, values, forward):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        lookup = 'lt' if forward == self.descending else 'gt'
+        condition = Q()
+        for i, name in enumerate(self.key_fields):
+            equal = {
+                prev: value
+                for prev, value in zip(self.key_fields[:i], values)
+            }
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in self.ordering
+        ]
+
+    @staticmethod
+    def _item_value(item, name):
+        value = item[name] if isinstance(item, dict) else getattr(item, name)
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
@@ -0,0 +1,297 @@
+"""Статистика SQL по отпечаткам запросов без DEBUG.
+
+Обёртка execute каждого соединения сводит текст запроса к отпечатку
+(литералы и списки IN заменены на ?) и копит по нему число вызовов,
+суммарное и наибольшее время и представления, из которых запрос
+пришёл. Отпечаток текста кэшируется: Django передаёт параметры
+отдельно, поэтому одинаковых текстов немного. Отпечатков хранится не
+больше QUERY_STATS_MAX_FINGERPRINTS, при переполнении вытесняется
+самый дешёвый по суммарному времени.
+
+Запросы дольше QUERY_STATS_SLOW_MS пишутся в лог с местом вызова в
+коде проекта. Каждый процесс раз в QUERY_STATS_FLUSH_INTERVAL секунд
+сохраняет свою статистику в QUERY_STATS_DIR/<pid>-<метка>.json: метка
+отличает процесс от прежнего владельца того же pid. Страница для
+персонала и команда query_stats складывают файлы всех процессов; файлы
+завершившихся процессов при этом переносятся в merged.json и удаляются.
+"""
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.metrics import process_alive
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных текстов SQL помнить вместе с их отпечатками
+TEXT_CACHE_SIZE = 2000
+# Сколько представлений помнить у одного отпечатка
+MAX_VIEWS = 10
+SQL_PREVIEW = 2000
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+)
+# Обёртки execute: их кадры в месте вызова не нужны
+WRAPPER_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.py'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 'instrumentation.py'),
+}
+
+MERGED_NAME = 'merged.json'
+MERGE_LOCK_NAME = 'merge.lock'
+FILE_NAME = re.compile(r'(\d+)(?:-[0-9a-f]+)?\.json$')
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_texts = OrderedDict()
+_last_flush = time.monotonic()
+# pid и метка процесса; после fork метка выдаётся заново
+_identity = (None, None)
+
+
+def fingerprint(sql):
+    """Текст запроса без литералов и с одинаковыми списками IN."""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def _fingerprint_key(sql):
+    with _lock:
+        found = _texts.get(sql)
+        if found is not None:
+            _texts.move_to_end(sql)
+            return found
+    normalized = fingerprint(sql)
+    key = (hashlib.md5(normalized.encode()).hexdigest()[:16], normalized)
+    with _lock:
+        _texts[sql] = key
+        if len(_texts) > TEXT_CACHE_SIZE:
+            _texts.popitem(last=False)
+    return key
+
+
+def _origin():
+    """Последние кадры стека из кода проекта, без Django и библиотек."""
+    root = str(settings.BASE_DIR)
+    frames = [
+        f'{os.path.relpath(frame.filename, root)}:{frame.lineno} '
+        f'in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(root)
+        and frame.filename not in WRAPPER_FILES
+        and 'site-packages' not in frame.filename
+    ]
+    return frames[-3:]
+
+
+def _record(key, seconds, view):
+    digest, normalized = key
+    with _lock:
+        stat = _stats.get(digest)
+        if stat is None:
+            if len(_stats) >= settings.QUERY_STATS_MAX_FINGERPRINTS:
+                cheapest = min(_stats, key=lambda d: _stats[d]['total'])
+                del _stats[cheapest]
+            stat = _stats[digest] = {
+                'sql': normalized[:SQL_PREVIEW], 'count': 0,
+                'total': 0.0, 'max': 0.0, 'views': {},
+            }
+        stat['count'] += 1
+        stat['total'] += seconds
+        stat['max'] = max(stat['max'], seconds)
+        views = stat['views']
+        if view in views or len(views) < MAX_VIEWS:
+            views[view] = views.get(view, 0) + 1
+
+
+def _execute(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        view = getattr(_local, 'view', None) or '-'
+        _record(_fingerprint_key(sql), seconds, view)
+        if seconds * 1000 >= settings.QUERY_STATS_SLOW_MS:
+            logger.warning(
+                'Медленный запрос %.1f мс в %s: %s', seconds * 1000, view,
+                sql[:SQL_PREVIEW],
+                extra={'duration_ms': seconds * 1000, 'view': view,
+                       'origin': _origin()},
+            )
+
+
+def install_query_stats(sender, connection, **kwargs):
+    """Обработчик connection_created: считать запросы соединения."""
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def snapshot():
+    """Копия статистики этого процесса: {отпечаток: значения}."""
+    with _lock:
+        return {
+            digest: dict(stat, views=dict(stat['views']))
+            for digest, stat in _stats.items()
+        }
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _path():
+    global _identity
+    pid = os.getpid()
+    if _identity[0] != pid:
+        _identity = (pid, uuid.uuid4().hex[:12])
+    return os.path.join(settings.QUERY_STATS_DIR,
+                        f'{pid}-{_identity[1]}.json')
+
+
+def flush():
+    """Сохранить статистику процесса в его файл."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    os.makedirs(settings.QUERY_STATS_DIR, exist_ok=True)
+    path = _path()
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as target:
+        json.dump(snapshot(), target)
+    os.replace(temporary, path)
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush < settings.QUERY_STATS_FLUSH_INTERVAL:
+        return
+    try:
+        flush()
+    except OSError:
+        # Статистика не должна ломать ответ
+        logger.exception('Не удалось сохранить статистику запросов')
+
+
+def _merge_into(total, stats):
+    for digest, stat in stats.items():
+        merged = total.setdefault(digest, {
+            'sql': stat['sql'], 'count': 0, 'total': 0.0, 'max': 0.0,
+            'views': {},
+        })
+        merged['count'] += stat['count']
+        merged['total'] += stat['total']
+        merged['max'] = max(merged['max'], stat['max'])
+        for view, count in stat['views'].items():
+            merged['views'][view] = merged['views'].get(view, 0) + count
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_files(directory):
+    """(путь, pid) файлов процессов в каталоге."""
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        match = FILE_NAME.match(os.path.basename(path))
+        if match is not None:
+            yield path, int(match.group(1))
+
+
+def merge_dead(directory=None):
+    """Перенести статистику завершившихся процессов в merged.json."""
+    directory = directory or settings.QUERY_STATS_DIR
+    if not os.path.isdir(directory):
+        return
+    lock = os.open(os.path.join(directory, MERGE_LOCK_NAME),
+                   os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        # Сборы в разных процессах не должны сложить файл дважды
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [path for path, pid in _process_files(directory)
+                if not process_alive(pid)]
+        if not dead:
+            return
+        merged_path = os.path.join(directory, MERGED_NAME)
+        merged = _read(merged_path) or {}
+        for path in dead:
+            _merge_into(merged, _read(path) or {})
+        temporary = f'{merged_path}.tmp'
+        with open(temporary, 'w') as target:
+            json.dump(merged, target)
+        os.replace(temporary, merged_path)
+        for path in dead:
+            os.remove(path)
+    finally:
+        os.close(lock)
+
+
+def collect():
+    """Статистика всех процессов, от самых дорогих отпечатков.
+
+    Для этого процесса берутся текущие данные, а не его файл.
+    """
+    merge_dead()
+    total = {}
+    own = _path()
+    for path in glob.glob(os.path.join(settings.QUERY_STATS_DIR, '*.json')):
+        if path == own:
+            continue
+        stats = _read(path)
+        if stats is not None:
+            _merge_into(total, stats)
+    _merge_into(total, snapshot())
+    rows = [
+        dict(stat, fingerprint=digest,
+             total_ms=stat['total'] * 1000, max_ms=stat['max'] * 1000,
+             mean_ms=stat['total'] * 1000 / max(stat['count'], 1))
+        for digest, stat in total.items()
+    ]
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
+
+
+def clear_files():
+    reset()
+    for path in glob.glob(os.path.join(settings.QUERY_STATS_DIR, '*.json')):
+        os.remove(path)
+
+
+class QueryStatsMiddleware:
+    """Запоминает представление запроса и периодически сохраняет данные."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            _local.view = None
+            maybe_flush()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _local.view = match.view_name if match else view_func.__name__
@@ -0,0 +1,147 @@
+"""Чтение тяжёлых страниц из реплик основной базы.
+
+Реплика — копия default под другим псевдонимом: файл SQLite, который
+обновляет команда sync_replica, или база с внешней репликацией.
+ReplicaMiddleware для GET-запросов к REPLICA_VIEWS выбирает одну из
+REPLICA_DATABASES, и ReplicaRouter (core.routers) читает из неё всё,
+что иначе читалось бы из default. Запись всегда идёт в default.
+
+Отставание реплики меряется отметкой Heartbeat: текущее время в
+основную базу записывают sync_replica перед копированием и, для внешней
+репликации, команда replica_heartbeat раз в REPLICA_HEARTBEAT_INTERVAL
+секунд. Запросы отметку не пишут, чтобы чтение не занимало единственного
+писателя SQLite. Значение в реплике показывает, до какого момента в неё
+дошли изменения. Реплика,
+которая отстала больше чем на REPLICA_MAX_LAG секунд или не отвечает,
+не выбирается. Страница, версия которой в кэше (core.caching) новее
+данных реплики, строится по основной базе.
+
+После своей записи (любой не-GET запрос и REPLICA_PIN_VIEWS) пользователь
+REPLICA_PIN_SECONDS секунд читает только из основной базы; срок хранится
+в сессии.
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+from core.models import Heartbeat
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'replicas:primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+_lock = threading.Lock()
+# Псевдоним реплики -> (когда проверяли, время данных реплики или None)
+_checked = {}
+
+
+def current():
+    """Реплика, из которой читает текущий запрос, или None."""
+    return getattr(_local, 'alias', None)
+
+
+def use_primary():
+    _local.alias = None
+
+
+# Отставание
+
+def beat():
+    """Записать отметку времени в основную базу."""
+    Heartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        pk=1, defaults={'beat_at': time.time()})
+
+
+def replica_time(alias):
+    """До какого момента в реплику дошли изменения; None — неизвестно."""
+    now = time.monotonic()
+    with _lock:
+        checked = _checked.get(alias)
+    if checked is not None and (
+            now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL):
+        return checked[1]
+    try:
+        value = (
+            Heartbeat.objects.using(alias).filter(pk=1)
+            .values_list('beat_at', flat=True).first())
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна', alias, exc_info=True)
+        value = None
+    with _lock:
+        _checked[alias] = (now, value)
+    return value
+
+
+def lag(alias):
+    """Отставание реплики в секундах; None — реплика недоступна."""
+    value = replica_time(alias)
+    return None if value is None else max(time.time() - value, 0.0)
+
+
+def choose():
+    """Случайная из реплик с допустимым отставанием или None."""
+    healthy = []
+    for alias in settings.REPLICA_DATABASES:
+        seconds = lag(alias)
+        if seconds is not None and seconds <= settings.REPLICA_MAX_LAG:
+            healthy.append(alias)
+        else:
+            logger.info('Реплика %s пропущена, отставание %s', alias, seconds)
+    return random.choice(healthy) if healthy else None
+
+
+def require_fresh(timestamp):
+    """Перейти на основную базу, если в реплике нет данных на timestamp."""
+    alias = current()
+    if alias is not None and (replica_time(alias) or 0) < timestamp:
+        use_primary()
+
+
+# Закрепление за основной базой
+
+def pin(request):
+    request.session[SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def pinned(request):
+    # Без cookie сессии своих записей у клиента не было, а обращение к
+    # сессии добавило бы ответу Vary: Cookie
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    return request.session.get(SESSION_KEY, 0) > time.time()
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary()
+        match = request.resolver_match
+        wrote = (
+            request.method not in SAFE_METHODS
+            or (match is not None
+                and match.view_name in settings.REPLICA_PIN_VIEWS))
+        if wrote and response.status_code < 400:
+            pin(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.REPLICA_DATABASES:
+            return
+        match = request.resolver_match
+        if (request.method in ('GET', 'HEAD')
+                and match.view_name in settings.REPLICA_VIEWS
+                and not pinned(request)):
+            _local.alias = choose()
@@ -0,0 +1,121 @@
+"""Раскладка часто записываемых таблиц по отдельным файлам SQLite.
+
+В SQLite один писатель на файл. Комментарии, подписки и сессии пишутся
+часто и мелкими порциями, а ждут блокировку вместе с большой таблицей
+постов. ModelRouter отправляет модели из settings.DATABASE_MODELS
+(«app_label.model» -> псевдоним базы) в их базы, остальное — в default.
+Раскладку включает переменная окружения YATUBE_SPLIT_DATABASES=1.
+
+Между базами нет JOIN, подзапросов и внешних ключей. Поэтому связи
+Comment и Follow объявлены с db_constraint=False. Каскадное удаление
+Django ищет зависимые строки в базе удаляемого объекта, и там для него
+остаётся пустая таблица той же схемы; сами строки в их базе удаляют
+сигналы posts.signals. Запросы через границу баз строятся функциями
+этого модуля: with_related вместо select_related и in_values вместо
+подзапроса. В одной базе они дают прежние JOIN и подзапросы.
+
+Строки, записанные в default до включения раскладки, переносит команда
+split_databases.
+
+ReplicaRouter отправляет чтение из default в реплику, которую выбрал
+для запроса core.replicas.ReplicaMiddleware.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+
+from core import replicas
+
+
+def database_for(model):
+    return settings.DATABASE_MODELS.get(
+        model._meta.label_lower, DEFAULT_DB_ALIAS)
+
+
+class ModelRouter:
+    """Без DATABASE_MODELS ни во что не вмешивается."""
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_MODELS:
+            return None
+        # Явный ответ и для default: иначе связанный объект читался бы из
+        # базы того объекта, через который к нему обратились
+        return database_for(model)
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Связи через границу баз разрешены: их целостность держат сигналы
+        return True if settings.DATABASE_MODELS else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not settings.DATABASE_MODELS:
+            return None
+        if db == DEFAULT_DB_ALIAS:
+            # Всё, включая пустые таблицы вынесенных моделей для каскада
+            return True
+        # RunSQL и RunPython без модели относятся только к default
+        label = f'{app_label}.{model_name}' if model_name else None
+        return db == settings.DATABASE_MODELS.get(label)
+
+
+class ReplicaRouter:
+    """Стоит перед ModelRouter; вне запросов к REPLICA_VIEWS нейтрален."""
+
+    def db_for_read(self, model, **hints):
+        alias = replicas.current()
+        if alias is not None and database_for(model) == DEFAULT_DB_ALIAS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный из реплики, сохраняется в основную базу
+        instance = hints.get('instance')
+        if (instance is not None
+                and instance._state.db in settings.REPLICA_DATABASES):
+            return database_for(model)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        primary = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= primary:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплика получает вместе с данными
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+def same_database(model, *others):
+    alias = router.db_for_read(model)
+    return all(router.db_for_read(other) == alias for other in others)
+
+
+def with_related(queryset, *fields):
+    """select_related для связей в той же базе, иначе prefetch_related.
+
+    Связанные объекты из другой базы читаются одним запросом на поле,
+    а не запросом на строку.
+    """
+    model = queryset.model
+    joined, fetched = [], []
+    for name in fields:
+        related = model._meta.get_field(name).related_model
+        (joined if same_database(model, related) else fetched).append(name)
+    if joined:
+        queryset = queryset.select_related(*joined)
+    if fetched:
+        queryset = queryset.prefetch_related(*fetched)
+    return queryset
+
+
+def in_values(queryset, model):
+    """Значения для lookup __in в запросе к model.
+
+    В той же базе это подзапрос, в другой — готовый список.
+    """
+    if same_database(queryset.model, model):
+        return queryset
+    return list(queryset)
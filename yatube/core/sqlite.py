@@ -0,0 +1,159 @@
+"""SQLite под нагрузкой: настройки соединений и очередь мелких записей.
+
+configure_connection (обработчик connection_created) включает журнал
+WAL и остальные SQLITE_PRAGMAS: читатели не ждут писателя, а
+synchronous=NORMAL делает фиксацию дешёвой. Ждать чужую блокировку
+соединение будет до DATABASES['default']['OPTIONS']['timeout'] секунд.
+
+Писатель в SQLite всё равно один. Когда несколько потоков процесса
+пишут одновременно, они ждут друг друга на блокировке базы, а в
+транзакции, которая сначала читала, SQLite вовсе не ждёт и сразу
+отвечает «database is locked». WriteQueue отдаёт мелкие записи
+(комментарии, подписки) одному потоку-писателю: он забирает из очереди
+всё, что накопилось, но не больше WRITE_QUEUE_MAX_BATCH, и выполняет
+одной транзакцией на каждую базу пачки (с раскладкой core.routers
+комментарии и подписки живут в разных файлах), каждую запись в своей
+точке сохранения. Запрос ждёт свою запись не дольше фиксации одной
+пачки, а ошибка одной записи не отменяет остальные.
+
+    YATUBE_WRITE_QUEUE=1 python manage.py runserver
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, close_old_connections, connections, router,
+    transaction,
+)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: настройки SQLite из settings."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def immediate_atomic(using=DEFAULT_DB_ALIAS):
+    """transaction.atomic, который сразу берёт блокировку записи SQLite.
+
+    Обычный BEGIN откладывает её до первой записи. Если транзакция до
+    этого читала, а базу успел изменить другой процесс, SQLite не ждёт
+    timeout, а сразу отвечает «database is locked».
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using):
+            yield
+        return
+
+    def begin_immediate():
+        connection.cursor().execute('BEGIN IMMEDIATE')
+
+    # Своё начало транзакции только у соединения этого потока и только
+    # на время блока
+    connection._start_transaction_under_autocommit = begin_immediate
+    try:
+        with transaction.atomic(using):
+            yield
+    finally:
+        del connection._start_transaction_under_autocommit
+
+
+class WriteQueue:
+    """Поток-писатель, выполняющий записи пачками в одной транзакции."""
+
+    def __init__(self, max_batch=None):
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def _ensure_thread(self):
+        # После fork потока-писателя в процессе нет
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, using, function, *args, **kwargs):
+        """Поставить запись в базу using в очередь; результат придёт
+        в Future."""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((future, using, function, args, kwargs))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        max_batch = self._max_batch or settings.WRITE_QUEUE_MAX_BATCH
+        while len(batch) < max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            by_alias = {}
+            for item in batch:
+                by_alias.setdefault(item[1], []).append(item)
+            for using, items in by_alias.items():
+                self._finish(items, using)
+            self.batches += 1
+
+    def _finish(self, items, using):
+        try:
+            results = self._write(items, using)
+        except Exception as error:
+            # Не удалась сама транзакция: ошибка у всех записей этой базы
+            for future, *_ in items:
+                future.set_exception(error)
+            return
+        self.writes += len(items)
+        for (future, *_), (ok, value) in zip(items, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _write(self, items, using):
+        results = []
+        with immediate_atomic(using):
+            for _, _, function, args, kwargs in items:
+                try:
+                    with transaction.atomic(using):
+                        results.append((True, function(*args, **kwargs)))
+                except Exception as error:
+                    results.append((False, error))
+        return results
+
+
+write_queue = WriteQueue()
+
+
+def run_write(model, function, *args, **kwargs):
+    """Выполнить запись строк model через очередь, если она включена,
+    и дождаться.
+
+    Внутри транзакции вызывающего запись выполняется сразу: поток-писатель
+    не увидел бы её незафиксированных данных.
+    """
+    using = router.db_for_write(model)
+    if (not settings.WRITE_QUEUE_ENABLED
+            or connections[using].in_atomic_block):
+        return function(*args, **kwargs)
+    future = write_queue.submit(using, function, *args, **kwargs)
+    return future.result(settings.WRITE_QUEUE_TIMEOUT)
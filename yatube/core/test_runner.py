@@ -0,0 +1,28 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Файлы процессов (метрики, статистика SQL, индекс миниатюр) — во
+    временном каталоге.
+
+    Иначе каждый прогон оставлял бы файлы в рабочих каталогах сервера.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._directory = tempfile.mkdtemp(prefix='yatube-tests-')
+        self._settings = override_settings(
+            METRICS_DIR=f'{self._directory}/metrics',
+            QUERY_STATS_DIR=f'{self._directory}/querystats',
+            THUMBNAIL_KVSTORE_PATH=f'{self._directory}/thumbnails.sqlite3',
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        shutil.rmtree(self._directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
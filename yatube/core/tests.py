@@ -1,3 +1,805 @@
-# from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connections, transaction
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.cache_backends import layered
+from core.cache_backends.instrumented import InstrumentedCache
+from core.cache_backends.layered import LayeredCache
+from core.cache_backends.shared_memory import SharedMemoryCache
+from core import (
+    caching, instrumentation, loadtest, metrics, querystats, replicas,
+    sqlite,
+)
+from core.kvstore import KVStore
+from core.models import Heartbeat
+from posts import seeding
+from posts import feed, stats
+from posts.models import Comment, FeedEntry, Follow, Post
+
+
+class SharedMemoryCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.mmap')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        options.setdefault('MAX_BYTES', 64 * 1024)
+        options.setdefault('SLOT_SIZE', 1024)
+        options.setdefault('WAYS', 4)
+        return SharedMemoryCache(self.path, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 10))
+        self.assertEqual(self.cache.incr('new', 5), 15)
+        self.assertEqual(self.cache.decr('new'), 14)
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry(self):
+        self.cache.set('gone', 1, 0)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 2))
+
+    def test_byte_budget_and_lru(self):
+        """Больше ячеек, чем помещается, не хранится; читанное выживает."""
+        slots = self.cache._sets * self.cache._ways
+        self.cache.set('hot', 'value')
+        for i in range(slots * 3):
+            self.cache.get('hot')
+            self.cache.set(f'key{i}', i)
+        self.assertEqual(self.cache.get('hot'), 'value')
+        stored = sum(
+            self.cache.get(f'key{i}') is not None for i in range(slots * 3))
+        self.assertLess(stored, slots)
+
+    def test_too_large_value_is_not_stored(self):
+        self.cache.set('big', 'old')
+        self.cache.set('big', os.urandom(4096))
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_visible_to_other_process(self):
+        pid = os.fork()
+        if pid == 0:
+            self.make_cache().set('from_child', 'привет')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self.cache.get('from_child'), 'привет')
+
+    def test_instances_share_mapping(self):
+        """Экземпляры потоков не открывают файл заново."""
+        other = self.make_cache()
+        self.cache.get('key')
+        other.get('key')
+        self.assertIs(other._map, self.cache._map)
+        self.assertIs(other._thread_locks, self.cache._thread_locks)
+
+    def test_add_is_atomic_between_threads(self):
+        for attempt in range(20):
+            barrier = threading.Barrier(8)
+            won = []
+
+            def add():
+                cache = self.make_cache()
+                barrier.wait()
+                if cache.add(f'lock{attempt}', 1):
+                    won.append(1)
+
+            threads = [threading.Thread(target=add) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(won), 1)
+
+    def test_other_layout_is_refused(self):
+        self.cache.set('key', 'value')
+        with self.assertRaises(ImproperlyConfigured):
+            self.make_cache(SLOT_SIZE=2048).get('key')
+        # Другой процесс с другими настройками файл не переразмечает
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.make_cache(SLOT_SIZE=2048).get('key')
+            except ImproperlyConfigured:
+                os._exit(0)
+            os._exit(1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+
+LAYERED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'layered-l2',
+    },
+}
+
+
+@override_settings(CACHES=LAYERED_CACHES)
+class LayeredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['l2'].clear()
+        layered._layers.clear()
+        # Экземпляры с разным LOCATION изображают два процесса сервера
+        self.first = self.make_cache('first')
+        self.second = self.make_cache('second')
+
+    def make_cache(self, location, **options):
+        options.setdefault('L2', 'l2')
+        options.setdefault('SYNC_INTERVAL', 0)
+        return LayeredCache(location, {'OPTIONS': options})
+
+    def test_read_through_l2(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        caches['l2'].delete(self.first.make_key('key'))
+        # Значение осталось в L1 второго процесса
+        self.assertEqual(self.second.get('key'), 'value')
+
+    def test_delete_evicts_other_l1(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_journal_overflow_clears_l1(self):
+        first = self.make_cache('small-first', JOURNAL_SIZE=2)
+        second = self.make_cache('small-second', JOURNAL_SIZE=2)
+        second.set('key', 'old')
+        second.get('key')
+        for i in range(5):
+            first.set(f'other{i}', i)
+        caches['l2'].set(caches['l2'].make_key('key'), 'new')
+        cleared = layered.get_stats().get('full_clear', 0)
+        self.assertEqual(second.get('key'), 'new')
+        self.assertEqual(layered.get_stats()['full_clear'], cleared + 1)
+
+    def test_unwritten_journal_slot_clears_l1(self):
+        first = self.make_cache('ring-first', JOURNAL_SIZE=2)
+        second = self.make_cache('ring-second', JOURNAL_SIZE=2)
+        first.set('a', 1)
+        first.set('b', 2)
+        second.set('key', 'old')
+        second.get('key')
+        # Другой процесс увеличил счётчик, но ещё не записал ячейку:
+        # в ней ключ прошлого круга
+        caches['l2'].incr(layered.GENERATION_KEY)
+        caches['l2'].set(caches['l2'].make_key('key'), 'new')
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_l1_is_bounded(self):
+        cache = self.make_cache('bounded', L1_MAX_ENTRIES=2)
+        for i in range(5):
+            cache.set(f'key{i}', i)
+        self.assertEqual(len(cache._l1), 2)
+
+    def test_add_and_incr_are_atomic_in_l2(self):
+        self.assertTrue(self.first.add('counter', 1))
+        self.assertFalse(self.second.add('counter', 5))
+        self.assertEqual(self.second.incr('counter'), 2)
+        self.assertEqual(self.first.get('counter'), 2)
+
+    def test_l1_is_shared_by_threads(self):
+        # Счётчик поколений заведён и сверен
+        self.first.set('warm', 1)
+        self.first.get('warm')
+        self.first.set('key', 'value')
+        caches['l2'].delete(self.first.make_key('key'))
+        # Экземпляр другого потока того же процесса
+        self.assertEqual(self.make_cache('first').get('key'), 'value')
+
+    def test_l1_returns_copies(self):
+        self.first.set('key', {'header': 'old'})
+        self.first.get('key')['header'] = 'changed'
+        self.assertEqual(self.first.get('key'), {'header': 'old'})
+
+
+class ThumbnailKVStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(
+            THUMBNAIL_KVSTORE_PATH=os.path.join(self.directory, 'kv.sqlite3'),
+            THUMBNAIL_KVSTORE_LRU_SIZE=3,
+        )
+        self.settings.enable()
+        self.store = KVStore()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def count_selects(self, store):
+        queries = []
+        store._db().set_trace_callback(
+            lambda sql: sql.startswith('SELECT') and queries.append(sql))
+        return queries
+
+    def test_values_survive_in_file(self):
+        self.store._set_raw('sorl-thumbnail||image||a', 'value')
+        self.assertEqual(KVStore()._get_raw('sorl-thumbnail||image||a'),
+                         'value')
+        self.assertEqual(self.store._find_keys_raw('sorl-thumbnail||image'),
+                         ['sorl-thumbnail||image||a'])
+        self.store._delete_raw('sorl-thumbnail||image||a')
+        self.assertIsNone(KVStore()._get_raw('sorl-thumbnail||image||a'))
+
+    def test_prefetch_is_one_query(self):
+        """Ключи страницы читаются одним запросом, промахи запоминаются."""
+        files = [ImageFile(f'thumb{i}.jpg') for i in range(3)]
+        self.store._set_raw(add_prefix(files[0].key), 'value')
+        store = KVStore()
+        queries = self.count_selects(store)
+        store.prefetch(files)
+        for image_file in files:
+            store._get_raw(add_prefix(image_file.key))
+        self.assertEqual(len(queries), 1)
+
+    def test_miss_is_remembered_briefly(self):
+        """Миниатюру, построенную другим процессом, видно после TTL."""
+        store = KVStore()
+        self.assertIsNone(store._get_raw('key'))
+        self.store._set_raw('key', 'built')
+        self.assertIsNone(store._get_raw('key'))
+        with override_settings(THUMBNAIL_KVSTORE_MISS_TTL=0):
+            store = KVStore()
+        self.assertIsNone(store._get_raw('key2'))
+        self.store._set_raw('key2', 'built')
+        self.assertEqual(store._get_raw('key2'), 'built')
+
+    def test_lru_is_bounded(self):
+        for i in range(5):
+            self.store._set_raw(f'key{i}', str(i))
+        self.store._get_raw('key2')
+        self.store._set_raw('key5', '5')
+        self.assertEqual(list(self.store._lru), ['key4', 'key2', 'key5'])
+        self.assertEqual(self.store._get_raw('key0'), '0')
+
+
+class LoadTestTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(users=10, groups=2, posts=50, follows=20, comments=10,
+                     processes=1)
+
+    def test_seed_sizes(self):
+        data = loadtest.dataset()
+        self.assertEqual(data['users'], 10)
+        self.assertEqual(data['posts'], 50)
+        self.assertEqual(data['comments'], 10)
+
+    def test_report_covers_every_page(self):
+        results = loadtest.run(2, concurrency=1,
+                               user=loadtest.busiest_reader())
+        result = loadtest.report(results, 1.0, loadtest.dataset())
+        names = {name for name, _ in loadtest.targets()}
+        self.assertEqual(set(result['urls']), names)
+        self.assertIn('posts:follow_index', names)
+        self.assertNotIn('users:logout', names)
+        for name, summary in result['urls'].items():
+            with self.subTest(name=name):
+                self.assertEqual(summary['errors'], 0)
+                self.assertEqual(summary['requests'], 2)
+                self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        self.assertGreater(result['peak_rss_bytes'], 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+
+class ServerTimingTest(TestCase):
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_request_has_layers(self):
+        caches['default'].clear()
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            response = self.client.get('/')
+        header = response['Server-Timing']
+        for layer in ('db;', 'template;', 'cache;', 'total;'):
+            with self.subTest(layer=layer):
+                self.assertIn(layer, header)
+        record = logs.records[0]
+        self.assertEqual(record.view, 'posts:posts_basedir_path')
+        self.assertGreater(record.timing['db']['count'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request_has_no_header(self):
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertIsNone(instrumentation.current())
+
+    def test_nested_calls_of_one_layer_count_once(self):
+        timings = instrumentation._local.timings = instrumentation.Timings()
+        try:
+            with instrumentation.timed('cache'):
+                with instrumentation.timed('cache'):
+                    pass
+            with instrumentation.timed('thumbnail'):
+                pass
+        finally:
+            instrumentation._local.timings = None
+        self.assertEqual(timings.layers['cache'][1], 1)
+        self.assertEqual(timings.layers['thumbnail'][1], 1)
+
+
+class QueryStatsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        overridden = override_settings(QUERY_STATS_DIR=self.directory)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        querystats.reset()
+
+    def test_fingerprint_hides_literals_and_in_lists(self):
+        self.assertEqual(
+            querystats.fingerprint(
+                "SELECT * FROM t WHERE a = 'x''y' AND b IN (1, 2, 3)\n"
+                "  AND c = %s LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ? LIMIT ?')
+        self.assertEqual(
+            querystats.fingerprint('SELECT id IN (%s, %s) FROM t2'),
+            querystats.fingerprint('SELECT id IN (%s) FROM t2'))
+
+    def test_requests_are_aggregated_by_view(self):
+        for _ in range(2):
+            self.client.get('/group/missing/')
+        rows = querystats.collect()
+        group = [row for row in rows if 'posts_group' in row['sql']]
+        self.assertEqual(group[0]['count'], 2)
+        self.assertEqual(group[0]['views'], {'posts:group_list': 2})
+        self.assertGreaterEqual(group[0]['max_ms'], 0)
+
+    @override_settings(QUERY_STATS_SLOW_MS=0)
+    def test_slow_queries_are_logged_with_origin(self):
+        with self.assertLogs('core.querystats', 'WARNING') as logs:
+            get_user_model().objects.filter(username='nobody').exists()
+        self.assertIn('core/tests.py', logs.records[0].origin[-1])
+
+    def test_other_processes_are_merged(self):
+        get_user_model().objects.count()
+        querystats.flush()
+        with open(os.path.join(self.directory, '1.json'), 'w') as other:
+            json.dump(querystats.snapshot(), other)
+        row = next(row for row in querystats.collect()
+                   if 'COUNT' in row['sql'])
+        self.assertEqual(row['count'], 2)
+        out = StringIO()
+        call_command('query_stats', '--json', stdout=out)
+        self.assertIn('COUNT', out.getvalue())
+
+    def test_dead_processes_are_merged(self):
+        get_user_model().objects.count()
+        stats = querystats.snapshot()
+        # Два завершившихся процесса с одним pid
+        for name in ('999999999-aa.json', '999999999-bb.json'):
+            with open(os.path.join(self.directory, name), 'w') as other:
+                json.dump(stats, other)
+        querystats.reset()
+        row = next(row for row in querystats.collect()
+                   if 'COUNT' in row['sql'])
+        self.assertEqual(row['count'], 2)
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)
+             if name.endswith('.json')],
+            [querystats.MERGED_NAME])
+        row = next(row for row in querystats.collect()
+                   if 'COUNT' in row['sql'])
+        self.assertEqual(row['count'], 2)
+
+    def test_page_is_for_staff_only(self):
+        user = get_user_model().objects.create(username='staff')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/admin/query-stats/').status_code,
+                         302)
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/admin/query-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['rows'])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        overridden = override_settings(METRICS_DIR=self.directory)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def test_values_survive_reopening_and_growth(self):
+        path = os.path.join(self.directory, 'values.db')
+        values = metrics.MmapValues(path)
+        for number in range(5000):
+            values.add(f'metric{{n="{number}"}}', number)
+        values.add('metric{n="7"}', 0.5)
+        reopened = metrics.read_values(path)
+        self.assertEqual(len(reopened), 5000)
+        self.assertEqual(reopened['metric{n="7"}'], 7.5)
+        metrics.MmapValues(path).set('metric{n="1"}', 10)
+        self.assertEqual(metrics.read_values(path)['metric{n="1"}'], 10)
+
+    def test_other_processes_are_summed(self):
+        metrics.CACHE_REQUESTS.inc(cache='default', result='hit')
+        other = metrics.MmapValues(
+            os.path.join(self.directory, 'counter_1.db'))
+        other.add('yatube_cache_requests_total'
+                  '{cache="default",result="hit"}', 2)
+        # Датчики завершившегося процесса не учитываются
+        dead = metrics.MmapValues(
+            os.path.join(self.directory, 'gauge_999999999.db'))
+        dead.add('yatube_requests_in_flight', 5)
+        totals = metrics.collect()
+        self.assertEqual(
+            totals['yatube_cache_requests_total'
+                   '{cache="default",result="hit"}'], 3)
+        self.assertNotEqual(totals.get('yatube_requests_in_flight'), 5)
+
+    def test_dead_processes_are_merged(self):
+        for pid in (999999998, 999999999):
+            metrics.MmapValues(os.path.join(
+                self.directory, f'counter_{pid}.db')).add('total', 2)
+        metrics.MmapValues(os.path.join(
+            self.directory, 'gauge_999999999.db')).add('in_flight', 1)
+        self.assertEqual(metrics.collect()['total'], 4)
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory)
+                   if name.endswith('.db')
+                   and str(os.getpid()) not in name),
+            [metrics.MERGED_NAME])
+        metrics.MmapValues(os.path.join(
+            self.directory, 'counter_999999997.db')).add('total', 1)
+        self.assertEqual(metrics.collect()['total'], 5)
+
+    def test_merge_closes_merged_file(self):
+        for pid in (999999998, 999999999):
+            values = metrics.MmapValues(os.path.join(
+                self.directory, f'counter_{pid}.db'))
+            values.add('total', 2)
+            values.close()
+        before = len(os.listdir('/proc/self/fd'))
+        metrics.merge_dead(self.directory)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), before)
+
+    def test_cache_proxy_counts_reads(self):
+        cache = InstrumentedCache('probe', {'OPTIONS': {'CACHE': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'probe',
+        }}})
+        cache.set('key', 1)
+        self.assertEqual(cache.get('key'), 1)
+        self.assertEqual(cache.get_many(['key', 'missing']), {'key': 1})
+        totals = metrics.collect()
+        self.assertEqual(totals[
+            'yatube_cache_requests_total{cache="probe",result="hit"}'], 2)
+        self.assertEqual(totals[
+            'yatube_cache_requests_total{cache="probe",result="miss"}'], 1)
+        # Класс кэша не подменён
+        self.assertEqual(LocMemCache.get.__module__, LocMemCache.__module__)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_is_restricted(self):
+        url = reverse('metrics')
+        # Клиент тестов приходит с 127.0.0.1, как запрос через прокси
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_proxied_request_needs_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(
+            url, HTTP_X_FORWARDED_FOR='203.0.113.5').status_code, 403)
+
+    def test_endpoint(self):
+        caches['default'].clear()
+        self.client.get('/')
+        self.client.get('/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn(
+            '# TYPE yatube_request_duration_seconds histogram', text)
+        self.assertIn(
+            'yatube_request_duration_seconds_count'
+            '{view="posts:posts_basedir_path"} 2', text)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:posts_basedir_path",le="+Inf"} 2', text)
+        self.assertIn('yatube_request_queries_sum'
+                      '{view="posts:posts_basedir_path"}', text)
+        self.assertIn(
+            'yatube_cache_requests_total{cache="default",result="hit"}',
+            text)
+        self.assertIn(
+            'yatube_cache_requests_total{cache="default",result="miss"}',
+            text)
+        # Запрос к самим метрикам ещё в обработке
+        self.assertIn('yatube_requests_in_flight 1', text)
+
+    def test_buckets_are_cumulative(self):
+        histogram = metrics.REQUEST_QUERIES
+        histogram.observe(1, view='test')
+        histogram.observe(30, view='test')
+        text = metrics.render(metrics.collect())
+        for le, count in (('0.0', 0), ('1.0', 1), ('20.0', 1),
+                          ('50.0', 2), ('+Inf', 2)):
+            with self.subTest(le=le):
+                self.assertIn(
+                    f'yatube_request_queries_bucket'
+                    f'{{view="test",le="{le}"}} {count}\n', text)
+
+
+class VersionBumpTest(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_bump_repeats_after_commit(self):
+        with transaction.atomic():
+            caching.bump('scope')
+            inside = caching.get_versions(['scope'])[0]
+            # Страница, построенная до фиксации, получит эту версию
+            self.assertEqual(caching.get_versions(['scope'])[0], inside)
+        self.assertGreater(caching.get_versions(['scope'])[0], inside)
+
+    def test_concurrent_bumps_give_distinct_versions(self):
+        caching.bump('scope')
+        start = caching.get_versions(['scope'])[0]
+
+        def bump_many():
+            for _ in range(50):
+                caching.bump('scope')
+
+        with mock.patch.object(caching, '_now_ms', return_value=start):
+            threads = [threading.Thread(target=bump_many) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(caching.get_versions(['scope'])[0], start + 400)
+
+
+class WriteQueueTest(TransactionTestCase):
+    databases = {'default', 'comments'}
+
+    def setUp(self):
+        self.queue = sqlite.WriteQueue(max_batch=3)
+        self.user = get_user_model().objects.create(username='writer')
+
+    def test_writes_are_batched_and_isolated(self):
+        def create(username):
+            return get_user_model().objects.create(username=username).pk
+
+        # Пока писатель занят первой записью, остальные копятся в очереди
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        first = self.queue.submit('default', hold)
+        started.wait(5)
+        futures = [self.queue.submit('default', create, name)
+                   for name in ('a', 'b', 'writer', 'c')]
+        release.set()
+        self.assertIsNone(first.result(5))
+        self.assertEqual(futures[0].result(5), get_user_model().objects.get(
+            username='a').pk)
+        # Повтор имени отменяет только свою запись
+        with self.assertRaises(IntegrityError):
+            futures[2].result(5)
+        futures[3].result(5)
+        self.assertEqual(
+            set(get_user_model().objects.values_list('username', flat=True)),
+            {'writer', 'a', 'b', 'c'})
+        self.assertEqual((self.queue.batches, self.queue.writes), (3, 5))
+
+    def test_transaction_is_opened_in_target_database(self):
+        def state():
+            return (connections['default'].in_atomic_block,
+                    connections['comments'].in_atomic_block)
+
+        self.assertEqual(self.queue.submit('comments', state).result(5),
+                         (False, True))
+        self.assertEqual(self.queue.submit('default', state).result(5),
+                         (True, False))
+
+    @override_settings(WRITE_QUEUE_ENABLED=True)
+    def test_follow_goes_through_queue(self):
+        author = get_user_model().objects.create(username='author')
+        self.client.force_login(self.user)
+        writes = sqlite.write_queue.writes
+        self.client.get(reverse('posts:profile_follow', args=['author']))
+        self.assertTrue(Follow.objects.filter(
+            user=self.user, author=author).exists())
+        self.assertEqual(sqlite.write_queue.writes, writes + 1)
+
+
+SPLIT = {
+    'posts.comment': 'comments',
+    'posts.follow': 'follows',
+    'sessions.session': 'sessions',
+}
+
+
+class SplitDatabasesTest(TestCase):
+    databases = {'default', 'comments', 'follows', 'sessions'}
+
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.post = Post.objects.create(author=self.author, text='пост')
+
+    def split(self):
+        overridden = override_settings(DATABASE_MODELS=SPLIT)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def test_transfer_moves_rows(self):
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='старый')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.split()
+        out = StringIO()
+        call_command('split_databases', stdout=out)
+        self.assertIn(
+            'posts.comment -> comments: скопировано 1', out.getvalue())
+        self.assertEqual(
+            Comment.objects.using('comments').get().text, 'старый')
+        self.assertFalse(Comment.objects.using('default').exists())
+        self.assertTrue(Follow.objects.using('follows').filter(
+            user=self.reader, author=self.author).exists())
+        # Повторный перенос ничего не дублирует
+        call_command('split_databases', stdout=StringIO())
+        self.assertEqual(Comment.objects.using('comments').count(), 1)
+
+    def test_transfer_keeps_rows_with_taken_keys(self):
+        old = Comment.objects.create(
+            post=self.post, author=self.reader, text='старый')
+        self.split()
+        # Новый комментарий в своей базе получил тот же ключ
+        Comment.objects.using('comments').create(
+            pk=old.pk, post=self.post, author=self.author, text='новый')
+        with self.assertRaises(CommandError):
+            call_command('split_databases', stdout=StringIO())
+        self.assertEqual(
+            Comment.objects.using('default').get(pk=old.pk).text, 'старый')
+        self.assertEqual(
+            Comment.objects.using('comments').get(pk=old.pk).text, 'новый')
+
+    def test_pages_read_across_databases(self):
+        self.split()
+        self.client.force_login(self.reader)
+        self.client.post(reverse('posts:add_comment', args=[self.post.pk]),
+                         {'text': 'новый комментарий'})
+        self.client.get(reverse('posts:profile_follow', args=['author']))
+        self.assertEqual(Comment.objects.using('comments').count(), 1)
+        self.assertEqual(Follow.objects.using('follows').count(), 1)
+        self.assertTrue(FeedEntry.objects.filter(user=self.reader).exists())
+        caches['default'].clear()
+        # Из базы комментариев — один запрос, авторы читаются из default
+        with self.assertNumQueries(1, using='comments'):
+            response = self.client.get(
+                reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertContains(response, 'новый комментарий')
+        self.assertContains(response, 'reader')
+        data = self.client.get(
+            reverse('api:comment_list', args=[self.post.pk])).json()
+        self.assertEqual(data['results'][0]['author'], 'reader')
+        self.assertEqual(feed.pull_authors(self.reader), [])
+
+    def test_rebuilds_and_cleanup_across_databases(self):
+        self.split()
+        Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=self.post, author=self.reader, text='к')
+        FeedEntry.objects.all().delete()
+        Post.objects.filter(pk=self.post.pk).update(comment_count=0)
+        feed.rebuild()
+        self.assertEqual(stats.rebuild_comment_counts(), 1)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post=self.post).exists())
+        # Каскада между базами нет: зависимые строки удаляют сигналы
+        self.reader.delete()
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaTest(TransactionTestCase):
+    # В тестах реплика — зеркало default (TEST['MIRROR'])
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        replicas._checked.clear()
+        replicas.beat()
+        self.user = get_user_model().objects.create(username='reader')
+        get_user_model().objects.create(username='author')
+        self.client.force_login(self.user)
+
+    def replica_queries(self, url):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # Без проверки отставания самой реплики
+        return len([query for query in queries
+                    if 'core_heartbeat' not in query['sql']])
+
+    def test_heavy_views_read_from_replica(self):
+        self.assertGreater(
+            self.replica_queries(reverse('posts:follow_index')), 0)
+        self.assertEqual(self.replica_queries(
+            reverse('posts:post_detail', args=[
+                Post.objects.create(author=self.user, text='пост').pk])), 0)
+        self.assertIsNone(replicas.current())
+
+    def test_own_write_pins_to_primary(self):
+        self.client.get(reverse('posts:profile_follow', args=['author']))
+        self.assertGreater(
+            self.client.session[replicas.SESSION_KEY], time.time())
+        self.assertEqual(
+            self.replica_queries(reverse('posts:follow_index')), 0)
+        with override_settings(REPLICA_PIN_SECONDS=-1):
+            self.client.get(
+                reverse('posts:profile_unfollow', args=['author']))
+        self.assertGreater(
+            self.replica_queries(reverse('posts:follow_index')), 0)
+
+    def test_lagging_replica_is_skipped(self):
+        Heartbeat.objects.update(beat_at=time.time() - 3600)
+        replicas._checked.clear()
+        self.assertEqual(
+            self.replica_queries(reverse('posts:follow_index')), 0)
+
+    def test_page_newer_than_replica_uses_primary(self):
+        # Версия главной появилась после отметки реплики
+        Post.objects.create(author=self.user, text='пост')
+        self.assertEqual(
+            self.replica_queries(reverse('posts:posts_basedir_path')), 0)
+
+    def test_requests_do_not_write_heartbeat(self):
+        Heartbeat.objects.update(beat_at=0)
+        with override_settings(REPLICA_HEARTBEAT_INTERVAL=0), \
+                CaptureQueriesContext(connections['default']) as queries:
+            self.client.get(reverse('posts:follow_index'))
+        self.assertFalse([query for query in queries
+                          if 'core_heartbeat' in query['sql']])
+        call_command('replica_heartbeat', '--once')
+        self.assertGreater(Heartbeat.objects.get().beat_at, time.time() - 60)
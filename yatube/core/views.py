@@ -2,8 +2,14 @@
 
 # Create your views here.
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 
+from core import querystats
+
+QUERY_STATS_ROWS = 100
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -17,3 +23,13 @@ def csrf_failure(request, reason=''):
 
 def code_500(request):
     return render(request, 'core/500.html', status=500)
+
+
+@staff_member_required
+def query_stats(request):
+    # Самые дорогие по суммарному времени запросы всех процессов
+    context = {
+        'rows': querystats.collect()[:QUERY_STATS_ROWS],
+        'slow_ms': settings.QUERY_STATS_SLOW_MS,
+    }
+    return render(request, 'core/query_stats.html', context)
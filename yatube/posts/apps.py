@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей
+        import posts.signals  # noqa: F401
+        from posts.search import install_after_migrate
+        # SQLite теряет триггеры поиска, когда миграция пересоздаёт таблицу
+        post_migrate.connect(install_after_migrate, sender=self)
@@ -0,0 +1,80 @@
+"""Области кэша страниц приложения posts.
+
+Функции *_scopes получают аргументы представления и возвращают
+области, от которых зависит страница; post_scopes и прочие — области,
+которые надо сбросить при изменении объекта. Здесь же кэш строк
+групп, которые читаются на каждой странице группы.
+"""
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import get_object_or_404
+
+from posts.models import Group, Post
+
+GROUP_KEY = 'group-object:{}'
+
+
+def _group_key(slug):
+    return GROUP_KEY.format(quote(slug))
+
+
+def cached_group(slug):
+    """Группа по слагу; строки групп читаются часто, а меняются редко."""
+    cache = caches[settings.POSTS_CACHE_ALIAS]
+    group = cache.get(_group_key(slug))
+    if group is None:
+        group = get_object_or_404(Group, slug=slug)
+        cache.set(_group_key(slug), group, settings.POSTS_CACHE_TIMEOUT)
+    return group
+
+
+def forget_group(*slugs):
+    caches[settings.POSTS_CACHE_ALIAS].delete_many(
+        [_group_key(slug) for slug in slugs])
+
+
+def index_scopes(request):
+    return ['index']
+
+
+def group_scopes(request, slug):
+    return [f'group:{slug}']
+
+
+def groups_scopes(request):
+    return ['groups']
+
+
+def profile_scopes(request, username):
+    # Посты профиля показывают названия групп; группы меняются редко,
+    # поэтому зависим от всего списка групп, а не от каждой
+    return [f'profile:{username}', 'groups']
+
+
+def detail_scopes(request, post_id):
+    # Страница поста показывает и число постов автора, и название группы
+    username = (
+        Post.objects.filter(pk=post_id)
+        .values_list('author__username', flat=True)
+        .first()
+    )
+    return [f'post:{post_id}', f'profile:{username}', 'groups']
+
+
+def comments_scopes(request, post_id):
+    return [f'post:{post_id}']
+
+
+def post_scopes(post):
+    scopes = ['index', f'post:{post.pk}', f'profile:{post.author.username}']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group.slug}')
+    return scopes
+
+
+def group_change_scopes(group):
+    # Ссылки на группу есть в ленте главной страницы, а от списка групп
+    # зависят API, профили и страницы постов
+    return ['index', 'groups', f'group:{group.slug}']
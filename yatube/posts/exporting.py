@@ -0,0 +1,128 @@
+"""Потоковая выгрузка постов и комментариев пользователя.
+
+Строки читаются из базы через iterator() пачками по EXPORT_CHUNK_SIZE и
+сразу отдаются наружу, поэтому память не зависит от числа постов.
+Формат строк совпадает с тем, что читает import_content: выгрузку
+можно загрузить обратно (--kind auto). ZIP собирается на лету (zipfile
+умеет писать в поток без seek) и кроме JSONL содержит сами картинки
+постов.
+"""
+import json
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.models import Comment, Post
+
+EXPORT_CHUNK_SIZE = 2000
+# Картинки копируются в архив такими кусками
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False, cls=DjangoJSONEncoder)
+            + '\n').encode()
+
+
+def _posts(user):
+    return (
+        Post.objects.filter(author=user)
+        .order_by('pk')
+        .values('pk', 'text', 'group__slug', 'pub_date', 'image')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def post_records(user):
+    for post in _posts(user):
+        image = post['image']
+        yield {
+            'id': post['pk'],
+            'text': post['text'],
+            'author': user.username,
+            'group': post['group__slug'],
+            'pub_date': post['pub_date'],
+            'image': image,
+            'image_url': default_storage.url(image) if image else None,
+        }
+
+
+def comment_records(user):
+    comments = (
+        Comment.objects.filter(author=user)
+        .order_by('pk')
+        .values('pk', 'post_id', 'text', 'created')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for comment in comments:
+        yield {
+            'id': comment['pk'],
+            'post': comment['post_id'],
+            'author': user.username,
+            'text': comment['text'],
+            'created': comment['created'],
+        }
+
+
+def export_jsonl(user):
+    """Посты, затем комментарии; у каждой строки есть поле type."""
+    for kind, records in (('post', post_records),
+                          ('comment', comment_records)):
+        for record in records(user):
+            yield _line({'type': kind, **record})
+
+
+class _Pipe:
+    """Файл для zipfile, из которого записанное забирается по частям."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Записанное с прошлого вызова (ноль или один кусок)."""
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks.clear()
+            yield data
+
+
+def export_zip(user):
+    """ZIP с posts.jsonl, comments.jsonl и картинками в images/."""
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, records in (('posts.jsonl', post_records),
+                              ('comments.jsonl', comment_records)):
+            with archive.open(name, 'w', force_zip64=True) as entry:
+                for record in records(user):
+                    entry.write(_line(record))
+                    yield from pipe.drain()
+        images = (
+            Post.objects.filter(author=user).exclude(image='')
+            .order_by('pk').values_list('image', flat=True)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        for image in images:
+            try:
+                source = default_storage.open(image, 'rb')
+            except OSError:
+                continue
+            with source, archive.open(
+                    f'images/{image}', 'w', force_zip64=True) as entry:
+                for chunk in iter(lambda: source.read(FILE_CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    yield from pipe.drain()
+    yield from pipe.drain()
+
+
+FORMATS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson'),
+    'zip': (export_zip, 'application/zip'),
+}
@@ -0,0 +1,179 @@
+"""Лента подписок.
+
+Новый пост раскладывается по «входящим» (FeedEntry) всех подписчиков
+автора. У авторов, на которых подписано больше FEED_FANOUT_LIMIT
+человек, посты не раскладываются, а подтягиваются при чтении ленты.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Q
+
+from core.routers import in_values, same_database
+from posts.models import FeedEntry, Follow, Post, UserStats
+
+FEED_ORDERING = ('-feed_date', '-feed_post_id')
+
+
+def _followers(author_id):
+    """Список подписчиков или None, если автор читается из ленты напрямую."""
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        return None
+    return followers
+
+
+def fan_out(post):
+    """Разложить новый пост по лентам подписчиков автора."""
+    followers = _followers(post.author_id)
+    if not followers:
+        return
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Положить в ленту последние посты автора после подписки."""
+    if _followers(author_id) is None:
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('pk', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(chunk_size=500):
+    """Дозаполнить ленты по всем подпискам, например после импорта.
+
+    Вместо backfill на каждую подписку — один INSERT ... SELECT на пачку
+    авторов: последние FEED_BACKFILL_SIZE постов автора раскладываются
+    всем его подписчикам. Авторы, которых лента читает напрямую,
+    пропускаются, как и в backfill. Если подписки в другой базе,
+    подписчики пачки читаются отдельно, а строки ленты пишутся пачкой.
+    """
+    author_ids = list(
+        Follow.objects.values('author_id')
+        .annotate(followers=Count('pk'))
+        .filter(followers__lte=settings.FEED_FANOUT_LIMIT)
+        .order_by('author_id')
+        .values_list('author_id', flat=True)
+    )
+    joined = same_database(Follow, FeedEntry)
+    for start in range(0, len(author_ids), chunk_size):
+        chunk = author_ids[start:start + chunk_size]
+        params = chunk + [settings.FEED_BACKFILL_SIZE]
+        with connection.cursor() as cursor:
+            if joined:
+                cursor.execute(_rebuild_sql(len(chunk)), params)
+                continue
+            followers = {}
+            for user_id, author_id in Follow.objects.filter(
+                    author_id__in=chunk).values_list('user_id', 'author_id'):
+                followers.setdefault(author_id, []).append(user_id)
+            cursor.execute(
+                f'SELECT id, author_id, pub_date '
+                f'FROM ({_latest_sql(len(chunk))}) p WHERE p.n <= %s',
+                params)
+            cursor.executemany(_insert_sql(), [
+                (user_id, post_id, author_id, pub_date)
+                for post_id, author_id, pub_date in cursor.fetchall()
+                for user_id in followers.get(author_id, ())
+            ])
+
+
+def _latest_sql(authors):
+    """Посты авторов с номером n от последнего поста автора."""
+    ops = connection.ops
+    return (
+        f"SELECT id, author_id, pub_date, ROW_NUMBER() OVER ("
+        f"PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS n "
+        f"FROM {ops.quote_name(Post._meta.db_table)} "
+        f"WHERE author_id IN ({', '.join(['%s'] * authors)})"
+    )
+
+
+def _insert_sql(select=None):
+    ops = connection.ops
+    return (
+        f"{ops.insert_statement(ignore_conflicts=True)} "
+        f"{ops.quote_name(FeedEntry._meta.db_table)} "
+        f"(user_id, post_id, author_id, pub_date) "
+        f"{select or 'VALUES (%s, %s, %s, %s)'} "
+        f"{ops.ignore_conflicts_suffix_sql(True)}"
+    )
+
+
+def _rebuild_sql(authors):
+    ops = connection.ops
+    return _insert_sql(
+        f"SELECT f.user_id, p.id, p.author_id, p.pub_date "
+        f"FROM {ops.quote_name(Follow._meta.db_table)} f "
+        f"JOIN ({_latest_sql(authors)}) p "
+        f"ON p.author_id = f.author_id "
+        f"WHERE p.n <= %s"
+    )
+
+
+def pull_authors(user):
+    """Авторы с большим числом подписчиков, которых читаем напрямую."""
+    return list(
+        UserStats.objects.filter(
+            user_id__in=in_values(
+                Follow.objects.filter(user=user)
+                .values_list('author_id', flat=True), UserStats),
+            followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def feed_posts(user):
+    """Посты ленты подписок пользователя, новые сверху.
+
+    Порядок задают аннотации из FEED_ORDERING. Если всё раскладывается
+    по лентам, они берутся из FeedEntry, и страница читается по индексу
+    ленты без сортировки; иначе это дата и id самого поста.
+    """
+    posts = Post.objects.select_related('author', 'group')
+    authors = pull_authors(user)
+    if authors:
+        posts = posts.filter(
+            Q(pk__in=FeedEntry.objects.filter(user=user).values('post'))
+            | Q(author_id__in=authors)
+        ).annotate(feed_date=F('pub_date'), feed_post_id=F('id'))
+    else:
+        posts = posts.filter(feed_entries__user=user).annotate(
+            feed_date=F('feed_entries__pub_date'),
+            feed_post_id=F('feed_entries__post_id'),
+        )
+    return posts.order_by(*FEED_ORDERING)
@@ -1,4 +1,5 @@
 from django import forms
+from posts.images import apply_variants, delete_variants, parse_variants
 from posts.models import Post, Comment
 
 
@@ -11,6 +12,20 @@ class PostForm(forms.ModelForm):
         help_texts = {'text': 'Пишем самое умное здесь',
                       'group': 'Здесь выбираем подходящую группу'}
 
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        stale = None
+        if 'image' in self.changed_data:
+            stale = post.image_key, parse_variants(post)
+            # Размеры для страниц готовим сейчас, а не при первом показе
+            apply_variants(post, self.cleaned_data.get('image'))
+        if commit:
+            post.save()
+            if stale is not None:
+                # Старые файлы убираем только после сохранения новых
+                delete_variants(*stale)
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,174 @@
+"""Варианты картинки поста, которые готовятся при сохранении формы.
+
+Картинка один раз обрезается до пропорций ленты и сохраняется в
+нескольких ширинах (WebP, если Pillow его поддерживает, и JPEG) без
+EXIF. Страницы потом только ссылаются на готовые файлы через srcset и
+никогда не открывают Pillow во время запроса. Старые посты без
+вариантов показываются миниатюрой sorl.
+"""
+import logging
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import features, Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.instrumentation import timed
+from core.metrics import THUMBNAIL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+VARIANT_NAME = 'posts/variants/{key}/{width}.{extension}'
+FORMATS = {
+    # формат: (расширение, mime-тип, параметры сохранения)
+    'webp': ('webp', 'image/webp', {'format': 'WEBP', 'method': 4}),
+    'jpeg': ('jpg', 'image/jpeg', {'format': 'JPEG', 'optimize': True,
+                                   'progressive': True}),
+}
+# Миниатюра sorl для постов, сохранённых до появления вариантов
+LEGACY_GEOMETRY = '960x339'
+LEGACY_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def available_formats():
+    return [
+        name for name in ('webp', 'jpeg')
+        if name != 'webp' or features.check('webp')
+    ]
+
+
+def variant_name(key, width, image_format):
+    extension = FORMATS[image_format][0]
+    return VARIANT_NAME.format(key=key, width=width, extension=extension)
+
+
+def _flatten(image):
+    """RGB без прозрачности: у JPEG нет альфа-канала."""
+    if image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+@timed('thumbnail')
+@THUMBNAIL_SECONDS.time(source='variants')
+def build_variants(image_file):
+    """Сохранить варианты картинки и вернуть поля для модели Post."""
+    image_file.seek(0)
+    with Image.open(image_file) as source:
+        # Поворот из EXIF применяем до того, как EXIF будет выброшен
+        image = _flatten(ImageOps.exif_transpose(source))
+    image_file.seek(0)
+    ratio_width, ratio_height = settings.POST_IMAGE_RATIO
+    key = uuid.uuid4().hex
+    formats = available_formats()
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    for width in widths:
+        height = round(width * ratio_height / ratio_width)
+        variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for image_format in formats:
+            buffer = BytesIO()
+            options = FORMATS[image_format][2]
+            # exif не передаём: метаданные в варианты не попадают
+            variant.save(buffer, quality=settings.POST_IMAGE_QUALITY,
+                         **options)
+            default_storage.save(variant_name(key, width, image_format),
+                                 ContentFile(buffer.getvalue()))
+    return {
+        'image_key': key,
+        'image_widths': ','.join(str(width) for width in widths),
+        'image_formats': ','.join(formats),
+        'image_width': widths[-1],
+        'image_height': round(widths[-1] * ratio_height / ratio_width),
+    }
+
+
+def empty_variants():
+    return {
+        'image_key': '',
+        'image_widths': '',
+        'image_formats': '',
+        'image_width': None,
+        'image_height': None,
+    }
+
+
+def apply_variants(post, image_file):
+    """Заполнить поля вариантов поста; ошибка Pillow не мешает посту."""
+    fields = empty_variants()
+    if image_file:
+        try:
+            fields = build_variants(image_file)
+        except Exception:
+            logger.exception('Не удалось подготовить картинку поста')
+    for name, value in fields.items():
+        setattr(post, name, value)
+
+
+def delete_variants(key, variants):
+    """Удалить файлы вариантов, которые заменила новая картинка."""
+    if not key or variants is None:
+        return
+    widths, formats = variants
+    for width in widths:
+        for image_format in formats:
+            try:
+                default_storage.delete(variant_name(key, width, image_format))
+            except OSError:
+                logger.warning('Не удалось удалить вариант %s', key,
+                               exc_info=True)
+
+
+def parse_variants(post):
+    """Ширины и форматы готовых вариантов или None, если их нет."""
+    try:
+        widths = [int(width) for width in post.image_widths.split(',')]
+    except ValueError:
+        return None
+    formats = post.image_formats.split(',')
+    if not post.image_key or not all(name in FORMATS for name in formats):
+        return None
+    return widths, formats
+
+
+def legacy_thumbnail_file(image):
+    """Файл миниатюры sorl для картинки, без чтения картинки и хранилища.
+
+    Имя считается так же, как в ThumbnailBackend.get_thumbnail.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(LEGACY_OPTIONS)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, LEGACY_GEOMETRY, options)
+    return ImageFile(name, default.storage)
+
+
+def prefetch_images(posts):
+    """Загрузить ключи миниатюр старых постов страницы одним запросом."""
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'prefetch'):
+        return
+    files = [
+        legacy_thumbnail_file(post.image)
+        for post in posts
+        if post.image and parse_variants(post) is None
+    ]
+    if files:
+        kvstore.prefetch(files)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core.caching import bump
+from posts.caching import post_scopes
+from posts.images import apply_variants
+from posts.models import Post
+
+VARIANT_FIELDS = ('image_key', 'image_widths', 'image_formats',
+                  'image_width', 'image_height')
+
+
+class Command(BaseCommand):
+    help = 'Готовит варианты картинок для постов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        posts = (
+            Post.objects.exclude(image='').filter(image_key='')
+            .select_related('author', 'group')
+            .only('pk', 'image', 'author__username', 'group__slug')
+        )
+        done = 0
+        for post in posts.iterator(chunk_size=options['chunk_size']):
+            try:
+                post.image.open('rb')
+            except (OSError, ValueError):
+                self.stderr.write(f'Нет файла картинки поста {post.pk}')
+                continue
+            with post.image:
+                apply_variants(post, post.image)
+            if post.image_key:
+                # update() не шлёт сигналов: версии страниц поста
+                # поднимаем сами, иначе кэш ещё часы отдаёт миниатюру sorl
+                Post.objects.filter(pk=post.pk).update(
+                    **{name: getattr(post, name) for name in VARIANT_FIELDS})
+                bump(*post_scopes(post))
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Подготовлены картинки постов: {done}'))
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exporting import FORMATS
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты и комментарии пользователя в JSONL или ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=list(FORMATS),
+                            default='jsonl')
+        parser.add_argument('--output', default='-',
+                            help='Файл выгрузки; «-» — стандартный вывод')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден')
+        generate, _ = FORMATS[options['format']]
+        if options['output'] == '-':
+            self._write(generate(user), sys.stdout.buffer)
+            return
+        with open(options['output'], 'wb') as target:
+            self._write(generate(user), target)
+        self.stderr.write(f'Выгрузка сохранена в {options["output"]}')
+
+    @staticmethod
+    def _write(chunks, target):
+        for chunk in chunks:
+            target.write(chunk)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importing import (
+    AUTO, MODELS, CheckpointMismatch, finalize, import_file,
+)
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты, комментарии или подписки из JSONL/CSV '
+            'пачками с продолжением с контрольной точки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv')
+        parser.add_argument(
+            '--kind', choices=[*MODELS, AUTO], required=True,
+            help='Вид строк: строки с полем type другого вида '
+                 'пропускаются; auto берёт вид каждой строки из type, '
+                 'как в выгрузке записей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки (по умолчанию <path>.checkpoint)')
+        parser.add_argument(
+            '--no-finalize', action='store_true',
+            help='Не пересчитывать счётчики, ленты и кэш (для импорта '
+                 'нескольких файлов подряд: пересчёт нужен после последнего)')
+
+    def handle(self, *args, **options):
+        def report(rows, rate):
+            self.stdout.write(f'{rows} строк, {rate:,.0f} строк/с')
+
+        try:
+            saved, skipped = import_file(
+                options['path'], options['kind'],
+                batch_size=options['batch_size'],
+                checkpoint=options['checkpoint'],
+                report=report,
+            )
+        except (OSError, ValueError, KeyError, CheckpointMismatch) as error:
+            raise CommandError(f'Импорт остановлен: {error!r}')
+        if not options['no_finalize']:
+            finalize()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {saved}, пропущено: {skipped}'))
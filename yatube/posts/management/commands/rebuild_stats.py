@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import rebuild, rebuild_comment_counts
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает статистику пользователей и число комментариев '
+            'постов и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько пользователей пересчитывать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        fixed = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено строк статистики: {fixed}'))
+        fixed = rebuild_comment_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков комментариев: {fixed}'))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.seeding import BATCH_SIZE, seed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='За сколько дней до сегодня начинать посты')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно: одинаковое зерно — одинаковые данные')
+        parser.add_argument('--processes', type=int,
+                            help='Процессов для текстов (по умолчанию — '
+                                 'по числу ядер)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        def report(rows, rate):
+            self.stdout.write(f'{rows} постов, {rate:,.0f} постов/с')
+
+        started = time.monotonic()
+        seed(
+            users=options['users'], groups=options['groups'],
+            posts=options['posts'], follows=options['follows'],
+            comments=options['comments'], random_seed=options['seed'],
+            days=options['days'], processes=options['processes'],
+            batch_size=options['batch_size'], report=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    Comment = apps.get_model('posts', 'Comment')
+    UserStats = apps.get_model('posts', 'UserStats')
+    counters = {
+        'posts_count': (Post, 'author_id'),
+        'followers_count': (Follow, 'author_id'),
+        'following_count': (Follow, 'user_id'),
+        'comments_count': (Comment, 'author_id'),
+    }
+    # Все запросы в базу миграции: роутер отправил бы подписки и
+    # комментарии в их базы
+    db = schema_editor.connection.alias
+    stats = {
+        user_id: UserStats(user_id=user_id)
+        for user_id in User.objects.using(db).values_list('pk', flat=True)
+    }
+    for field, (model, column) in counters.items():
+        rows = model.objects.using(db).values_list(column).annotate(
+            n=Count('pk')).order_by()
+        for user_id, n in rows:
+            if user_id in stats:
+                setattr(stats[user_id], field, n)
+    UserStats.objects.using(db).bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_post_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
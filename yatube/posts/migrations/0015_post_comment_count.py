@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:23
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_comment_counts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    # Все запросы в базу миграции: роутер отправил бы комментарии в их базу
+    db = schema_editor.connection.alias
+    rows = (
+        Comment.objects.using(db).exclude(post=None)
+        .values_list('post_id')
+        .annotate(n=Count('pk'))
+        .order_by()
+    )
+    for post_id, n in rows:
+        Post.objects.using(db).filter(pk=post_id).update(comment_count=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='comment_post_created_idx'),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+    ]
@@ -40,34 +40,77 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    # Готовые варианты картинки (см. posts.images): каталог, ширины,
+    # форматы и размеры самого крупного варианта
+    image_key = models.CharField(max_length=32, blank=True, editable=False)
+    image_widths = models.CharField(
+        max_length=64, blank=True, editable=False)
+    image_formats = models.CharField(
+        max_length=32, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    # Число комментариев; поддерживается сигналами Comment (posts.stats)
+    comment_count = models.PositiveIntegerField(
+        'Комментариев', default=0, editable=False)
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            # Ключ постраничного вывода по курсору
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_id_idx'
+            ),
+            # Страницы автора и группы: отбор и порядок по одному индексу
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
 class Comment(models.Model):
+    # Комментарии и подписки могут жить в отдельной базе (core.routers),
+    # поэтому внешних ключей в самой базе нет
     post = models.ForeignKey(
         Post,
         null=True,
         related_name='comments',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     author = models.ForeignKey(
         User,
         null=True,
         related_name='comments',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     text = models.TextField()
     created = models.DateTimeField(
         auto_now_add=True
     )
 
+    class Meta:
+        indexes = [
+            # Комментарии поста по курсору, от старых к новым
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -76,12 +119,14 @@ class Follow (models.Model):
     user = models.ForeignKey(
         User,
         related_name='follower',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     author = models.ForeignKey(
         User,
         related_name='following',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
 
     class Meta:
@@ -97,3 +142,102 @@ class Follow (models.Model):
                 name='author_not_user'
             ),
         ]
+
+
+class FeedEntry(models.Model):
+    """Строка «входящих» ленты подписок: пост автора у его подписчика."""
+    user = models.ForeignKey(
+        User,
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    # Автор и дата дублируются из поста, чтобы чистка ленты при отписке
+    # и сортировка обходились индексами без join
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            # Порядок страницы ленты совпадает с порядком индекса
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_date_post_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые держим в актуальном виде сигналами."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class SearchField(models.TextField):
+    """Колонка таблицы FTS5: поддерживает lookup match."""
+
+
+@SearchField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class PostSearch(models.Model):
+    """Полнотекстовый индекс постов — виртуальная таблица FTS5.
+
+    Таблицу и триггеры, которые держат её в согласии с posts_post,
+    создаёт posts.search.install; rank есть только в запросе с MATCH.
+    """
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+        on_delete=models.DO_NOTHING
+    )
+    text = SearchField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
@@ -0,0 +1,114 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — внешняя таблица FTS5 (content=posts_post): текст в ней не
+дублируется, а триггеры на вставку, изменение и удаление поста сразу
+обновляют индекс, в том числе при bulk_create и update(). Миграция
+таблицы в SQLite пересоздаёт её и теряет триггеры, поэтому install
+вызывается и после каждого migrate: недостающее создаётся заново, а
+индекс перестраивается.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TRIGGERS = (
+    'posts_post_fts_insert', 'posts_post_fts_delete', 'posts_post_fts_update')
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"text, content='posts_post', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {TRIGGERS[0]} "
+    f"AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {TRIGGERS[1]} "
+    f"AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {TRIGGERS[2]} "
+    f"AFTER UPDATE OF text ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+)
+# Отрывок с совпадениями; метки — управляющие символы, которых нет в
+# тексте, чтобы экранировать текст до вставки <mark>
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET = f"snippet({FTS_TABLE}, 0, char(2), char(3), '…', 32)"
+TERM = re.compile(r'\w+')
+MAX_TERMS = 16
+
+
+def install(connection):
+    """Создать индекс и триггеры, если их нет, и заполнить индекс."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND name IN (%s, %s, %s)", TRIGGERS)
+        if len(cursor.fetchall()) == len(TRIGGERS):
+            return
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        # Пока триггеров не было, изменения постов в индекс не попадали
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def install_after_migrate(sender, using, **kwargs):
+    # В базах только для комментариев или подписок постов нет
+    if router.allow_migrate_model(using, Post):
+        install(connections[using])
+
+
+def fts_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова, последнее — префикс.
+
+    Каждое слово берётся в кавычки, так что синтаксис FTS5 (NEAR, OR,
+    скобки) из ввода не исполняется и не вызывает ошибок.
+    """
+    terms = TERM.findall(text)[:MAX_TERMS]
+    if not terms:
+        return ''
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def filter_posts(queryset, text):
+    """Посты из queryset, в тексте которых есть все слова запроса."""
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+    return queryset.filter(search_index__text__match=query)
+
+
+def search_posts(queryset, text):
+    """Найденные посты с рангом search_rank (меньше — лучше) и отрывком."""
+    return filter_posts(queryset, text).annotate(
+        search_rank=F('search_index__rank'),
+        search_snippet=RawSQL(SNIPPET, ()),
+    )
+
+
+def highlight(snippet):
+    """HTML отрывка: текст экранирован, совпадения — в <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
@@ -0,0 +1,309 @@
+"""Генерация больших синтетических данных для нагрузочных прогонов.
+
+Пользователи и группы создаются bulk_create, а посты, комментарии и
+подписки пишутся сырым executemany пачками, каждая в своей транзакции.
+Тексты собираются из набора предложений Faker в нескольких процессах:
+пачка постов строится в своём процессе со своим генератором случайных
+чисел, поэтому результат зависит только от зерна, а не от числа
+процессов. id постов задаются явно, так что комментарии к пачке
+строятся вместе с ней и Post.comment_count сразу верный.
+
+Распределения: число постов растёт со временем и зависит от времени
+суток, пишут и собирают подписчиков в основном немногие популярные
+авторы (степенной закон).
+"""
+import math
+import multiprocessing
+import os
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection, connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts import feed, search, stats
+from posts.models import Comment, FeedEntry, Follow, Group, Post, User
+
+BATCH_SIZE = 20000
+SENTENCE_POOL_SIZE = 5000
+# Во сколько раз постов в последний день больше, чем в первый: e^GROWTH
+GROWTH = 3
+# Относительная активность по часам суток (UTC)
+HOUR_WEIGHTS = (
+    3, 2, 1, 1, 1, 1, 2, 4, 6, 7, 7, 7,
+    8, 8, 7, 7, 7, 8, 9, 10, 10, 9, 7, 5,
+)
+# Чем больше показатель, тем сильнее всё сосредоточено у первых
+# пользователей: при 3 десятая часть авторов пишет почти половину постов
+AUTHOR_SKEW = 3
+COMMENTER_SKEW = 2
+FOLLOW_SKEW = 4
+GROUP_SKEW = 2
+NO_GROUP_SHARE = 0.3
+# Среднее время от поста до комментария
+COMMENT_DELAY = 6 * 3600
+# На время загрузки: без fsync и с журналом в памяти
+LOADING_PRAGMAS = {
+    'synchronous': 'OFF',
+    'journal_mode': 'MEMORY',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',
+}
+POST_COLUMNS = (
+    'id', 'text', 'pub_date', 'author', 'group', 'image', 'image_key',
+    'image_widths', 'image_formats', 'comment_count',
+)
+COMMENT_COLUMNS = ('post', 'author', 'text', 'created')
+FOLLOW_COLUMNS = ('user', 'author')
+SEEDED_MODELS = (User, Group, Post, Comment, Follow, FeedEntry)
+
+# Состояние процесса-генератора (заполняет _init_worker)
+_state = {}
+
+
+def _skewed(rng, items, skew):
+    return items[int(len(items) * rng.random() ** skew)]
+
+
+def _insert_sql(model, names):
+    ops = connection.ops
+    columns = [model._meta.get_field(name).column for name in names]
+    return (
+        f"{ops.insert_statement(ignore_conflicts=True)} "
+        f"{ops.quote_name(model._meta.db_table)} "
+        f"({', '.join(ops.quote_name(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"{ops.ignore_conflicts_suffix_sql(True)}"
+    )
+
+
+def _write(sql, rows, model=Post):
+    using = router.db_for_write(model)
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+@contextmanager
+def _pragmas(connection):
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Внутри транзакции журнал и synchronous не переключаются
+        yield
+        return
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in LOADING_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}')
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def loading_pragmas():
+    """Настройки SQLite для быстрой загрузки; потом прежние значения.
+
+    Меняются во всех базах, куда пишет seed (см. core.routers).
+    """
+    aliases = {router.db_for_write(model) for model in SEEDED_MODELS}
+    with ExitStack() as stack:
+        for alias in sorted(aliases):
+            stack.enter_context(_pragmas(connections[alias]))
+        yield
+
+
+def sentences(random_seed, size=SENTENCE_POOL_SIZE):
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    return [fake.sentence(nb_words=10) for _ in range(size)]
+
+
+def _init_worker(state):
+    _state.update(state)
+
+
+def _pub_date(rng, start, span, u):
+    """Дата поста по доле u: обратная функция экспоненциального роста."""
+    share = math.log1p(u * math.expm1(GROWTH)) / GROWTH
+    day = start + timedelta(days=int(share * span))
+    hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+    return day + timedelta(hours=hour, seconds=rng.randrange(3600))
+
+
+def _text(rng, pool, low, high):
+    return ' '.join(rng.sample(pool, rng.randint(low, high)))
+
+
+def post_chunk(task):
+    """Строки постов и комментариев одной пачки.
+
+    task — (номер пачки, первый индекс, конец, число комментариев).
+    id поста — first_post_id плюс индекс. Дата строится по доле индекса
+    в общем числе постов, так что пачки идут по времени друг за другом
+    и id растут вместе с датой.
+    """
+    index, begin, end, comments = task
+    state = _state
+    rng = random.Random(state['random_seed'] * 1000003 + index)
+    total = state['posts']
+    dates = sorted(
+        _pub_date(rng, state['start'], state['days'],
+                  (begin + rng.random() * (end - begin)) / total)
+        for _ in range(end - begin)
+    )
+    counts = [0] * (end - begin)
+    comment_rows = []
+    adapt = connection.ops.adapt_datetimefield_value
+    for _ in range(comments):
+        position = rng.randrange(end - begin)
+        counts[position] += 1
+        created = min(
+            dates[position] + timedelta(
+                seconds=rng.expovariate(1 / COMMENT_DELAY)),
+            state['now'])
+        comment_rows.append((
+            state['first_post_id'] + begin + position,
+            _skewed(rng, state['user_ids'], COMMENTER_SKEW),
+            _text(rng, state['sentences'], 1, 2),
+            adapt(created),
+        ))
+    post_rows = []
+    for position, pub_date in enumerate(dates):
+        group_id = None
+        if state['group_ids'] and rng.random() >= NO_GROUP_SHARE:
+            group_id = _skewed(rng, state['group_ids'], GROUP_SKEW)
+        post_rows.append((
+            state['first_post_id'] + begin + position,
+            _text(rng, state['sentences'], 1, 6),
+            adapt(pub_date),
+            _skewed(rng, state['user_ids'], AUTHOR_SKEW),
+            group_id,
+            '', '', '', '',
+            counts[position],
+        ))
+    comment_rows.sort(key=lambda row: row[3])
+    return post_rows, comment_rows
+
+
+def _tasks(posts, comments, batch_size):
+    for index, begin in enumerate(range(0, posts, batch_size)):
+        end = min(begin + batch_size, posts)
+        # Комментарии делятся между пачками пропорционально без остатка
+        share = comments * end // posts - comments * begin // posts
+        yield index, begin, end, share
+
+
+def _seed_users(count, fake, batch_size):
+    password = make_password(None)
+    # Номера после последнего id: число строк меньше него, если
+    # пользователей удаляли. Имя, уже занятое вручную, пропускается
+    first = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    for begin in range(0, count, batch_size):
+        User.objects.bulk_create(
+            (User(username=f'user{first + i}', first_name=fake.first_name(),
+                  last_name=fake.last_name(), password=password)
+             for i in range(begin, min(begin + batch_size, count))),
+            ignore_conflicts=True)
+    return list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def _seed_groups(count, fake):
+    first = (Group.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    Group.objects.bulk_create(
+        (Group(title=fake.catch_phrase(), slug=f'group-{first + i}',
+               description=fake.paragraph())
+         for i in range(count)),
+        ignore_conflicts=True)
+    return list(Group.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def _follow_rows(rng, user_ids, count):
+    count = min(count, len(user_ids) * (len(user_ids) - 1))
+    pairs = set()
+    while len(pairs) < count:
+        pair = (rng.choice(user_ids), _skewed(rng, user_ids, FOLLOW_SKEW))
+        if pair[0] != pair[1]:
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+def _seed_posts(pool, processes, state, comments, batch_size, report):
+    post_sql = _insert_sql(Post, POST_COLUMNS)
+    comment_sql = _insert_sql(Comment, COMMENT_COLUMNS)
+    done = 0
+    started = time.monotonic()
+    tasks = list(_tasks(state['posts'], comments, batch_size))
+    # Окнами, чтобы готовые пачки не копились в памяти, пока пишем
+    window = processes * 2
+    for start in range(0, len(tasks), window):
+        for post_rows, comment_rows in pool.imap(
+                post_chunk, tasks[start:start + window]):
+            _write(post_sql, post_rows)
+            _write(comment_sql, comment_rows, Comment)
+            done += len(post_rows)
+            if report is not None:
+                report(done, done / max(time.monotonic() - started, 1e-9))
+
+
+def seed(users=1000, groups=20, posts=100000, follows=10000,
+         comments=50000, random_seed=0, days=3 * 365, processes=None,
+         batch_size=BATCH_SIZE, report=None):
+    """Добавить синтетические данные.
+
+    report(постов, постов в секунду) вызывается после каждой пачки.
+    """
+    rng = random.Random(random_seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    now = timezone.now()
+    processes = processes or os.cpu_count() or 1
+    with loading_pragmas():
+        user_ids = _seed_users(users, fake, batch_size)
+        group_ids = _seed_groups(groups, fake)
+        state = {
+            'random_seed': random_seed,
+            'sentences': sentences(random_seed),
+            'user_ids': user_ids,
+            'group_ids': group_ids,
+            'posts': posts,
+            'first_post_id': (
+                Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1,
+            'start': now - timedelta(days=days),
+            'days': days,
+            'now': now,
+        }
+        # Индекс поиска перестраивается один раз в конце, а не триггером
+        # на каждую строку; после ошибки или Ctrl-C тоже, иначе поиск
+        # остался бы без индекса
+        search.uninstall(connection)
+        try:
+            # Дочерние процессы в базу не ходят, им нужен только
+            # connection.ops, поэтому унаследованное соединение не мешает
+            context = multiprocessing.get_context('fork')
+            with context.Pool(processes, _init_worker, (state,)) as pool:
+                _seed_posts(pool, processes, state, comments, batch_size,
+                            report)
+            _write(_insert_sql(Follow, FOLLOW_COLUMNS),
+                   _follow_rows(rng, user_ids, follows), Follow)
+        finally:
+            search.install(connection)
+        # Ленты — самая большая таблица, её тоже пишем без fsync
+        finalize()
+
+
+def finalize():
+    """Счётчики пользователей и ленты; comment_count уже верный."""
+    stats.rebuild()
+    feed.rebuild()
+    caches[settings.POSTS_CACHE_ALIAS].clear()
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from core.caching import bump
+from core.routers import same_database
+from posts import feed, stats
+from posts.caching import forget_group, group_change_scopes, post_scopes
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@receiver(pre_save, sender=Post)
+def post_before_save(sender, instance, raw=False, **kwargs):
+    # Пост могли перенести в другую группу: запоминаем старые области
+    old = None
+    if instance.pk is not None and not raw:
+        old = (
+            Post.objects.select_related('author', 'group')
+            .filter(pk=instance.pk).first()
+        )
+    instance._old_cache_scopes = post_scopes(old) if old else []
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.increment(instance.author_id, 'posts_count')
+        feed.fan_out(instance)
+    bump(*getattr(instance, '_old_cache_scopes', []),
+         *post_scopes(instance), using=kwargs['using'])
+
+
+@receiver(pre_delete, sender=Post)
+def post_before_delete(sender, instance, **kwargs):
+    # Каскад ищет комментарии в базе поста; если они в своей базе (см.
+    # core.routers), удаляем их сами, пока пост ещё существует
+    if not same_database(Comment, Post):
+        Comment.objects.filter(post_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.increment(instance.author_id, 'posts_count', -1)
+    bump(*post_scopes(instance), using=kwargs['using'])
+
+
+@receiver(pre_save, sender=Group)
+def group_before_save(sender, instance, raw=False, **kwargs):
+    old = None
+    if instance.pk is not None and not raw:
+        old = Group.objects.filter(pk=instance.pk).first()
+    instance._old_cache_scopes = group_change_scopes(old) if old else []
+    instance._old_slug = old.slug if old else None
+
+
+def _forget_group(using, *slugs):
+    # Как и bump: сразу и ещё раз после фиксации, чтобы не осталась
+    # копия, прочитанная до неё
+    slugs = [slug for slug in slugs if slug]
+    forget_group(*slugs)
+    transaction.on_commit(lambda: forget_group(*slugs), using=using)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _forget_group(kwargs['using'], getattr(instance, '_old_slug', None),
+                      instance.slug)
+        bump(*getattr(instance, '_old_cache_scopes', []),
+             *group_change_scopes(instance), using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    _forget_group(kwargs['using'], instance.slug)
+    bump(*group_change_scopes(instance), using=kwargs['using'])
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.increment(instance.user_id, 'following_count')
+        stats.increment(instance.author_id, 'followers_count')
+        feed.backfill(instance.user_id, instance.author_id)
+        bump(f'profile:{instance.user.username}',
+             f'profile:{instance.author.username}', using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.increment(instance.user_id, 'following_count', -1)
+    stats.increment(instance.author_id, 'followers_count', -1)
+    feed.prune(instance.user_id, instance.author_id)
+    bump(f'profile:{instance.user.username}',
+         f'profile:{instance.author.username}', using=kwargs['using'])
+
+
+@receiver(pre_delete, sender=User)
+def user_before_delete(sender, instance, **kwargs):
+    # То же для комментариев и подписок пользователя: обработчики их
+    # удаления ещё читают его имя
+    if not same_database(Comment, User):
+        Comment.objects.filter(author_id=instance.pk).delete()
+    if not same_database(Follow, User):
+        Follow.objects.filter(
+            Q(user_id=instance.pk) | Q(author_id=instance.pk)).delete()
+
+
+def _comment_scopes(comment):
+    scopes = [f'post:{comment.post_id}']
+    if comment.author_id is not None:
+        scopes.append(f'profile:{comment.author.username}')
+    return scopes
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.increment(instance.author_id, 'comments_count')
+        stats.increment_comments(instance.post_id)
+    bump(*_comment_scopes(instance), using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.increment(instance.author_id, 'comments_count', -1)
+    stats.increment_comments(instance.post_id, -1)
+    bump(*_comment_scopes(instance), using=kwargs['using'])
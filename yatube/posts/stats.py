@@ -0,0 +1,161 @@
+"""Денормализованные счётчики пользователей (UserStats) и постов.
+
+Счётчики меняются сигналами на Post, Follow и Comment атомарным
+UPDATE ... SET n = MAX(n + 1, 0). Если строки статистики ещё нет, она
+пересчитывается по данным целиком; расхождения исправляет команда
+rebuild_stats.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from core.routers import same_database
+from posts.models import Comment, Follow, Post, User, UserStats
+
+COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+    'comments_count': (Comment, 'author_id'),
+}
+
+
+def _counts(user_ids):
+    """Счётчики пользователей по данным: {user_id: {поле: число}}."""
+    result = {
+        user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids
+    }
+    for field, (model, column) in COUNTERS.items():
+        rows = (
+            model.objects.filter(**{f'{column}__in': user_ids})
+            .values_list(column)
+            .annotate(n=Count('pk'))
+            .order_by()
+        )
+        for user_id, n in rows:
+            result[user_id][field] = n
+    return result
+
+
+def rebuild_user(user_id):
+    counts = _counts([user_id])[user_id]
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=counts)
+    return stats
+
+
+def stats_for(user):
+    """Статистика пользователя; недостающая строка будет пересчитана."""
+    try:
+        return UserStats.objects.get(user_id=user.pk)
+    except UserStats.DoesNotExist:
+        return rebuild_user(user.pk)
+
+
+def _shifted(field, delta):
+    # Строки из bulk_create (импорт, генерация) сигналов не получали, и
+    # счётчик может быть меньше настоящего: ниже нуля он не опускается
+    return Greatest(F(field) + delta, 0)
+
+
+def increment(user_id, field, delta=1):
+    if user_id is None:
+        return
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: _shifted(field, delta)})
+    # После удаления строку не создаём: пользователь может удаляться
+    # вместе со своей статистикой
+    if not updated and delta > 0:
+        rebuild_user(user_id)
+
+
+def rebuild(chunk_size=1000, changed=None):
+    """Пересчитать статистику всех пользователей.
+
+    Возвращает число исправленных строк; id исправленных пользователей
+    добавляются в множество changed, если оно передано.
+    """
+    fixed = 0
+    user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    last_id = 0
+    while True:
+        chunk = list(user_ids.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            return fixed
+        last_id = chunk[-1]
+        counts = _counts(chunk)
+        existing = UserStats.objects.in_bulk(chunk)
+        to_create, to_update = [], []
+        for user_id, values in counts.items():
+            stats = existing.get(user_id)
+            if stats is None:
+                to_create.append(UserStats(user_id=user_id, **values))
+                continue
+            if any(getattr(stats, f) != v for f, v in values.items()):
+                for field, value in values.items():
+                    setattr(stats, field, value)
+                to_update.append(stats)
+        UserStats.objects.bulk_create(to_create)
+        UserStats.objects.bulk_update(to_update, list(COUNTERS))
+        if changed is not None:
+            changed.update(row.user_id for row in to_create + to_update)
+        fixed += len(to_create) + len(to_update)
+
+
+def increment_comments(post_id, delta=1):
+    if post_id is None:
+        return
+    Post.objects.filter(pk=post_id).update(
+        comment_count=_shifted('comment_count', delta))
+
+
+def rebuild_comment_counts(changed=None):
+    """Исправить Post.comment_count; возвращает число исправленных постов.
+
+    id исправленных постов добавляются в множество changed.
+    """
+    if changed is None:
+        changed = set()
+    if not same_database(Comment, Post):
+        return _rebuild_comment_counts_across(changed)
+    actual = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    wrong = (
+        Post.objects.annotate(actual=Coalesce(Subquery(actual), 0))
+        .exclude(comment_count=F('actual'))
+        .values_list('pk', 'actual')
+    )
+    fixed = 0
+    for post_id, n in wrong:
+        Post.objects.filter(pk=post_id).update(comment_count=n)
+        changed.add(post_id)
+        fixed += 1
+    return fixed
+
+
+def _rebuild_comment_counts_across(changed, chunk_size=1000):
+    """То же, когда комментарии в другой базе: сверка пачками по id."""
+    fixed = 0
+    posts = Post.objects.order_by('pk').values_list('pk', 'comment_count')
+    last_id = 0
+    while True:
+        chunk = list(posts.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            return fixed
+        last_id = chunk[-1][0]
+        actual = dict(
+            Comment.objects.filter(post_id__in=[pk for pk, _ in chunk])
+            .order_by()
+            .values_list('post')
+            .annotate(n=Count('pk'))
+        )
+        for post_id, count in chunk:
+            n = actual.get(post_id, 0)
+            if n != count:
+                Post.objects.filter(pk=post_id).update(comment_count=n)
+                changed.add(post_id)
+                fixed += 1
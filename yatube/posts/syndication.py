@@ -0,0 +1,126 @@
+"""RSS и Atom для главной, групп и авторов.
+
+В ленте только FEED_ITEMS последних постов. Готовый XML кэшируется
+через cache_versioned с теми же областями, что и HTML-страницы, так
+что лента собирается заново только после изменения её постов и
+отдаёт ETag/304 без обращения к базе.
+"""
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from core.caching import cache_versioned
+from posts.caching import (
+    cached_group, group_scopes, index_scopes, profile_scopes,
+)
+from posts.models import Post, User
+
+FEED_ITEMS = 20
+
+
+class PostsFeed(Feed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи на Yatube'
+
+    def link(self):
+        return reverse('posts:posts_basedir_path')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return (
+            self.posts(obj)
+            .select_related('author', 'group')
+            .order_by('-pub_date', '-id')[:FEED_ITEMS]
+        )
+
+    def item_title(self, item):
+        return Truncator(item.text).chars(60)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', kwargs={'post_id': item.pk})
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return cached_group(slug)
+
+    def title(self, obj):
+        return f'Yatube: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', kwargs={'slug': obj.slug})
+
+    def posts(self, obj):
+        return Post.objects.filter(group=obj)
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return self.title(obj)
+
+    def link(self, obj):
+        return reverse('posts:profile', kwargs={'username': obj.username})
+
+    def posts(self, obj):
+        return Post.objects.filter(author=obj)
+
+
+class AtomMixin:
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class PostsAtomFeed(AtomMixin, PostsFeed):
+    pass
+
+
+class GroupAtomFeed(AtomMixin, GroupFeed):
+    def subtitle(self, obj):
+        return obj.description
+
+
+class AuthorAtomFeed(AtomMixin, AuthorFeed):
+    def subtitle(self, obj):
+        return self.title(obj)
+
+
+def _feed_view(feed, scopes):
+    def view(request, **kwargs):
+        response = feed(request, **kwargs)
+        # Last-Modified по дате последнего поста не меняется при правке
+        # поста; его ставит cache_versioned по версии области
+        del response['Last-Modified']
+        return response
+    # Имя входит в ключ кэша, поэтому у каждой ленты своё
+    view.__name__ = type(feed).__name__
+    return cache_versioned(scopes)(view)
+
+
+index_rss = _feed_view(PostsFeed(), index_scopes)
+index_atom = _feed_view(PostsAtomFeed(), index_scopes)
+group_rss = _feed_view(GroupFeed(), group_scopes)
+group_atom = _feed_view(GroupAtomFeed(), group_scopes)
+author_rss = _feed_view(AuthorFeed(), profile_scopes)
+author_atom = _feed_view(AuthorAtomFeed(), profile_scopes)
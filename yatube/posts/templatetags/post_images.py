@@ -0,0 +1,69 @@
+import logging
+
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from sorl.thumbnail import get_thumbnail
+
+from posts.images import (FORMATS, LEGACY_GEOMETRY, LEGACY_OPTIONS,
+                          parse_variants, variant_name)
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+
+def _srcset(post, widths, image_format):
+    return ', '.join(
+        '{} {}w'.format(
+            default_storage.url(variant_name(post.image_key, width,
+                                             image_format)),
+            width,
+        )
+        for width in widths
+    )
+
+
+def _legacy_image(post, css_class):
+    # Старые посты без вариантов: миниатюра sorl, как раньше
+    try:
+        thumbnail = get_thumbnail(post.image, LEGACY_GEOMETRY,
+                                  **LEGACY_OPTIONS)
+    except Exception:
+        logger.exception('Не удалось получить миниатюру поста')
+        return ''
+    return format_html('<img class="{}" src="{}">', css_class, thumbnail.url)
+
+
+@register.simple_tag
+def post_image(post, css_class='card-img my-2', sizes=None):
+    """Картинка поста с srcset/sizes и размерами, без обращения к Pillow."""
+    if not post.image:
+        return ''
+    variants = parse_variants(post)
+    if variants is None:
+        return _legacy_image(post, css_class)
+    widths, formats = variants
+    sizes = sizes or settings.POST_IMAGE_SIZES
+    # Последний формат (JPEG) идёт в <img> для браузеров без WebP
+    fallback = formats[-1]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (FORMATS[image_format][1], _srcset(post, widths, image_format),
+             sizes)
+            for image_format in formats[:-1]
+        ),
+    )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        sources,
+        css_class,
+        default_storage.url(variant_name(post.image_key, widths[-1],
+                                         fallback)),
+        _srcset(post, widths, fallback),
+        sizes,
+        post.image_width,
+        post.image_height,
+    )
@@ -0,0 +1,184 @@
+import re
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date
+
+from core import caching
+from ..models import Comment, Group, Post
+
+
+User = get_user_model()
+
+
+class VersionedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='test-slug',
+            description='Описание',
+        )
+        cls.post = Post.objects.create(
+            text='Первый пост',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_index_served_from_cache(self):
+        """Повторный запрос главной не ходит в базу."""
+        url = reverse('posts:posts_basedir_path')
+        self.guest_client.get(url)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'Первый пост')
+
+    def test_new_post_invalidates_pages(self):
+        """Новый пост сразу виден на главной, в группе и в профиле."""
+        urls = [
+            reverse('posts:posts_basedir_path'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_edit_moves_post_between_groups(self):
+        other = Group.objects.create(
+            title='Другая', slug='other', description='Описание')
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertContains(self.guest_client.get(url), 'Первый пост')
+        self.post.group = other
+        self.post.save()
+        self.assertNotContains(self.guest_client.get(url), 'Первый пост')
+
+    def test_comment_invalidates_detail(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        self.assertContains(self.guest_client.get(url), 'Новый комментарий')
+
+    def test_group_rename_invalidates_post_pages(self):
+        detail = reverse('posts:post_detail',
+                         kwargs={'post_id': self.post.pk})
+        profile = reverse('posts:profile', kwargs={'username': 'auth'})
+        self.assertContains(self.guest_client.get(detail), 'Группа: Группа')
+        self.assertContains(self.guest_client.get(profile), '/test-slug/')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Переименованная'
+        group.slug = 'renamed'
+        group.save()
+        self.assertContains(
+            self.guest_client.get(detail), 'Группа: Переименованная')
+        self.assertContains(self.guest_client.get(profile), '/renamed/')
+
+    def test_conditional_get(self):
+        """Повторный запрос с валидаторами получает 304 без запросов."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.group)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_no_last_modified(self):
+        """Изменение в ту же секунду не даёт 304 по If-Modified-Since."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.guest_client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.group)
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_etag_depends_on_user(self):
+        url = reverse('posts:posts_basedir_path')
+        etag = self.guest_client.get(url)['ETag']
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_is_cached_per_user(self):
+        """Гость и пользователи не получают закэшированные страницы друг
+        друга."""
+        User.objects.create(username='other')
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        client = Client()
+        client.force_login(User.objects.get(username='other'))
+        self.assertContains(client.get(url), 'Пользователь: other')
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Новая запись')
+        self.assertContains(response, 'Войти')
+        author = Client()
+        author.force_login(self.user)
+        response = author.get(url)
+        self.assertContains(response, 'Пользователь: auth')
+        self.assertNotContains(response, 'Подписаться')
+        self.assertContains(response, 'Выгрузить записи')
+        self.assertContains(client.get(url), 'Пользователь: other')
+
+    def test_comment_form_token_follows_new_csrf_cookie(self):
+        """После повторного входа страница поста несёт новый CSRF-токен."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        comment_url = reverse(
+            'posts:add_comment', kwargs={'post_id': self.post.pk})
+        client.get(url)
+        for text in ('Первый комментарий', 'Второй комментарий'):
+            # Новая cookie, как после rotate_token при входе
+            client.cookies[settings.CSRF_COOKIE_NAME] = get_random_string(32)
+            response = client.get(url)
+            token = re.search(
+                r'name="csrfmiddlewaretoken" value="([^"]+)"',
+                response.content.decode()).group(1)
+            client.post(comment_url, {
+                'text': text, 'csrfmiddlewaretoken': token})
+            self.assertTrue(Comment.objects.filter(text=text).exists())
+
+    @override_settings(POSTS_CACHE_TIMEOUT=0)
+    def test_stale_copy_while_other_worker_regenerates(self):
+        """Пока страницу перестраивает другой процесс, отдаём старую."""
+        url = reverse('posts:posts_basedir_path')
+        self.guest_client.get(url)
+        # bulk_create не шлёт сигналов: версия главной не меняется
+        Post.objects.bulk_create([Post(text='Тихий пост', author=self.user)])
+        before = caching.get_stats().get('stale', 0)
+        with mock.patch.object(caching, '_acquire', return_value=False):
+            response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Тихий пост')
+        self.assertEqual(caching.get_stats()['stale'], before + 1)
+        self.assertContains(self.guest_client.get(url), 'Тихий пост')
+
+    @override_settings(POSTS_CACHE_LOCK_WAIT=0)
+    def test_miss_without_lock_renders_after_wait(self):
+        url = reverse('posts:posts_basedir_path')
+        with mock.patch.object(caching, '_acquire', return_value=False):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'Первый пост')
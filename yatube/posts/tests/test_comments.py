@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Post
+from ..views import COMMENTS_DEPTH
+
+
+User = get_user_model()
+
+
+class CommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def comment(self, n):
+        readers = [
+            User.objects.create(username=f'reader{i}') for i in range(n)]
+        return [
+            Comment.objects.create(
+                post=self.post, author=reader, text=f'Комментарий {i}')
+            for i, reader in enumerate(readers)
+        ]
+
+    def test_comment_count_follows_comments(self):
+        comments = self.comment(3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        comments[0].delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_rebuild_fixes_comment_count(self):
+        self.comment(2)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+        self.assertIn('Исправлено счётчиков комментариев: 1', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_detail_shows_first_page_with_authors(self):
+        """Авторы приходят тем же запросом: число запросов не растёт."""
+        self.comment(COMMENTS_DEPTH + 5)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(5):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_DEPTH)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertContains(response, 'Комментарии: 25')
+        self.assertContains(response, 'data-more-comments')
+
+    def test_more_comments_fragment(self):
+        self.comment(COMMENTS_DEPTH + 5)
+        detail = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        cursor = detail.context['comments'].next_cursor
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html/')
+        texts = [comment.text for comment in response.context['comments']]
+        self.assertEqual(texts[0], f'Комментарий {COMMENTS_DEPTH}')
+        self.assertEqual(len(texts), 5)
+        self.assertNotContains(response, 'data-more-comments')
@@ -0,0 +1,99 @@
+import json
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Post
+
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.other = User.objects.create(username='other')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой', author=cls.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'))
+        Post.objects.create(text='Чужой пост', author=cls.other)
+        Comment.objects.create(post=cls.post, author=cls.user, text='Мой')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_jsonl_is_streamed(self):
+        response = self.authorized_client.get(reverse('posts:export'))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        records = [
+            json.loads(line) for line in
+            b''.join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual([record['type'] for record in records],
+                         ['post', 'comment'])
+        self.assertEqual(records[0]['text'], 'Пост с картинкой')
+        self.assertEqual(records[0]['image'], self.post.image.name)
+        self.assertEqual(records[1]['post'], self.post.pk)
+
+    def test_zip_contains_images(self):
+        response = self.authorized_client.get(
+            reverse('posts:export'), {'format': 'zip'})
+        archive = zipfile.ZipFile(
+            BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            archive.read(f'images/{self.post.image.name}'), SMALL_GIF)
+        posts = archive.read('posts.jsonl').decode().splitlines()
+        self.assertEqual(len(posts), 1)
+
+    def test_guest_is_redirected(self):
+        response = Client().get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_command_writes_file(self):
+        path = f'{TEMP_MEDIA_ROOT}/export.jsonl'
+        call_command('export_user', 'auth', '--output', path,
+                     stderr=StringIO())
+        with open(path, encoding='utf-8') as export:
+            self.assertEqual(len(export.readlines()), 2)
+
+    def test_export_imports_back(self):
+        path = f'{TEMP_MEDIA_ROOT}/roundtrip.jsonl'
+        call_command('export_user', 'auth', '--output', path,
+                     stderr=StringIO())
+        Post.objects.filter(author=self.user).delete()
+        out = StringIO()
+        call_command('import_content', path, '--kind', 'auto',
+                     '--checkpoint', f'{path}.checkpoint', stdout=out)
+        self.assertIn('Импортировано: 2, пропущено: 0', out.getvalue())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Пост с картинкой')
+        self.assertEqual(post.comments.get().text, 'Мой')
+        # С определённым видом строки других видов пропускаются
+        out = StringIO()
+        call_command('import_content', path, '--kind', 'comments',
+                     '--checkpoint', f'{path}.comments', stdout=out)
+        self.assertIn('Импортировано: 1, пропущено: 1', out.getvalue())
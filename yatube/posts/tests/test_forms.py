@@ -1,7 +1,21 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from posts.images import (LEGACY_GEOMETRY, LEGACY_OPTIONS,
+                          legacy_thumbnail_file, variant_name)
 from posts.models import Post
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 
@@ -65,3 +79,101 @@ class PostCreateFormTests(TestCase):
             'posts:post_detail', kwargs={'post_id': self.post.id}))
         self.assertNotEqual('text', self.post)
         self.assertEqual(id, self.post.id)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageVariantsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def photo(self):
+        image = Image.new('RGB', (1200, 800), (200, 100, 50))
+        exif = Image.Exif()
+        exif[0x010F] = 'Secret Camera'
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    def test_variants_built_on_save(self):
+        """Варианты готовятся при сохранении формы и без EXIF."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': self.photo()},
+        )
+        post = Post.objects.get(text='С картинкой')
+        self.assertTrue(post.image_key)
+        self.assertEqual(post.image_width, 1440)
+        self.assertEqual(post.image_height, 508)
+        for width in settings.POST_IMAGE_WIDTHS:
+            name = variant_name(post.image_key, width, 'jpeg')
+            with default_storage.open(name) as variant:
+                image = Image.open(variant)
+                self.assertEqual(image.width, width)
+                self.assertFalse(image.getexif())
+
+    def test_page_renders_srcset_without_pillow(self):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': self.photo()},
+        )
+        post = Post.objects.get(text='С картинкой')
+        with mock.patch('PIL.Image.open') as image_open:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        image_open.assert_not_called()
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, 'width="1440" height="508"')
+
+    def test_legacy_thumbnail_name_matches_sorl(self):
+        """Для предзагрузки имя миниатюры считается так же, как в sorl."""
+        post = Post.objects.create(author=self.user, text='Старый пост',
+                                   image=self.photo())
+        thumbnail = get_thumbnail(post.image, LEGACY_GEOMETRY,
+                                  **LEGACY_OPTIONS)
+        self.assertEqual(legacy_thumbnail_file(post.image).key,
+                         thumbnail.key)
+
+    def test_replaced_image_variants_deleted(self):
+        """Замена картинки убирает файлы прежних вариантов."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': self.photo()},
+        )
+        post = Post.objects.get(text='С картинкой')
+        old_names = [
+            variant_name(post.image_key, width, 'jpeg')
+            for width in settings.POST_IMAGE_WIDTHS]
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'С картинкой', 'image': self.photo()},
+        )
+        post.refresh_from_db()
+        for name in old_names:
+            self.assertFalse(default_storage.exists(name))
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertTrue(default_storage.exists(
+                variant_name(post.image_key, width, 'jpeg')))
+
+    def test_building_variants_refreshes_cached_page(self):
+        cache.clear()
+        post = Post.objects.create(author=self.user, text='Старый пост',
+                                   image=self.photo())
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertNotContains(self.authorized_client.get(url), 'srcset=')
+        call_command('build_image_variants', stdout=StringIO())
+        self.assertContains(self.authorized_client.get(url), 'srcset=')
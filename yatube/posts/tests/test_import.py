@@ -0,0 +1,170 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import importing
+from ..importing import import_file
+from ..models import Comment, FeedEntry, Follow, Post, User
+from ..stats import stats_for
+
+
+class ImportContentTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def jsonl(self, name, rows, mode='w'):
+        path = os.path.join(self.directory, name)
+        with open(path, mode, encoding='utf-8') as target:
+            for row in rows:
+                target.write(json.dumps(row, ensure_ascii=False) + '\n')
+        return path
+
+    def csv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='', encoding='utf-8') as target:
+            writer = csv.DictWriter(target, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def run_import(self, path, kind, *args):
+        out = StringIO()
+        call_command('import_content', path, '--kind', kind,
+                     '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_keeps_dates_and_rebuilds_derived_data(self):
+        follows = self.csv('follows.csv', [
+            {'user': 'reader', 'author': 'writer'},
+            {'user': 'reader', 'author': 'reader'},
+        ])
+        self.run_import(follows, 'follows')
+        posts = self.jsonl('posts.jsonl', [
+            {'id': 100, 'text': 'Старый пост', 'author': 'writer',
+             'group': 'archive', 'pub_date': '2015-03-01T10:00:00'},
+            {'id': 101, 'text': 'Ещё пост', 'author': 'writer',
+             'pub_date': '2015-03-02T10:00:00+00:00'},
+            {'id': 102, 'text': 'Третий', 'author': 'other'},
+        ])
+        out = self.run_import(posts, 'posts')
+        self.assertIn('строк/с', out)
+        self.assertIn('Импортировано: 3, пропущено: 0', out)
+        comments = self.csv('comments.csv', [
+            {'post': '100', 'author': 'reader', 'text': 'Первый',
+             'created': '2015-03-01T11:00:00'},
+            {'post': '999', 'author': 'reader', 'text': 'К пропавшему',
+             'created': ''},
+        ])
+        out = self.run_import(comments, 'comments')
+        self.assertIn('Импортировано: 1, пропущено: 1', out)
+
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.pub_date,
+                         datetime(2015, 3, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual(post.group.slug, 'archive')
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(
+            Comment.objects.get().created,
+            datetime(2015, 3, 1, 11, tzinfo=timezone.utc))
+        writer = User.objects.get(username='writer')
+        reader = User.objects.get(username='reader')
+        self.assertFalse(writer.has_usable_password())
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(stats_for(writer).posts_count, 2)
+        self.assertEqual(stats_for(reader).following_count, 1)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=reader).count(), 2)
+
+    def test_resume_from_checkpoint(self):
+        rows = [
+            {'text': f'Пост {i}', 'author': 'writer'} for i in range(3)]
+        path = self.jsonl('posts.jsonl', rows)
+        self.run_import(path, 'posts', '--no-finalize')
+        self.assertTrue(os.path.exists(f'{path}.checkpoint'))
+        # Повторный запуск по тому же файлу ничего не дублирует,
+        # дописанные строки импортируются
+        self.jsonl('posts.jsonl', [{'text': 'Новый', 'author': 'writer'}],
+                   mode='a')
+        out = self.run_import(path, 'posts', '--no-finalize')
+        self.assertIn('Импортировано: 1, пропущено: 0', out)
+        self.assertEqual(Post.objects.count(), 4)
+
+    def test_import_keeps_auto_dates_for_other_saves(self):
+        """Импорт не отключает auto_now_add для остальных сохранений."""
+        path = self.jsonl('posts.jsonl', [
+            {'text': 'Старый', 'author': 'writer',
+             'pub_date': '2015-03-01T10:00:00'},
+        ])
+        saved = []
+
+        def report(rows, rate):
+            saved.append(Post.objects.create(
+                text='Во время импорта',
+                author=User.objects.get(username='writer')))
+
+        import_file(path, 'posts', report=report)
+        self.assertIsNotNone(saved[0].pub_date)
+        self.assertEqual(
+            Post.objects.get(text='Старый').pub_date,
+            datetime(2015, 3, 1, 10, tzinfo=timezone.utc))
+
+    def test_import_updates_cached_pages_without_clearing(self):
+        cache.clear()
+        client = Client()
+        url = reverse('posts:posts_basedir_path')
+        client.get(url)
+        cache.set('unrelated', 'value')
+        path = self.jsonl('posts.jsonl', [
+            {'text': 'Импортированный пост', 'author': 'writer'},
+        ])
+        self.run_import(path, 'posts')
+        self.assertContains(client.get(url), 'Импортированный пост')
+        self.assertContains(
+            client.get(reverse('posts:profile', args=['writer'])),
+            'Импортированный пост')
+        self.assertEqual(cache.get('unrelated'), 'value')
+
+    def crash_import(self, path, when_pending):
+        """Импорт, который падает сразу после записи точки."""
+        write = importing._write_checkpoint
+
+        def crash(*args):
+            write(*args)
+            if (len(args) > 5) == when_pending:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(importing, '_write_checkpoint', crash):
+            with self.assertRaises(KeyboardInterrupt):
+                import_file(path, 'posts', batch_size=2)
+
+    def test_batch_committed_before_checkpoint_is_not_repeated(self):
+        rows = [{'text': f'Пост {i}', 'author': 'writer'} for i in range(3)]
+        path = self.jsonl('posts.jsonl', rows)
+        # Пачка зафиксирована, точка после неё не записана
+        self.crash_import(path, when_pending=False)
+        self.assertEqual(Post.objects.count(), 2)
+        import_file(path, 'posts', batch_size=2)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Пост 0', 'Пост 1', 'Пост 2'])
+
+    def test_batch_lost_before_commit_is_repeated(self):
+        rows = [{'text': f'Пост {i}', 'author': 'writer'} for i in range(3)]
+        path = self.jsonl('posts.jsonl', rows)
+        self.crash_import(path, when_pending=True)
+        self.assertEqual(Post.objects.count(), 0)
+        import_file(path, 'posts', batch_size=2)
+        self.assertEqual(Post.objects.count(), 3)
@@ -1,7 +1,11 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, UserStats
+from ..stats import stats_for
 
 
 User = get_user_model()
@@ -36,3 +40,44 @@ class PostModelTest(TestCase):
         post = PostModelTest.post
         text = post.text
         self.assertEqual(text, 'Тестовая пост')
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами, подписками, комментариями."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.user)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        self.assertEqual(stats_for(self.user).posts_count, 1)
+        self.assertEqual(stats_for(self.user).followers_count, 1)
+        self.assertEqual(stats_for(self.reader).following_count, 1)
+        self.assertEqual(stats_for(self.reader).comments_count, 1)
+        post.delete()
+        self.assertEqual(stats_for(self.user).posts_count, 0)
+        self.assertEqual(stats_for(self.reader).comments_count, 0)
+
+    def test_counters_do_not_go_negative(self):
+        """Строки без сигналов (bulk_create) не уводят счётчики в минус."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        stats_for(self.reader)
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=self.reader, text='Текст')])
+        Comment.objects.filter(post=post).delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(stats_for(self.reader).comments_count, 0)
+
+    def test_rebuild_fixes_drift(self):
+        Post.objects.create(author=self.user, text='Пост')
+        UserStats.objects.filter(user=self.user).update(posts_count=42)
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual(stats_for(self.user).posts_count, 1)
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+        self.assertIn('Исправлено строк статистики: 0', out.getvalue())
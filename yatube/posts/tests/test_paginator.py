@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.paginator import CursorPaginator
+from ..models import Post
+
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='koo')
+        # Одинаковая дата у всех постов: порядок держится на id
+        Post.objects.bulk_create(
+            [
+                Post(text=f'Тестовый пост №{i}', author=cls.user)
+                for i in range(25)
+            ]
+        )
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_walk_forward_and_back(self):
+        """Курсоры проходят все посты вперёд и назад без пропусков."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        pages = [paginator.get_cursor_page(None)]
+        while pages[-1].next_cursor:
+            pages.append(paginator.get_cursor_page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(
+            [post for page in pages for post in page], self.ordered)
+        self.assertIsNone(pages[0].previous_cursor)
+        back = paginator.get_cursor_page(pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        first = paginator.get_cursor_page(back.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertIsNone(first.previous_cursor)
+
+    def test_invalid_cursor_gives_first_page(self):
+        response = self.client.get(
+            reverse('posts:posts_basedir_path') + '?cursor=garbage')
+        self.assertEqual(list(response.context['page_obj']),
+                         self.ordered[:10])
+
+    def test_next_link_rendered(self):
+        response = self.client.get(reverse('posts:posts_basedir_path'))
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?cursor={next_cursor}')
+        response = self.client.get(
+            reverse('posts:posts_basedir_path') + f'?cursor={next_cursor}')
+        self.assertEqual(list(response.context['page_obj']),
+                         self.ordered[10:20])
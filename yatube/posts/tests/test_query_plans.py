@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..urls import urlpatterns
+
+
+User = get_user_model()
+
+# Полный проход по таблице и сортировка во временном B-дереве. Проход
+# по индексу (SCAN ... USING INDEX) допустим: он идёт в нужном порядке
+# и останавливается на LIMIT
+FULL_SCAN = re.compile(
+    r'^SCAN \w+(?!\w| USING (COVERING )?INDEX| VIRTUAL TABLE INDEX)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+# Что неизбежно и проверено вручную
+ALLOWED = {
+    # Результаты поиска упорядочены по рангу, который считается только
+    # для найденных строк: сортировать приходится их
+    ('posts:search', 'USE TEMP B-TREE FOR ORDER BY'),
+    # Форма поста показывает список всех групп
+    ('posts:post_create', 'SCAN posts_group'),
+    ('posts:post_edit', 'SCAN posts_group'),
+}
+# Без ANALYZE SQLite считает таблицы большими и выбирает план как для
+# рабочей базы; данных нужно столько, чтобы страницы были полными
+USERS = 20
+GROUPS = 5
+POSTS = 600
+
+
+class QueryPlanTest(TestCase):
+    """Каждый запрос каждой страницы posts обходится индексами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create в SQLite не проставляет pk, поэтому перечитываем
+        User.objects.bulk_create(
+            User(username=f'user{i}') for i in range(USERS))
+        users = list(User.objects.order_by('pk'))
+        Group.objects.bulk_create(
+            Group(title=f'Группа {i}', slug=f'group-{i}', description='-')
+            for i in range(GROUPS))
+        groups = list(Group.objects.order_by('pk'))
+        Post.objects.bulk_create(
+            Post(text=f'Пост номер {i}', author=users[i % USERS],
+                 group=groups[i % GROUPS])
+            for i in range(POSTS))
+        cls.user = users[0]
+        cls.post = Post.objects.filter(author=cls.user).first()
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=users[i % USERS], text=f'к{i}')
+            for i in range(30))
+        for author in users[1:]:
+            # Через save, чтобы сработали сигналы и заполнились ленты
+            Follow.objects.create(user=cls.user, author=author)
+        cls.kwargs = {
+            'slug': groups[0].slug,
+            'username': users[1].username,
+            'post_id': cls.post.pk,
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def urls(self):
+        for pattern in urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            kwargs = {
+                name: self.kwargs[name]
+                for name in pattern.pattern.converters
+            }
+            name = f'posts:{pattern.name}'
+            yield name, reverse(name, kwargs=kwargs)
+        yield 'posts:search', reverse('posts:search') + '?q=пост'
+
+    def plan_problems(self, name, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        return [
+            detail for detail in details
+            if (FULL_SCAN.search(detail) or TEMP_SORT.search(detail))
+            and (name, detail) not in ALLOWED
+        ]
+
+    def captured(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            page_obj = (response.context or {}).get('page_obj')
+            cursor = getattr(page_obj, 'next_cursor', None)
+            if cursor:
+                # И следующая страница: у неё другое условие WHERE
+                separator = '&' if '?' in url else '?'
+                self.client.get(f'{url}{separator}cursor={cursor}')
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+
+    def test_no_full_scans_or_temp_sorts(self):
+        for name, url in self.urls():
+            for sql in self.captured(url):
+                # В captured_queries параметры уже подставлены
+                problems = self.plan_problems(name, sql, ())
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(problems, [])
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import fts_query, search_posts
+
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.post = Post.objects.create(
+            text='Кот сидит на окне и смотрит на птиц', author=cls.user)
+        Post.objects.create(text='Собака спит', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def found(self, text):
+        return list(search_posts(Post.objects.all(), text))
+
+    def test_index_follows_changes(self):
+        """Индекс обновляют триггеры: и save, и bulk_create, и delete."""
+        self.assertEqual(self.found('птиц'), [self.post])
+        self.post.text = 'Кот ушёл'
+        self.post.save()
+        self.assertEqual(self.found('птиц'), [])
+        Post.objects.bulk_create(
+            [Post(text='Пёстрые птицы', author=self.user)])
+        self.assertEqual(len(self.found('птиц')), 1)
+        Post.objects.filter(text='Пёстрые птицы').delete()
+        self.assertEqual(self.found('птиц'), [])
+
+    def test_query_syntax_is_not_executed(self):
+        self.assertEqual(fts_query('кот OR "собака" (NEAR'),
+                         '"кот" "OR" "собака" "NEAR"*')
+        self.assertEqual(fts_query('   ***  '), '')
+        self.assertEqual(self.found('кот OR собака'), [])
+
+    def test_search_page_highlights_and_escapes(self):
+        Post.objects.create(text='<script>кот</script>', author=self.user)
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'кот'})
+        self.assertContains(response, '<mark>Кот</mark> сидит')
+        self.assertContains(response, '&lt;script&gt;<mark>кот</mark>')
+        self.assertNotContains(response, '<script>кот')
+
+    def test_search_page_cursor_keeps_query(self):
+        Post.objects.bulk_create([
+            Post(text=f'Слон номер {i}', author=self.user) for i in range(15)
+        ])
+        url = reverse('posts:search')
+        response = self.guest_client.get(url, {'q': 'слон'})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertContains(response, f'?q=%D1%81%D0%BB%D0%BE%D0%BD&amp;'
+                                      f'cursor={page.next_cursor}')
+        response = self.guest_client.get(
+            url, {'q': 'слон', 'cursor': page.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(page) & set(second))
+
+    def test_admin_uses_index(self):
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'птиц'})
+        self.assertEqual(list(response.context['cl'].queryset), [self.post])
@@ -0,0 +1,89 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.models import F, Sum
+from django.test import TestCase
+
+from .. import seeding
+from ..models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+from ..search import filter_posts
+
+
+class SeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed', users=30, groups=3, posts=300, comments=120,
+                     follows=60, processes=2, batch_size=64, stdout=StringIO())
+
+    def test_row_counts(self):
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 120)
+        self.assertEqual(Follow.objects.count(), 60)
+
+    def test_derived_data_is_consistent(self):
+        self.assertEqual(
+            Post.objects.aggregate(n=Sum('comment_count'))['n'], 120)
+        self.assertEqual(
+            UserStats.objects.aggregate(n=Sum('posts_count'))['n'], 300)
+        self.assertTrue(FeedEntry.objects.exists())
+        self.assertFalse(
+            Follow.objects.filter(user_id=F('author_id'))
+            .exists())
+        word = Post.objects.first().text.split()[0].strip('.,')
+        self.assertTrue(filter_posts(Post.objects.all(), word).exists())
+
+    def test_comments_follow_their_posts(self):
+        comment = Comment.objects.select_related('post').first()
+        self.assertGreaterEqual(comment.created, comment.post.pub_date)
+
+
+class PostChunkTest(TestCase):
+    def test_chunk_depends_only_on_seed(self):
+        state = {
+            'random_seed': 7,
+            'sentences': ['Раз.', 'Два.', 'Три.', 'Четыре.', 'Пять.',
+                          'Шесть.'],
+            'user_ids': [1, 2, 3],
+            'group_ids': [1],
+            'posts': 100,
+            'first_post_id': 1,
+            'start': seeding.timezone.now(),
+            'days': 10,
+            'now': seeding.timezone.now(),
+        }
+        seeding._init_worker(state)
+        first = seeding.post_chunk((1, 50, 100, 10))
+        self.assertEqual(seeding.post_chunk((1, 50, 100, 10)), first)
+        self.assertNotEqual(seeding.post_chunk((2, 50, 100, 10)), first)
+        posts, comments = first
+        self.assertEqual([row[0] for row in posts], list(range(51, 101)))
+        self.assertEqual(len(comments), 10)
+
+    def test_comments_split_between_chunks(self):
+        tasks = list(seeding._tasks(1000, 333, 64))
+        self.assertEqual(sum(task[3] for task in tasks), 333)
+        self.assertEqual(tasks[-1][2], 1000)
+
+
+class SeedExistingDataTest(TestCase):
+    def test_names_do_not_clash_with_existing_users(self):
+        User.objects.create(username='removed')
+        User.objects.create(username='user3')
+        User.objects.get(username='removed').delete()
+        seeding.seed(users=3, groups=1, posts=10, comments=0, follows=0,
+                     processes=1)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_search_index_restored_after_failure(self):
+        with mock.patch.object(seeding, '_seed_posts',
+                               side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                seeding.seed(users=2, groups=1, posts=10, comments=0,
+                             follows=0, processes=1)
+        Post.objects.create(text='Поиск после сбоя',
+                            author=User.objects.first())
+        self.assertTrue(
+            filter_posts(Post.objects.all(), 'сбоя').exists())
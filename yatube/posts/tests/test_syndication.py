@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Group, Post
+from ..syndication import FEED_ITEMS
+
+
+User = get_user_model()
+
+
+class SyndicationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test-slug', description='Описание')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.user, group=cls.group)
+            for i in range(FEED_ITEMS + 5))
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_feeds_are_limited(self):
+        urls = {
+            reverse('posts:index_rss'): '<item>',
+            reverse('posts:index_atom'): '<entry>',
+            reverse('posts:group_rss', kwargs={'slug': 'test-slug'}):
+                '<item>',
+            reverse('posts:group_atom', kwargs={'slug': 'test-slug'}):
+                '<entry>',
+            reverse('posts:author_rss', kwargs={'username': 'auth'}):
+                '<item>',
+            reverse('posts:author_atom', kwargs={'username': 'auth'}):
+                '<entry>',
+        }
+        for url, item in urls.items():
+            with self.subTest(url=url):
+                content = self.guest_client.get(url).content.decode()
+                self.assertEqual(content.count(item), FEED_ITEMS)
+
+    def test_feed_cached_until_post_changes(self):
+        url = reverse('posts:group_rss', kwargs={'slug': 'test-slug'})
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+            not_modified = self.guest_client.get(
+                url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.group)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Свежий пост')
+
+    def test_unknown_group_is_404(self):
+        response = self.guest_client.get(
+            reverse('posts:group_atom', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
@@ -4,7 +4,7 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 
-from . import views
+from . import syndication, views
 app_name = 'posts'
 
 
@@ -23,6 +23,22 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    # Следующие комментарии поста фрагментом HTML
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
+    # RSS и Atom
+    path('rss/', syndication.index_rss, name='index_rss'),
+    path('atom/', syndication.index_atom, name='index_atom'),
+    path('group/<slug:slug>/rss/', syndication.group_rss, name='group_rss'),
+    path('group/<slug:slug>/atom/',
+         syndication.group_atom, name='group_atom'),
+    path('profile/<str:username>/rss/',
+         syndication.author_rss, name='author_rss'),
+    path('profile/<str:username>/atom/',
+         syndication.author_atom, name='author_atom'),
+    path('search/', views.search, name='search'),
+    # Выгрузка своих записей: ?format=jsonl или ?format=zip
+    path('export/', views.export, name='export'),
     path('follow/', views.follow_index, name='follow_index'),
     path('profile/<str:username>/follow/',
          views.profile_follow, name='profile_follow'
@@ -1,35 +1,66 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from posts.models import Post, Group, User, Follow
+from posts.models import Comment, Post, User, Follow
 from posts.forms import CommentForm, PostForm
+from posts.feed import FEED_ORDERING, feed_posts
+from posts.exporting import FORMATS as EXPORT_FORMATS
+from posts.images import prefetch_images
+from posts.search import highlight, search_posts
+from posts.stats import stats_for
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from core.caching import cache_versioned
+from core.paginator import CursorPaginator
+from core.routers import with_related
+from core.sqlite import run_write
+from urllib.parse import urlencode
+from posts.caching import (
+    cached_group, comments_scopes, detail_scopes, group_scopes, index_scopes,
+    profile_scopes,
+)
 
 DEPTH = 10
+COMMENTS_DEPTH = 20
 
 
-@cache_page(20)
+def paginate(request, post_list, **kwargs):
+    paginator = CursorPaginator(post_list, DEPTH, **kwargs)
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        # Старые ссылки вида ?page=N работают, пока не отключим нумерацию
+        return paginator.get_page(page_number)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+def comments_page(request, post_id):
+    """Порция комментариев поста с авторами, от старых к новым."""
+    # Комментарии могут лежать в другой базе, чем пользователи
+    comments = with_related(Comment.objects.filter(post_id=post_id), 'author')
+    paginator = CursorPaginator(
+        comments, COMMENTS_DEPTH, ordering=('created', 'id'))
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+@cache_versioned(index_scopes)
 def index(request):
     # Одна строка вместо тысячи слов на SQL:
     # в переменную posts будет сохранена выборка из 10 объектов модели Post,
     # отсортированных по полю pub_date по убыванию (от больших
     # значений к меньшим)
     post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, DEPTH)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list)
+    prefetch_images(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_versioned(group_scopes)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = cached_group(slug)
     post_list = Post.objects.filter(group=group).order_by('-pub_date')
-    paginator = Paginator(post_list, DEPTH)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list)
+    prefetch_images(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -37,39 +68,37 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_versioned(profile_scopes)
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
     r = request.user
     author_name = get_object_or_404(User, username=username)
     posts = Post.objects.filter(author=author_name).order_by('-pub_date')
-    paginator = Paginator(posts, DEPTH)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    user_posts_q = Post.objects.filter(author=author_name).count()
-    list1 = Follow.objects.all()
-    if Follow.objects.filter(author=author_name).exists():
-        following = True
-    else:
-        following = False
+    page_obj = paginate(request, posts)
+    # Ключи миниатюр всей страницы одним запросом, а не по одному на тег
+    prefetch_images(page_obj)
+    author_stats = stats_for(author_name)
+    following = r.is_authenticated and Follow.objects.filter(
+        user=r, author=author_name).exists()
     context = {
-        'posts': posts,
-        'user_posts_q': user_posts_q,
+        'user_posts_q': author_stats.posts_count,
+        'author_stats': author_stats,
         'page_obj': page_obj,
         'author_name': author_name,
         'following': following,
-        'list1': list1,
         'r': r,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cache_versioned(detail_scopes)
 def post_detail(request, post_id):
     # Здесь код запроса к модели и создание словаря контекста
     post = get_object_or_404(Post, id=post_id)
     author1 = post.author
-    user_posts_q = Post.objects.filter(author=author1).count()
+    user_posts_q = stats_for(author1).posts_count
     form = CommentForm()
-    comments = post.comments.all()
+    comments = comments_page(request, post_id)
     context = {
         'post': post,
         'user_posts_q': user_posts_q,
@@ -79,6 +108,16 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@cache_versioned(comments_scopes)
+def post_comments(request, post_id):
+    # Фрагмент HTML для кнопки «Показать ещё» на странице поста
+    context = {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST, files=request.FILES or None)
@@ -117,7 +156,8 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        # Мелкие записи идут через очередь писателя, если она включена
+        run_write(Comment, comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -126,38 +166,61 @@ def profile_follow(request, username):
     # Подписаться на автора
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        run_write(Follow, Follow.objects.get_or_create,
+                  user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    run_write(Follow,
+              Follow.objects.filter(user=request.user, author=author).delete)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
-    post_list = Post.objects.all().order_by('-pub_date')
-    new_post_list = []
-    follow_list = []
-    user_list = []
-    followings = Follow.objects.all()
-    for follow in (followings):
-        author_to_follow = follow.author
-        who_follows = follow.user
-        user_list.append(who_follows)
-        follow_list.append(author_to_follow)
-        new_post_list += post_list.filter(author=author_to_follow)
-    paginator = Paginator(new_post_list, DEPTH)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = feed_posts(request.user)
+    page_obj = paginate(request, post_list, ordering=FEED_ORDERING)
+    prefetch_images(page_obj)
     context = {
         'page_obj': page_obj,
-        'follow_list': follow_list,
-        'user_list': user_list,
-
     }
     return render(request, 'posts/follow.html', context)
+
+
+@login_required
+def export(request):
+    # Выгрузка своих постов и комментариев; ответ отдаётся потоком
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'jsonl'
+    generate, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        generate(request.user), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="yatube-{request.user.pk}.{export_format}"')
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        post_list = search_posts(
+            Post.objects.select_related('author', 'group'), query)
+        # Сначала самые релевантные: rank в FTS5 тем меньше, чем лучше
+        paginator = CursorPaginator(
+            post_list, DEPTH, ordering=('search_rank', 'id'))
+        page_obj = paginator.get_cursor_page(request.GET.get('cursor'))
+        for post in page_obj:
+            post.highlighted = highlight(post.search_snippet)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        # Ссылки на соседние страницы сохраняют запрос
+        'cursor_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,50 @@ CACHES = {
     }
 }
 
+# На сервере с несколькими процессами кэш держим в общей памяти:
+# так все процессы видят одни и те же страницы и сбросы версий.
+# Перед общим кэшем стоит маленький кэш процесса для горячих ключей
+if os.environ.get('YATUBE_CACHE_FILE'):
+    CACHES = {
+        'shared': {
+            'BACKEND': 'core.cache_backends.shared_memory.SharedMemoryCache',
+            'LOCATION': os.environ['YATUBE_CACHE_FILE'],
+            'OPTIONS': {
+                'MAX_BYTES': 64 * 1024 * 1024,
+            },
+        },
+        'default': {
+            'BACKEND': 'core.cache_backends.layered.LayeredCache',
+            'OPTIONS': {
+                'L2': 'shared',
+                'L1_MAX_ENTRIES': 500,
+                'SYNC_INTERVAL': 0.5,
+            },
+        },
+    }
+
+# Вызовы каждого кэша замеряет посредник: время для Server-Timing и
+# попадания для метрик (core.cache_backends.instrumented)
+CACHES = {
+    alias: {
+        'BACKEND': 'core.cache_backends.instrumented.InstrumentedCache',
+        'LOCATION': alias,
+        'OPTIONS': {'CACHE': params},
+    }
+    for alias, params in CACHES.items()
+}
+
+# Кэш страниц постов: ключи версионные и сбрасываются сигналами моделей,
+# поэтому страницы можно хранить долго
+POSTS_CACHE_ALIAS = 'default'
+POSTS_CACHE_TIMEOUT = 60 * 60 * 4
+# Сколько ещё хранить устаревшую страницу, пока один процесс её
+# перестраивает, а остальные отдают старую копию
+POSTS_CACHE_STALE_TIMEOUT = 60 * 10
+# Блокировка перестройки страницы и сколько её ждут остальные процессы
+POSTS_CACHE_LOCK_TIMEOUT = 10
+POSTS_CACHE_LOCK_WAIT = 2
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -48,6 +93,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -58,13 +104,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы в замер попало всё остальное
+    'core.instrumentation.ServerTimingMiddleware',
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # После сессий: срок чтения из основной базы хранится в сессии
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.querystats.QueryStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -72,7 +124,8 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга
+        'BACKEND': 'core.instrumentation.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,9 +151,85 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами: не открываем файл и не
+        # выполняем SQLITE_PRAGMAS на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_DB_CONN_MAX_AGE', '60')),
+        'OPTIONS': {
+            # Сколько секунд ждать блокировку записи другого процесса
+            'timeout': 20,
+        },
+    }
+}
+
+# Комментарии, подписки и сессии пишутся часто и мелкими порциями; с
+# YATUBE_SPLIT_DATABASES=1 у каждой из этих таблиц свой файл SQLite и
+# своя блокировка записи (core.routers). Существующие строки переносит
+# команда split_databases
+SPLIT_DATABASES = {
+    'comments': ['posts.comment'],
+    'follows': ['posts.follow'],
+    'sessions': ['sessions.session'],
+}
+for _alias in SPLIT_DATABASES:
+    DATABASES[_alias] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, f'{_alias}.sqlite3'))
+DATABASE_ROUTERS = ['core.routers.ModelRouter']
+DATABASE_MODELS = {}
+if os.environ.get('YATUBE_SPLIT_DATABASES') == '1':
+    DATABASE_MODELS = {
+        label: alias
+        for alias, labels in SPLIT_DATABASES.items()
+        for label in labels
     }
+
+# Тяжёлые страницы читаются из реплик default (core.replicas). Реплику
+# SQLite обновляет команда sync_replica; включает чтение из неё
+# YATUBE_REPLICA_DATABASE=<путь к файлу>
+DATABASES['replica'] = dict(
+    DATABASES['default'],
+    NAME=os.environ.get(
+        'YATUBE_REPLICA_DATABASE', os.path.join(BASE_DIR, 'replica.sqlite3')),
+    TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS.insert(0, 'core.routers.ReplicaRouter')
+REPLICA_DATABASES = (
+    ['replica'] if os.environ.get('YATUBE_REPLICA_DATABASE') else [])
+REPLICA_VIEWS = {
+    'posts:posts_basedir_path',
+    'posts:group_list',
+    'posts:profile',
+    'posts:follow_index',
+}
+# Представления-записи, которые отвечают на GET (подписка и отписка);
+# после любого успешного не-GET запроса пользователь и так читает из
+# основной базы
+REPLICA_PIN_VIEWS = {'posts:profile_follow', 'posts:profile_unfollow'}
+# Сколько секунд после своей записи пользователь читает из основной базы
+REPLICA_PIN_SECONDS = 30
+# Реплика, отставшая сильнее, не используется
+REPLICA_MAX_LAG = 60
+# Период отметок команды replica_heartbeat
+REPLICA_HEARTBEAT_INTERVAL = 5
+REPLICA_LAG_CHECK_INTERVAL = 1
+
+# Настройки каждого нового соединения SQLite (core.sqlite). В журнале
+# WAL читатели не ждут писателя, а synchronous=NORMAL не делает fsync
+# на каждую фиксацию (после сбоя питания теряются последние фиксации,
+# но база остаётся целой)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': '-20000',
+    'mmap_size': str(256 * 1024 * 1024),
 }
 
+# Комментарии и подписки пишет один поток процесса, пачками в общей
+# транзакции (core.sqlite.WriteQueue)
+WRITE_QUEUE_ENABLED = os.environ.get('YATUBE_WRITE_QUEUE') == '1'
+WRITE_QUEUE_MAX_BATCH = 64
+WRITE_QUEUE_TIMEOUT = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -143,6 +272,52 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 STATIC_URL = '/static/'
 
+# Варианты картинок постов: ширины, пропорции кадра ленты и качество
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_QUALITY = 80
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+# Ключи миниатюр sorl: LRU процесса перед индексом в файле SQLite
+THUMBNAIL_KVSTORE = 'core.kvstore.KVStore'
+THUMBNAIL_KVSTORE_PATH = os.environ.get(
+    'YATUBE_THUMBNAIL_KVSTORE_PATH',
+    os.path.join(BASE_DIR, 'thumbnails.sqlite3'))
+THUMBNAIL_KVSTORE_LRU_SIZE = 2000
+# Сколько секунд процесс помнит, что миниатюры нет: её может построить
+# другой процесс
+THUMBNAIL_KVSTORE_MISS_TTL = 5
+THUMBNAIL_BACKEND = 'core.instrumentation.ThumbnailBackend'
+
+# Доля запросов, для которых время SQL, шаблонов, кэша и миниатюр
+# отдаётся в заголовке Server-Timing и пишется в лог
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_SERVER_TIMING_SAMPLE_RATE', '0.1'))
+
+# Статистика SQL по отпечаткам (core.querystats): запросы дольше порога
+# пишутся в лог, файлы процессов складываются в общий каталог
+QUERY_STATS_SLOW_MS = 100
+QUERY_STATS_MAX_FINGERPRINTS = 500
+QUERY_STATS_FLUSH_INTERVAL = 10
+QUERY_STATS_DIR = os.environ.get(
+    'YATUBE_QUERY_STATS_DIR',
+    os.path.join(tempfile.gettempdir(), 'yatube-querystats'))
+
+# Метрики Prometheus (core.metrics): файлы процессов в общем каталоге,
+# /metrics складывает их
+METRICS_DIR = os.environ.get(
+    'YATUBE_METRICS_DIR',
+    os.path.join(tempfile.gettempdir(), 'yatube-metrics'))
+# Кому отдавать /metrics. Если токен задан, только запросам с заголовком
+# Authorization: Bearer <токен> (за обратным прокси задавайте токен).
+# Без токена — прямым запросам с адресов из списка
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
+# Тесты пишут метрики, статистику SQL и индекс миниатюр во временный
+# каталог
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 LOGIN_URL = 'users:login'
@@ -151,3 +326,9 @@ LOGIN_REDIRECT_URL = 'posts:posts_basedir_path'
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+# Лента подписок: при большем числе подписчиков посты автора
+# не раскладываются по лентам, а читаются напрямую
+FEED_FANOUT_LIMIT = 1000
+# Сколько последних постов автора кладём в ленту при подписке
+FEED_BACKFILL_SIZE = 500